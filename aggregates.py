@@ -0,0 +1,107 @@
+import numpy as np
+
+
+class RunningStats:
+    """Mergeable count, sum, mean, variance, min and max (with the label of the max)
+
+    Partial statistics of separate chunks combine exactly with merge(), using
+    Chan et al.'s pairwise update for the variance, so a pass over chunked or
+    sharded data yields the same result as one pass over all of it.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.mean = 0.0
+        self.m2 = 0.0  # Sum of squared deviations from the mean
+        self.min = np.inf
+        self.max = -np.inf
+        self.argmax = None
+
+    @classmethod
+    def of(cls, values, labels=None):
+        """Statistics of one chunk; labels (e.g. timestamps) identify where the max occurred"""
+        stats = cls()
+        values = np.asarray(values, dtype=np.float64)
+        observed = ~np.isnan(values)
+        if not observed.all():
+            values = values[observed]
+            labels = None if labels is None else np.asarray(labels)[observed]
+        if len(values) == 0:
+            return stats
+
+        stats.count = len(values)
+        stats.total = float(values.sum())
+        stats.mean = stats.total / stats.count
+        stats.m2 = float(((values - stats.mean) ** 2).sum())
+        stats.min = float(values.min())
+        i = int(values.argmax())
+        stats.max = float(values[i])
+        stats.argmax = None if labels is None else labels[i]
+        return stats
+
+    def merge(self, other):
+        """Fold another partial into this one and return self"""
+        if other.count == 0:
+            return self
+        if self.count == 0:
+            self.__dict__.update(other.__dict__)
+            return self
+
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.m2 += other.m2 + delta ** 2 * self.count * other.count / count
+        self.mean += delta * other.count / count
+        self.total += other.total
+        self.count = count
+        self.min = min(self.min, other.min)
+        if other.max > self.max:
+            self.max, self.argmax = other.max, other.argmax
+        return self
+
+    def update(self, values, labels=None):
+        return self.merge(RunningStats.of(values, labels))
+
+    def variance(self, ddof=1):
+        return self.m2 / (self.count - ddof) if self.count > ddof else np.nan
+
+    def std(self, ddof=1):
+        return np.sqrt(self.variance(ddof))
+
+
+class GroupedSums:
+    """Mergeable per-key sums and counts for small non-negative integer keys (hour, day number)"""
+
+    def __init__(self):
+        self.sums = np.zeros(0)
+        self.counts = np.zeros(0, dtype=np.int64)
+
+    def update(self, keys, values):
+        keys = np.asarray(keys, dtype=np.int64)
+        values = np.asarray(values, dtype=np.float64)
+        observed = ~np.isnan(values)
+        size = max(len(self.sums), int(keys.max()) + 1 if len(keys) else 0)
+        self._grow(size)
+        self.sums += np.bincount(keys[observed], weights=values[observed], minlength=size)
+        self.counts += np.bincount(keys[observed], minlength=size)
+        return self
+
+    def merge(self, other):
+        self._grow(len(other.sums))
+        self.sums[:len(other.sums)] += other.sums
+        self.counts[:len(other.counts)] += other.counts
+        return self
+
+    def _grow(self, size):
+        if size > len(self.sums):
+            self.sums = np.concatenate([self.sums, np.zeros(size - len(self.sums))])
+            self.counts = np.concatenate([self.counts, np.zeros(size - len(self.counts), dtype=np.int64)])
+
+    def keys(self):
+        """Keys that received at least one value"""
+        return np.flatnonzero(self.counts)
+
+    def means(self):
+        """Mean per observed key, aligned with keys()"""
+        observed = self.counts > 0
+        return self.sums[observed] / self.counts[observed]
@@ -0,0 +1,444 @@
+import os
+import json
+import math
+import pickle
+import argparse
+import functools
+from bisect import bisect_left, bisect_right
+import numpy as np
+import pandas as pd
+
+from config import ALERT_CONFIG, TARIFF_CONFIG
+from budget import BudgetPlan
+from calendar_features import DAY_NS, HOUR_NS
+from data_processor import load_readings
+
+RULE_KINDS = ('threshold', 'ratio', 'rate_of_change', 'budget_burn')
+WINDOWS = ('reading', 'hour', 'day', 'month', 'all')
+HOWS = ('last', 'sum', 'mean', 'min', 'max')
+OPS = ('>', '>=', '<', '<=')
+NAN = float('nan')
+
+
+class Rule:
+    """One declared alert condition
+
+    kind is one of
+      - threshold: the <how> of metric over the current window  op  threshold
+      - ratio: sum of metric / sum of denominator over the window  op  threshold
+      - rate_of_change: mean of metric in the current window relative to the
+        mean of the completed windows, minus 1  op  threshold
+      - budget_burn: cost over the window as a fraction of budget (₹)  op  threshold;
+        without a budget, the site's BudgetPlan amount for the 'day' or 'month'
+    Windows follow the reading timestamps: 'reading', 'hour', 'day',
+    'month' or 'all'. Besides the reading columns, metric can be 'cost' or
+    'peak_cost' (₹ at the tariff rates). site None applies the rule to every
+    site. message is formatted with value, threshold and site.
+    """
+
+    def __init__(self, name, kind, op, threshold, metric='total_consumption', window='day', how='last',
+                 denominator=None, budget=None, site=None, severity='warning', message=None, throttle=None):
+        if kind not in RULE_KINDS:
+            raise ValueError(f"Unknown rule kind '{kind}'")
+        if op not in OPS:
+            raise ValueError(f"Unknown operator '{op}'")
+        if window not in WINDOWS:
+            raise ValueError(f"Unknown window '{window}'")
+        if how not in HOWS:
+            raise ValueError(f"Unknown aggregation '{how}'")
+        if kind == 'ratio' and denominator is None:
+            raise ValueError(f"Ratio rule '{name}' needs a denominator")
+        if kind == 'budget_burn' and budget is not None and not budget > 0:
+            raise ValueError(f"Budget rule '{name}' needs a positive budget")
+        if kind == 'budget_burn' and budget is None and window not in ('day', 'month'):
+            raise ValueError(f"Budget rule '{name}' takes its budget from the plan only over a 'day' or 'month' window")
+
+        self.name = name
+        self.kind = kind
+        self.op = op
+        self.threshold = threshold
+        self.window = window
+        self.site = site
+        self.severity = severity
+        self.message = message or f'{name}: {{value:.3g}} {op} {{threshold:.3g}}'
+        self.throttle = throttle  # Seconds; None uses the engine's default
+
+        # Every rule reduces to a series of running values compared with a limit;
+        # rules over the same series share it whatever their thresholds
+        self.scale = 1.0
+        if kind == 'threshold':
+            self.series = (how, metric, window)
+        elif kind == 'ratio':
+            self.series = ('ratio', metric, window, denominator)
+        elif kind == 'rate_of_change':
+            self.series = ('change', metric, window)
+        elif budget is not None:
+            self.series = ('sum', 'cost', window)
+            self.scale = 1.0 / budget
+        else:
+            self.series = ('burn', 'cost', window)  # Fraction of the plan's budget, per site and window
+        self.limit = threshold / self.scale
+
+    @classmethod
+    def from_dict(cls, spec):
+        return cls(**spec)
+
+    def format(self, value, site):
+        return self.message.format(value=value, threshold=self.threshold, site=site)
+
+
+class _Window:
+    """Running aggregates of one metric over the current window, and the mean of completed windows"""
+
+    __slots__ = ('metric', 'window', 'id', 'sum', 'count', 'min', 'max', 'last', 'history_sum', 'history_count')
+
+    def __init__(self, metric, window):
+        self.metric = metric
+        self.window = window
+        self.id = None
+        self.sum = 0.0
+        self.count = 0
+        self.min = math.inf
+        self.max = -math.inf
+        self.last = NAN
+        self.history_sum = 0.0  # Sum of the means of completed windows
+        self.history_count = 0
+
+    def update(self, window_id, value):
+        if window_id != self.id:
+            if self.count:
+                self.history_sum += self.sum / self.count
+                self.history_count += 1
+            self.id = window_id
+            self.sum, self.count, self.min, self.max = 0.0, 0, math.inf, -math.inf
+        if value == value:  # Not NaN
+            self.sum += value
+            self.count += 1
+            self.last = value
+            if value < self.min:
+                self.min = value
+            if value > self.max:
+                self.max = value
+
+
+class _Series:
+    """Running value of one aggregate with the limits of every rule on it, sorted per operator
+
+    The rules firing for a value are a prefix ('>', '>=') or suffix ('<',
+    '<=') of the sorted limits, found by one bisection; only the rules whose
+    state changed since the last reading are touched.
+    """
+
+    def __init__(self, key, windows, budget=None):
+        self.key = key
+        self.windows = windows
+        self.budget = budget  # (window, window id) -> budget (₹) of the site, for 'burn' series
+        self._budget = (None, NAN)  # Budget of the current window
+        self.value = NAN
+        self.limits = {op: [] for op in OPS}
+        self.rules = {op: [] for op in OPS}
+        self.fired = dict.fromkeys(OPS, 0)
+
+    def add(self, rule):
+        pairs = sorted(zip(self.limits[rule.op] + [rule.limit], self.rules[rule.op] + [rule]), key=lambda p: p[0])
+        self.limits[rule.op] = [limit for limit, _ in pairs]
+        self.rules[rule.op] = [r for _, r in pairs]
+        self.fired[rule.op] = 0  # Re-evaluated on the next reading
+
+    def compute(self):
+        kind = self.key[0]
+        window = self.windows[0]
+        if kind == 'last':
+            return window.last if window.count else NAN
+        if kind == 'sum':
+            return window.sum
+        if kind == 'mean':
+            return window.sum / window.count if window.count else NAN
+        if kind == 'min':
+            return window.min if window.count else NAN
+        if kind == 'max':
+            return window.max if window.count else NAN
+        if kind == 'ratio':
+            denominator = self.windows[1].sum
+            return window.sum / denominator if denominator > 0 else NAN
+        if kind == 'burn':
+            if self._budget[0] != window.id:
+                self._budget = (window.id, self.budget(window.window, window.id))
+            budget = self._budget[1]
+            return window.sum / budget if budget > 0 else NAN
+        # change: current mean relative to the mean of completed windows
+        if not (window.count and window.history_count):
+            return NAN
+        baseline = window.history_sum / window.history_count
+        return (window.sum / window.count) / baseline - 1 if baseline > 0 else NAN
+
+    def _firing(self, op, value):
+        limits = self.limits[op]
+        if value != value:
+            return 0
+        if op == '>':
+            return bisect_left(limits, value)
+        if op == '>=':
+            return bisect_right(limits, value)
+        if op == '<':
+            return len(limits) - bisect_right(limits, value)
+        return len(limits) - bisect_left(limits, value)
+
+    def evaluate(self):
+        """Rules that started firing with the current value"""
+        value = self.value = self.compute()
+        started = []
+        for op in OPS:
+            rules = self.rules[op]
+            if not rules:
+                continue
+            n, fired = self._firing(op, value), self.fired[op]
+            if n > fired:
+                started += rules[fired:n] if op in ('>', '>=') else rules[len(rules) - n:len(rules) - fired]
+            self.fired[op] = n
+        return started
+
+    def active(self):
+        """Rules firing at the current value"""
+        active = []
+        for op in OPS:
+            rules, n = self.rules[op], self.fired[op]
+            active += rules[:n] if op in ('>', '>=') else rules[len(rules) - n:]
+        return active
+
+
+class _SiteState:
+    def __init__(self, budget=None):
+        self.budget = budget
+        self.windows = {}  # (metric, window) -> _Window
+        self.series = {}  # series key -> _Series
+        self.last_timestamp = None
+        self.day = None
+        self.month = None
+        self.needs_cost = False
+
+    def add(self, rule):
+        key = rule.series
+        if key not in self.series:
+            metrics = (key[1], key[3]) if key[0] == 'ratio' else (key[1],)
+            windows = tuple(self.windows.setdefault((m, key[2]), _Window(m, key[2])) for m in metrics)
+            self.needs_cost |= any(m in ('cost', 'peak_cost') for m in metrics)
+            self.series[key] = _Series(key, windows, self.budget)
+        self.series[key].add(rule)
+
+
+class JsonlAlertSink:
+    """Alerts appended as JSON lines to a local file"""
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+
+    def write(self, alert):
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(alert) + '\n')
+
+    def recent(self, n=50, site=None):
+        """The last n alerts (of one site, or all), newest first"""
+        if not os.path.exists(self.path):
+            return []
+        with open(self.path, 'r') as f:
+            alerts = [json.loads(line) for line in f if line.strip()]
+        if site is not None:
+            alerts = [alert for alert in alerts if alert['site'] == site]
+        return alerts[::-1][:n]
+
+
+class AlertEngine:
+    """Evaluates declared alert rules incrementally as readings arrive
+
+    Rules are compiled per site into shared running aggregates: a reading
+    updates each (metric, window) aggregate of its site once and re-bisects
+    each distinct series, so its cost does not grow with the number of
+    thresholds declared on a series. An alert is raised when a rule starts
+    firing (not again while it keeps firing), at most once per throttle
+    interval per rule and site, and written to the sink. Budget rules without
+    a budget of their own check the plan's budget of each site and month.
+    """
+
+    def __init__(self, rules=(), sink=None, config=None, plan=None):
+        self.config = config if config is not None else ALERT_CONFIG
+        self.sink = sink
+        self.plan = plan if plan is not None else BudgetPlan()
+        self.rules = []
+        self._sites = {}
+        self._last_sent = {}  # (rule name, site) -> timestamp (ns) of its last alert
+        self.suppressed = 0
+        self._peak_start, self._peak_end = TARIFF_CONFIG['peak_hours']
+        self._peak_rate = TARIFF_CONFIG['peak_rate'] / 1000  # ₹ per Wh
+        self._offpeak_rate = TARIFF_CONFIG['offpeak_rate'] / 1000
+        for rule in rules:
+            self.add_rule(rule)
+
+    @classmethod
+    def from_config(cls, config=None, sink=None, plan=None):
+        config = config if config is not None else ALERT_CONFIG
+        return cls([Rule.from_dict(spec) for spec in config['rules']], sink=sink, config=config, plan=plan)
+
+    def add_rule(self, rule):
+        if isinstance(rule, dict):
+            rule = Rule.from_dict(rule)
+        self.rules.append(rule)
+        for site, state in self._sites.items():
+            if rule.site is None or rule.site == site:
+                state.add(rule)
+        return rule
+
+    def _site(self, site):
+        state = self._sites.get(site)
+        if state is None:
+            state = self._sites[site] = _SiteState(functools.partial(self._budget, site))
+            for rule in self.rules:
+                if rule.site is None or rule.site == site:
+                    state.add(rule)
+        return state
+
+    def _budget(self, site, window, window_id):
+        """Budget (₹) of a site over one day or month window"""
+        if window == 'month':
+            return self.plan.monthly(site, str(np.datetime64(window_id, 'M')))
+        return self.plan.between(site, window_id, window_id)
+
+    def push(self, site, timestamp, values):
+        """Fold one reading of a site in and return the alerts it raised
+
+        timestamp is int nanoseconds or anything pd.Timestamp accepts; values
+        maps metric names to numbers. Readings not newer than the site's last
+        one are ignored, so replaying a history is safe.
+        """
+        ns = timestamp if isinstance(timestamp, int) else pd.Timestamp(timestamp).value
+        state = self._site(site)
+        if state.last_timestamp is not None and ns <= state.last_timestamp:
+            return []
+        state.last_timestamp = ns
+
+        day = ns // DAY_NS
+        if day != state.day:
+            state.day = day
+            state.month = int(np.datetime64(day, 'D').astype('datetime64[M]').astype(np.int64))
+        window_ids = {'reading': ns, 'hour': ns // HOUR_NS, 'day': day, 'month': state.month, 'all': 0}
+
+        if state.needs_cost:
+            is_peak = self._peak_start <= (ns - day * DAY_NS) // HOUR_NS < self._peak_end
+            cost = values.get('total_consumption', NAN) * (self._peak_rate if is_peak else self._offpeak_rate)
+            values = dict(values, cost=cost, peak_cost=cost if is_peak else 0.0)
+
+        for window in state.windows.values():
+            window.update(window_ids[window.window], values.get(window.metric, NAN))
+
+        alerts = []
+        for series in state.series.values():
+            for rule in series.evaluate():
+                alert = self._raise(rule, site, ns, series.value)
+                if alert is not None:
+                    alerts.append(alert)
+        return alerts
+
+    def _raise(self, rule, site, ns, value):
+        key = (rule.name, site)
+        throttle = rule.throttle if rule.throttle is not None else self.config['throttle_seconds']
+        last = self._last_sent.get(key)
+        if last is not None and ns - last < throttle * 10 ** 9:
+            self.suppressed += 1
+            return None
+        self._last_sent[key] = ns
+
+        alert = self._alert(rule, site, ns, value)
+        if self.sink is not None:
+            self.sink.write(alert)
+        return alert
+
+    def _alert(self, rule, site, ns, value):
+        value = value * rule.scale
+        return {
+            'rule': rule.name,
+            'site': site,
+            'timestamp': pd.Timestamp(ns).isoformat(),
+            'severity': rule.severity,
+            'value': value,
+            'threshold': rule.threshold,
+            'message': rule.format(value, site)
+        }
+
+    def push_frame(self, df, site=None):
+        """Push every reading of a time-ordered frame; sites come from the site column unless given"""
+        site_column = self.config['site_column']
+        if site is None and site_column in df.columns:
+            alerts = []
+            for site_name, site_df in df.groupby(site_column, sort=False):
+                alerts += self.push_frame(site_df.sort_values('timestamp'), str(site_name))
+            return alerts
+        site = site if site is not None else self.config['default_site']
+
+        metrics = {window.metric for window in self._site(site).windows.values()}
+        metrics = ({'total_consumption'} | metrics) - {'cost', 'peak_cost'}
+        columns = {m: df[m].to_numpy(dtype=np.float64).tolist() for m in metrics if m in df.columns}
+        timestamps = pd.to_datetime(df['timestamp']).to_numpy().astype('datetime64[ns]').astype(np.int64).tolist()
+
+        alerts = []
+        names = list(columns)
+        for i, ns in enumerate(timestamps):
+            alerts += self.push(site, ns, {name: columns[name][i] for name in names})
+        return alerts
+
+    def active(self, site=None):
+        """Alerts for every rule firing at the latest reading (of one site, or all)"""
+        sites = [site] if site is not None else list(self._sites)
+        alerts = []
+        for name in sites:
+            state = self._sites.get(name)
+            if state is None or state.last_timestamp is None:
+                continue
+            for series in state.series.values():
+                for rule in series.active():
+                    alerts.append(self._alert(rule, name, state.last_timestamp, series.value))
+        return alerts
+
+    def save(self, path):
+        """Persist the rules and running aggregates (not the sink), replaced atomically"""
+        sink, self.sink = self.sink, None
+        try:
+            tmp_path = f'{path}.tmp'
+            with open(tmp_path, 'wb') as f:
+                pickle.dump(self, f)
+            os.replace(tmp_path, path)
+        finally:
+            self.sink = sink
+
+    @classmethod
+    def load(cls, path, sink=None):
+        """Engine saved at path, or None if there is none"""
+        if not os.path.exists(path):
+            return None
+        with open(path, 'rb') as f:
+            engine = pickle.load(f)
+        engine.sink = sink
+        return engine
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Evaluate alert rules against readings that arrived since the last run")
+    parser.add_argument('--data-folder', default=ALERT_CONFIG['data_folder'])
+    args = parser.parse_args()
+
+    sink = JsonlAlertSink(ALERT_CONFIG['sink_path'])
+    engine = AlertEngine.load(ALERT_CONFIG['state_path'], sink=sink)
+    if engine is not None:
+        engine.plan = BudgetPlan()  # Budgets edited in BUDGET_CONFIG apply from the next reading
+    readings = load_readings(args.data_folder)
+    if engine is None or [vars(r) for r in engine.rules] != [vars(r) for r in AlertEngine.from_config().rules]:
+        # New or changed rules: build the aggregates from the history without alerting on it
+        engine = AlertEngine.from_config()
+        engine.push_frame(readings)
+        engine.sink = sink
+        raised = []
+    else:
+        raised = engine.push_frame(readings)
+    os.makedirs(os.path.dirname(ALERT_CONFIG['state_path']), exist_ok=True)
+    engine.save(ALERT_CONFIG['state_path'])
+    print(f"Raised {len(raised)} alert(s), {engine.suppressed} throttled in total")
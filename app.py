@@ -7,7 +7,17 @@ from datetime import datetime, timedelta
 import plotly.express as px
 from recommendations import RecommendationEngine
 from dashboard import DashboardComponents
+from forecast_service import ForecastStore
+from backtesting import AccuracyMonitor
+from data_layer import DataLayer
+from figure_cache import FigureCache
+from shared_dataset import SharedDataset
+from timeseries_store import TimeSeriesStore
+from budget import BudgetTracker
+from instrumentation import TRACER, traced
+from config import BUDGET_CONFIG, DATA_LAYER_CONFIG, FORECAST_CONFIG, INSTRUMENTATION_CONFIG, TARIFF_CONFIG
 import os
+import uuid
 import json
 import plotly.graph_objects as go
 
@@ -21,43 +31,64 @@ def initialize_session_state():
         st.session_state.username = "test_user"
     if 'selected_date_range' not in st.session_state:
         st.session_state.selected_date_range = '1W'  # Default to 1 week
+    if 'session_key' not in st.session_state:
+        st.session_state.session_key = uuid.uuid4().hex
 
-@st.cache_data
+@st.cache_resource
+def get_shared_dataset():
+    """Readings shared by every session as memory-mapped, read-only columns"""
+    return SharedDataset()
+
+@traced()
 def load_data():
-    """Load and cache multiple JSON files from energy_data folder"""
+    """Return a view of the shared readings, re-mapping them when the data files change"""
     try:
-        data_folder = 'synthetic_data'
-        if not os.path.exists(data_folder):
-            st.error(f"Data folder '{data_folder}' not found!")
+        dataset = get_shared_dataset()
+        if not os.path.exists(dataset.data_folder):
+            st.error(f"Data folder '{dataset.data_folder}' not found!")
             return pd.DataFrame()
 
-        json_files = [f for f in os.listdir(data_folder) 
-                     if f.startswith('data_') and f.endswith('.json')]
-        
-        if not json_files:
+        dataset.refresh()
+        df = dataset.frame()
+        if df.empty:
             st.warning("No energy data files found!")
-            return pd.DataFrame()
-
-        all_data = []
-        for file in json_files:
-            try:
-                file_path = os.path.join(data_folder, file)
-                with open(file_path, 'r') as f:
-                    data = json.load(f)
-                    all_data.append(pd.json_normalize(data))
-            except Exception as e:
-                st.error(f"Error loading {file}: {str(e)}")
-                continue
-        
-        df = pd.concat(all_data, ignore_index=True) if all_data else pd.DataFrame()
-        if not df.empty:
-            df['timestamp'] = pd.to_datetime(df['timestamp'])
         return df
     
     except Exception as e:
         st.error(f"Error loading data: {str(e)}")
         return pd.DataFrame()
 
+@st.cache_resource
+def get_forecast_store():
+    """Shared handle on the forecasts written by the batch scoring job"""
+    return ForecastStore(FORECAST_CONFIG['store_dir'])
+
+@st.cache_resource
+def get_accuracy_monitor():
+    """Shared handle on the forecast error series written by backtesting.py"""
+    return AccuracyMonitor(forecast_store=get_forecast_store())
+
+@st.cache_resource
+def get_data_layer():
+    """Thread pool shared by all sessions for computing dashboard panels"""
+    return DataLayer()
+
+@st.cache_resource
+def get_figure_cache():
+    """Serialized figures shared by all sessions, so each is built once per data version"""
+    return FigureCache()
+
+@st.cache_resource
+def get_timeseries_store():
+    """On-disk history for the long-range charts, filled by timeseries_store.py"""
+    return TimeSeriesStore()
+
+@st.cache_resource
+def get_budget_tracker():
+    """Per-site cost ledgers shared by all sessions, extended with new readings as they load"""
+    return BudgetTracker(BUDGET_CONFIG['path'])
+
+@traced()
 def filter_data(df, date_range):
     """Filter data based on selected date range"""
     end_date = df['timestamp'].max()
@@ -70,9 +101,27 @@ def filter_data(df, date_range):
     else:  # All time
         return df
     
-    return df[df['timestamp'].between(start_date, end_date)]
+    # Readings are time-ordered, so slicing keeps a view of the shared data
+    return df.iloc[df['timestamp'].searchsorted(start_date):]
+
+def select_zoom_range(df):
+    """Sidebar zoom window; long charts re-query it at full resolution"""
+    start, end = df['timestamp'].min().date(), df['timestamp'].max().date()
+    if start == end:
+        return None
+    selected = st.sidebar.slider("Zoom", min_value=start, max_value=end, value=(start, end))
+    if selected == (start, end):
+        return None
+    return pd.Timestamp(selected[0]), pd.Timestamp(selected[1]) + pd.Timedelta(days=1)
 
-def display_overview(dashboard, metrics):
+def display_metrics(slots, metrics):
+    """Fill the summary metric placeholders"""
+    slots[0].metric("Total Consumption", f"{metrics['total_consumption']/1000:.2f} kWh")
+    slots[1].metric("Daily Average", f"{metrics['avg_daily_consumption']/1000:.2f} kWh")
+    slots[2].metric("Total Cost", f"₹{metrics['total_cost']:.2f}")
+    slots[3].metric("Avg Occupancy", f"{metrics['avg_occupancy']:.1f}%")
+
+def display_overview(dashboard):
     """Display overview page components"""
     st.title("Energy Management Dashboard")
     
@@ -85,49 +134,68 @@ def display_overview(dashboard, metrics):
     if date_range != st.session_state.selected_date_range:
         st.session_state.selected_date_range = date_range
         st.experimental_rerun()
+    zoom = select_zoom_range(dashboard.df)
 
-    # Summary metrics
-    col1, col2, col3, col4 = st.columns(4)
-    with col1:
-        st.metric("Total Consumption", f"{metrics['total_consumption']/1000:.2f} kWh")
-    with col2:
-        st.metric("Daily Average", f"{metrics['avg_daily_consumption']/1000:.2f} kWh")
-    with col3:
-        st.metric("Total Cost", f"₹{metrics['total_cost']:.2f}")
-    with col4:
-        st.metric("Avg Occupancy", f"{metrics['avg_occupancy']:.1f}%")
+    # Start every panel at once; each is drawn as soon as it is ready. Leaving the
+    # page (Streamlit stops this script) cancels whatever has not finished.
+    with get_data_layer().start(st.session_state.session_key) as run:
+        run.submit('metrics', dashboard.get_summary_metrics)
+        run.submit('timeline', dashboard.create_consumption_timeline, x_range=zoom)
+        run.submit('heatmap', dashboard.create_heatmap)
+        run.submit('floor', dashboard.create_floor_comparison)
+        run.submit('occupancy', dashboard.create_occupancy_correlation)
 
-    # Consumption Timeline
-    st.subheader("Energy Consumption Over Time")
-    timeline_fig = dashboard.create_consumption_timeline()
-    st.plotly_chart(timeline_fig, use_container_width=True)
+        # Summary metrics
+        metric_slots = [column.empty() for column in st.columns(4)]
 
-    # Two-column layout for additional charts
-    col1, col2 = st.columns(2)
-    
-    with col1:
-        st.subheader("Hourly Consumption Patterns")
-        heatmap_fig = dashboard.create_heatmap()
-        st.plotly_chart(heatmap_fig, use_container_width=True)
-        
-        st.subheader("Floor-wise Consumption")
-        floor_fig = dashboard.create_floor_comparison()
-        st.plotly_chart(floor_fig, use_container_width=True)
+        # Consumption Timeline
+        st.subheader("Energy Consumption Over Time")
+        slots = {'timeline': st.empty()}
 
-    with col2:
-        st.subheader("Equipment Breakdown")
-        equipment_data = {
-            'HVAC': 45,
-            'Lighting': 25,
-            'Equipment': 20,
-            'Others': 10
-        }
-        equipment_fig = dashboard.create_equipment_breakdown(equipment_data)
-        st.plotly_chart(equipment_fig, use_container_width=True)
+        # Two-column layout for additional charts
+        col1, col2 = st.columns(2)
         
-        st.subheader("Occupancy vs Consumption")
-        occupancy_fig = dashboard.create_occupancy_correlation()
-        st.plotly_chart(occupancy_fig, use_container_width=True)
+        with col1:
+            st.subheader("Hourly Consumption Patterns")
+            slots['heatmap'] = st.empty()
+            
+            st.subheader("Floor-wise Consumption")
+            slots['floor'] = st.empty()
+
+        with col2:
+            st.subheader("Equipment Breakdown")
+            equipment_data = {
+                'HVAC': 45,
+                'Lighting': 25,
+                'Equipment': 20,
+                'Others': 10
+            }
+            equipment_fig = dashboard.create_equipment_breakdown(equipment_data)
+            st.plotly_chart(equipment_fig, use_container_width=True)
+            
+            st.subheader("Occupancy vs Consumption")
+            slots['occupancy'] = st.empty()
+
+        for slot in slots.values():
+            slot.caption("Loading...")
+
+        pending = ['metrics', *slots]
+        timeout = DATA_LAYER_CONFIG['panel_timeout_seconds']
+        try:
+            for name, future in run.as_completed(timeout=timeout):
+                pending.remove(name)
+                if future.exception() is not None:
+                    target = metric_slots[0] if name == 'metrics' else slots[name]
+                    target.error(f"Error computing {name}: {future.exception()}")
+                elif name == 'metrics':
+                    display_metrics(metric_slots, future.result())
+                else:
+                    slots[name].plotly_chart(future.result(), use_container_width=True)
+        except TimeoutError:
+            # Leaving the block cancels the stragglers; the rest of the page still renders
+            for name in pending:
+                target = metric_slots[0] if name == 'metrics' else slots[name]
+                target.error(f"Computing {name} took longer than {timeout} s")
 
 def display_detailed_analysis(dashboard):
     """Display detailed analysis page with time frame selection"""
@@ -136,14 +204,23 @@ def display_detailed_analysis(dashboard):
     # Sidebar Time Frame Selector
     st.sidebar.subheader("Select Time Frame")
     time_frame = st.sidebar.selectbox("Time Frame", ["Daily", "Weekly", "Monthly", "Yearly"])
+    zoom = select_zoom_range(dashboard.df)
 
     # Energy Efficiency Score and Consumption Prediction
     col1, col2 = st.columns(2)
     with col1:
         st.subheader("Energy Efficiency Score")
         score, metrics = dashboard.calculate_efficiency_score()  # Calculate real score
-        efficiency_fig = dashboard.create_efficiency_gauge(score)
+        history = dashboard.efficiency_scores()
+        efficiency_fig = dashboard.create_efficiency_gauge(score, reference=round(history.mean(), 1) if len(history) else None)
         st.plotly_chart(efficiency_fig, use_container_width=True)
+        if len(history):
+            p10, p50, p90 = history.percentiles()
+            st.caption(f"Scores at or above {history.percentile_of(score):.0f}% of readings in this period "
+                       f"(10th/50th/90th percentile: {p10:.0f} / {p50:.0f} / {p90:.0f})")
+        
+        with st.expander("View Efficiency Score Trend"):
+            st.plotly_chart(dashboard.plot_efficiency_trend(), use_container_width=True)
         
         # Add metrics breakdown in an expander
         with st.expander("View Efficiency Metrics Breakdown"):
@@ -159,12 +236,35 @@ def display_detailed_analysis(dashboard):
     
     with col2:
         st.subheader("Consumption Prediction")
-        # Sample data for prediction plot
-        dates = dashboard.df['timestamp'].tail(30)
-        actual = dashboard.df['total_consumption'].tail(30)
-        predicted = actual * 1.1  # Example prediction data
-        prediction_fig = dashboard.create_prediction_plot(actual, predicted, dates)
-        st.plotly_chart(prediction_fig, use_container_width=True)
+        # Forecasts are produced offline by forecast_service.py, the page only reads them
+        forecast = get_forecast_store().latest(FORECAST_CONFIG['default_site'])
+        if forecast is None:
+            st.info("No forecast available yet. Run `python forecast_service.py --once` to score one.")
+        else:
+            dates = dashboard.df['timestamp'].tail(30)
+            actual = dashboard.df['total_consumption'].tail(30)
+            prediction_fig = dashboard.create_prediction_plot(
+                actual,
+                forecast['values'],
+                dates,
+                forecast_dates=pd.to_datetime(forecast['timestamps'])
+            )
+            st.plotly_chart(prediction_fig, use_container_width=True)
+            st.caption(f"Forecast generated at {forecast['generated_at']} "
+                       f"from readings up to {forecast['last_observed']}")
+
+        # Live error of past forecasts, scored by backtesting.py as actuals arrive
+        monitor = get_accuracy_monitor()
+        errors = monitor.errors(FORECAST_CONFIG['default_site'])
+        if not errors.empty:
+            status = monitor.status(FORECAST_CONFIG['default_site'])
+            st.plotly_chart(
+                dashboard.create_error_plot(errors, status['backtest_mae']),
+                use_container_width=True
+            )
+            if status['drifted']:
+                st.warning(f"Forecast error has drifted to {status['ratio']:.1f}x the backtest error; "
+                           "the model is due for retraining.")
 
     # Additional Visualizations Based on Selected Time Frame
     st.subheader("Energy Consumption Over Time")
@@ -172,7 +272,7 @@ def display_detailed_analysis(dashboard):
     st.plotly_chart(consumption_trend_fig, use_container_width=True)
 
     st.subheader("Peak Consumption Times")
-    peak_consumption_fig = dashboard.plot_peak_consumption(time_frame=time_frame)
+    peak_consumption_fig = dashboard.plot_peak_consumption(time_frame=time_frame, x_range=zoom)
     st.plotly_chart(peak_consumption_fig, use_container_width=True)
 
     st.subheader("Monthly Trends") #Placeholder until we decide how to handle seasonal trend
@@ -274,7 +374,7 @@ def display_cost_analysis(dashboard):
     
     # Calculate date range based on selection
     if analysis_period == "All Data":
-        filtered_df = dashboard.df.copy()
+        filtered_df = dashboard.df
         start_date = min_date
         end_date = max_date
     else:
@@ -305,7 +405,7 @@ def display_cost_analysis(dashboard):
         filtered_df = dashboard.df[
             (dashboard.df['timestamp'] >= start_date) & 
             (dashboard.df['timestamp'] <= end_date)
-        ].copy()
+        ]
 
     if filtered_df.empty:
         st.warning("No data available for the selected time period.")
@@ -316,20 +416,18 @@ def display_cost_analysis(dashboard):
     st.write(f"Selected range: from {start_date} to {end_date}")
     st.write(f"Number of records: {len(filtered_df)}")
 
-    # Rest of the code remains the same...
-    # Calculate basic metrics
-    total_consumption = filtered_df['total_consumption'].sum() / 1000  # Convert to kWh
+    # Range totals are prefix-index lookups, so moving the range costs nothing extra
+    totals = dashboard.range_totals(start_date, end_date, floors=True)
+    total_consumption = totals['total_consumption'] / 1000  # Convert to kWh
     days_in_period = (end_date - start_date).days or 1
     
     # Calculate peak and off-peak consumption
-    filtered_df['hour'] = filtered_df['timestamp'].dt.hour
-    peak_mask = (filtered_df['hour'] >= 9) & (filtered_df['hour'] < 18)
-    peak_consumption = filtered_df[peak_mask]['total_consumption'].sum() / 1000
-    off_peak_consumption = filtered_df[~peak_mask]['total_consumption'].sum() / 1000
+    peak_consumption = totals['peak_consumption'] / 1000
+    off_peak_consumption = totals['offpeak_consumption'] / 1000
     
     # Calculate costs
-    peak_rate = 8  # ₹8 per kWh during peak hours
-    off_peak_rate = 6  # ₹6 per kWh during off-peak hours
+    peak_rate = TARIFF_CONFIG['peak_rate']  # ₹ per kWh during peak hours
+    off_peak_rate = TARIFF_CONFIG['offpeak_rate']  # ₹ per kWh during off-peak hours
     
     peak_cost = peak_consumption * peak_rate
     off_peak_cost = off_peak_consumption * off_peak_rate
@@ -363,36 +461,21 @@ def display_cost_analysis(dashboard):
         )
 
     # Detailed Analysis Tabs
-    tabs = st.tabs(["Cost Breakdown", "Usage Analysis", "Efficiency Metrics"])
+    tabs = st.tabs(["Cost Breakdown", "Usage Analysis", "Efficiency Metrics", "Budget"])
     
     with tabs[0]:
         st.subheader("Cost Breakdown Analysis")
         
         # Floor-wise breakdown
         floor_costs = {}
-        for _, row in filtered_df.iterrows():
-            hour = row['timestamp'].hour
-            rate = peak_rate if 9 <= hour < 18 else off_peak_rate
-            
-            for floor_data in row['floor_data']:
-                floor_name = floor_data['floor']
-                if floor_name not in floor_costs:
-                    floor_costs[floor_name] = {
-                        'consumption': 0,
-                        'peak_consumption': 0,
-                        'off_peak_consumption': 0,
-                        'total_cost': 0
-                    }
-                
-                consumption = floor_data['total_floor_consumption'] / 1000  # Convert to kWh
-                floor_costs[floor_name]['consumption'] += consumption
-                
-                if 9 <= hour < 18:
-                    floor_costs[floor_name]['peak_consumption'] += consumption
-                else:
-                    floor_costs[floor_name]['off_peak_consumption'] += consumption
-                
-                floor_costs[floor_name]['total_cost'] += consumption * rate
+        for floor_name, (consumption, peak) in totals['floors'].items():
+            consumption, peak = consumption / 1000, peak / 1000  # Convert to kWh
+            floor_costs[floor_name] = {
+                'consumption': consumption,
+                'peak_consumption': peak,
+                'off_peak_consumption': consumption - peak,
+                'total_cost': peak * peak_rate + (consumption - peak) * off_peak_rate
+            }
         
         # Create DataFrame for floor-wise costs
         floor_df = pd.DataFrame([
@@ -497,6 +580,72 @@ def display_cost_analysis(dashboard):
                 help="Average cost per kilowatt-hour"
             )
 
+    with tabs[3]:
+        st.subheader("Budget vs Actual")
+        tracker = dashboard.budget_tracker()
+        budget = tracker.budget(dashboard.site, start_date, end_date)
+        
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.metric("Budget", f"₹{budget:,.2f}", help="Monthly budgets spread over the selected days")
+        with col2:
+            st.metric("Budget Utilization", f"{tracker.utilization(dashboard.site, start_date, end_date):.1%}")
+        with col3:
+            st.metric("Variance", f"₹{tracker.variance(dashboard.site, start_date, end_date):,.2f}",
+                      help="Budget left over; negative when overspent")
+        
+        st.plotly_chart(dashboard.plot_budget_vs_actual(start_date, end_date), use_container_width=True)
+        if len(tracker.sites()) > 1:
+            st.dataframe(tracker.summary(start=start_date, end=end_date), use_container_width=True)
+
+        st.subheader("Alerts")
+        for alert in dashboard.get_cost_alerts():
+            st.warning(alert)
+        recent = dashboard.recent_alerts()
+        if recent:
+            st.dataframe(pd.DataFrame(recent)[['timestamp', 'severity', 'rule', 'message']],
+                         use_container_width=True)
+        else:
+            st.caption("No alerts raised yet; run `python alerting.py` as new readings arrive.")
+
+def display_performance():
+    """Admin view of the recorded tracing spans: which calls and panels the time goes to"""
+    st.title("Performance")
+    recording = st.checkbox("Record spans", value=TRACER.enabled,
+                            help="Applies to every session served by this process")
+    if recording != TRACER.enabled:
+        TRACER.enable(recording)
+
+    spans = TRACER.load(limit=INSTRUMENTATION_CONFIG['page_span_limit'])
+    if spans.empty:
+        st.info("No spans recorded yet. Turn on recording (or start the app with EMS_TRACING=1) and use the dashboard.")
+        return
+
+    summary = TRACER.summarize(spans)
+    st.subheader("Slowest Calls (95th percentile wall time)")
+    fig = px.bar(summary.head(15).reset_index(), x='p95_ms', y='name', orientation='h',
+                 hover_data=['calls', 'cpu_ms', 'peak_mb', 'rows'])
+    fig.update_layout(yaxis={'categoryorder': 'total ascending'}, yaxis_title=None, xaxis_title="ms")
+    st.plotly_chart(fig, use_container_width=True)
+    st.dataframe(summary.round(2), use_container_width=True)
+
+    st.subheader("Page Renders")
+    roots = spans[spans['parent_id'] == ''].sort_values('start', ascending=False)
+    if roots.empty:
+        return
+    selected = st.selectbox(
+        "Render",
+        roots.index,
+        format_func=lambda i: (f"{roots.at[i, 'start']:%Y-%m-%d %H:%M:%S} · "
+                               f"{roots.at[i, 'attributes'].get('page', roots.at[i, 'name'])} · "
+                               f"{roots.at[i, 'wall_ms']:.0f} ms")
+    )
+    trace = spans[spans['trace_id'] == roots.at[selected, 'trace_id']].sort_values('start')
+    fig = px.timeline(trace, x_start='start', x_end='end', y='name', color='cpu_ms',
+                      hover_data=['wall_ms', 'cpu_ms', 'peak_mb', 'rows', 'error'])
+    fig.update_yaxes(autorange='reversed', title=None)
+    st.plotly_chart(fig, use_container_width=True)
+
 def main():
     st.set_page_config(
         page_title="Energy Management Dashboard",
@@ -513,13 +662,22 @@ def main():
     # Role-based page access
     user_role = 'admin'  # Default role for testing
     available_pages = {
-        "admin": ["Overview", "Detailed Analysis", "Recommendations", "Cost Analysis"],
+        "admin": ["Overview", "Detailed Analysis", "Recommendations", "Cost Analysis", "Performance"],
         "manager": ["Overview", "Detailed Analysis", "Recommendations"],
         "user": ["Overview", "Recommendations"]
     }
     
     page = st.sidebar.radio("Select Page", available_pages.get(user_role, ["Overview"]))
+    if page == "Performance":
+        display_performance()
+        return
 
+    # One trace per render, with the calls made for the page nested under it
+    with TRACER.span('render', page=page):
+        render_page(page)
+
+def render_page(page):
+    """Load the readings and draw one dashboard page"""
     # Load and filter data
     df = load_data()
     if df.empty:
@@ -527,17 +685,35 @@ def main():
         return
 
     filtered_df = filter_data(df, st.session_state.selected_date_range)
-    dashboard = DashboardComponents(filtered_df)
-    recommendations = RecommendationEngine(filtered_df)
+    store = get_timeseries_store()
+    store.refresh()
+    budget = get_budget_tracker()
+    budget.ingest(df)  # Only readings newer than the ledgers are folded in
+    dashboard = DashboardComponents(
+        filtered_df,
+        figure_cache=get_figure_cache(),
+        store=store if len(store) else None,  # Only once the store has been filled
+        prefix=get_shared_dataset().prefix_index(),
+        efficiency=get_shared_dataset().efficiency_scores(),
+        budget=budget,
+        baseline=get_shared_dataset().baseline_model(),
+        source_version=get_shared_dataset().version
+    )
     
+    # Panels still computing for a page the user has left are dropped
+    if page != "Overview":
+        get_data_layer().cancel(st.session_state.session_key)
+
     # Page routing
     if page == "Overview":
-        display_overview(dashboard, dashboard.get_summary_metrics())
+        display_overview(dashboard)
     
     elif page == "Detailed Analysis":
         display_detailed_analysis(dashboard)
     
     elif page == "Recommendations":
+        # Only this page needs the recommendation engine
+        recommendations = RecommendationEngine(filtered_df, baseline=dashboard.baseline)
         display_recommendations(dashboard, recommendations)
     
     elif page == "Cost Analysis":
@@ -0,0 +1,313 @@
+import os
+import json
+import argparse
+import multiprocessing
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import pandas as pd
+
+from config import BACKTEST_CONFIG, FORECAST_CONFIG, MODEL_CONFIG, TRAINING_CONFIG
+from data_processor import load_readings
+from forecast_service import ForecastStore
+from lstm_export import EXPORT_FILE, NumpyLSTMRunner
+from statistical_forecaster import FORECASTERS
+from training_orchestrator import checkpoint_path, read_trained_through, series_frames
+
+
+def rolling_origins(n_readings, horizon, n_origins, step, min_history):
+    """Positions of the forecast origins, the last one leaving a full horizon of actuals"""
+    last = n_readings - horizon
+    origins = np.arange(last, min_history - 1, -step)[:n_origins]
+    return origins[::-1]
+
+
+def _init_worker(threads):
+    """Bound the native thread pools of each backtest worker"""
+    os.environ['OMP_NUM_THREADS'] = str(threads)
+    os.environ['TF_NUM_INTRAOP_THREADS'] = str(threads)
+    os.environ['TF_NUM_INTEROP_THREADS'] = '1'
+    os.environ.setdefault('TF_CPP_MIN_LOG_LEVEL', '2')
+
+
+def _statistical_backtest(kind, frame, origins, horizon):
+    """Refit a statistical forecaster at every origin, all origins in one vectorized fit"""
+    cls = FORECASTERS[kind]
+    window = min(cls().config['fit_window'], int(origins[0]))
+    windows = [frame.iloc[o - window:o] for o in origins]
+    models = cls.fit_batch(windows)
+    return np.stack([model.forecast(w, horizon) for model, w in zip(models, windows)])
+
+
+def _lstm_backtest(path, frame, origins, horizon, target_idx):
+    """Run the site's current LSTM from every origin, batching the origins through each step"""
+    exported = os.path.join(path, EXPORT_FILE)
+    if os.path.exists(exported):
+        model = NumpyLSTMRunner(exported)
+        forward = model._forward
+    elif os.path.exists(path):
+        from lstm_model import EnergyLSTM
+        model = EnergyLSTM.load(path)
+        forward = lambda X: model.model.predict(X, verbose=0)
+    else:
+        return None
+
+    scaled = model.scaler.transform(frame.to_numpy(dtype=float))
+    windows = np.stack([scaled[o - model.sequence_length:o] for o in origins])
+    steps = []
+    for _ in range(horizon):
+        pred = forward(windows)
+        steps.append(pred)
+        windows = np.concatenate([windows[:, 1:], pred[:, None, :]], axis=1)
+
+    predictions = np.stack(steps, axis=1)  # (origins, horizon, features)
+    n_features = predictions.shape[-1]
+    predictions = model.scaler.inverse_transform(predictions.reshape(-1, n_features))
+    return predictions.reshape(len(origins), horizon, n_features)[:, :, target_idx]
+
+
+def _backtest_site(site, frame, kind, horizon, config, checkpoint_dir):
+    """Rolling-origin backtest of one site's forecaster (runs inside a worker process)"""
+    target = FORECAST_CONFIG['target']
+    min_history = max(2 * horizon, MODEL_CONFIG['sequence_length'])
+    trained_through = None
+    if kind == 'lstm':
+        # The checkpoint is not refit per origin, so only readings it was not trained on can be forecast
+        path = checkpoint_path(checkpoint_dir, site)
+        trained_through = read_trained_through(path)
+        if trained_through is None:
+            return None
+        min_history = max(min_history, int(frame.index.searchsorted(trained_through, side='right')))
+    origins = rolling_origins(len(frame), horizon, config['n_origins'], config['origin_step'], min_history)
+    if len(origins) == 0:
+        return None
+
+    if kind == 'lstm':
+        predictions = _lstm_backtest(path, frame, origins, horizon, list(frame.columns).index(target))
+    elif kind in FORECASTERS:
+        predictions = _statistical_backtest(kind, frame, origins, horizon)
+    else:
+        # The global model is shared across sites and monitored through its live error only
+        return None
+    if predictions is None:
+        return None
+
+    y = frame[target].to_numpy(dtype=float)
+    actual = np.stack([y[o:o + horizon] for o in origins])
+    baseline = _statistical_backtest('seasonal_naive', frame, origins, horizon)
+    error = predictions - actual
+
+    return {
+        'site': site,
+        'model': kind,
+        'origins': [frame.index[o - 1].isoformat() for o in origins],
+        'horizon_mae': np.abs(error).mean(axis=0).tolist(),
+        'mae': float(np.abs(error).mean()),
+        'rmse': float(np.sqrt((error ** 2).mean())),
+        'baseline_mae': float(np.abs(baseline - actual).mean()),
+        'trained_through': trained_through.isoformat() if trained_through is not None else None,
+        'finished_at': datetime.now().isoformat()
+    }
+
+
+def _forecast_errors(forecast, actuals):
+    """Score one stored forecast run against the actuals observed at its timestamps"""
+    timestamps = pd.to_datetime(forecast['timestamps'])
+    actual = actuals.reindex(timestamps).to_numpy(dtype=float)
+    predicted = np.asarray(forecast['values'], dtype=float)
+    observed = ~np.isnan(actual)
+    if not observed.any():
+        return None
+
+    error = predicted[observed] - actual[observed]
+    denominator = np.abs(actual[observed])
+    return {
+        'generated_at': forecast['generated_at'],
+        'last_observed': forecast['last_observed'],
+        'model': forecast['model'],
+        'n': int(observed.sum()),
+        'mae': float(np.abs(error).mean()),
+        'rmse': float(np.sqrt((error ** 2).mean())),
+        'mape': float(np.mean(np.abs(error)[denominator > 0] / denominator[denominator > 0]))
+        if (denominator > 0).any() else None
+    }
+
+
+class AccuracyMonitor:
+    """Rolling-origin backtests and live forecast error per site
+
+    Live error is computed incrementally: each stored forecast run is scored
+    once, as soon as actuals cover its whole horizon, and appended to the
+    site's error series. A site is flagged for retraining when its recent
+    live MAE drifts above the MAE of its latest backtest.
+    """
+
+    def __init__(self, config=None, forecast_config=None, forecast_store=None):
+        self.config = config if config is not None else BACKTEST_CONFIG
+        self.forecast_config = forecast_config if forecast_config is not None else FORECAST_CONFIG
+        self.forecast_store = forecast_store if forecast_store is not None else ForecastStore(
+            self.forecast_config['store_dir']
+        )
+        self.store_dir = self.config['store_dir']
+        self.backtest_dir = os.path.join(self.store_dir, 'backtest')
+        os.makedirs(self.backtest_dir, exist_ok=True)
+        self._state_path = os.path.join(self.store_dir, 'state.json')
+        self._state = self._load_state()
+
+    def _load_state(self):
+        if os.path.exists(self._state_path):
+            with open(self._state_path, 'r') as f:
+                return json.load(f)
+        return {}
+
+    def _save_state(self):
+        tmp_path = f'{self._state_path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self._state, f)
+        os.replace(tmp_path, self._state_path)
+
+    def _errors_path(self, site):
+        return os.path.join(self.store_dir, f'{site}.jsonl')
+
+    def _backtest_path(self, site):
+        return os.path.join(self.backtest_dir, f'{site}.json')
+
+    def model_kind(self, site):
+        """Forecaster the forecasting service uses for a site"""
+        return self.forecast_config['site_models'].get(site, self.forecast_config['default_model'])
+
+    def run_backtests(self, frames):
+        """Backtest every site in parallel and store the results"""
+        horizon = self.forecast_config['horizon']
+        max_workers = self.config['max_workers'] or os.cpu_count() or 1
+        results = {}
+
+        with ProcessPoolExecutor(
+            max_workers=min(max_workers, len(frames)) or 1,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker,
+            initargs=(1,)
+        ) as executor:
+            futures = {
+                executor.submit(
+                    _backtest_site, site, frame, self.model_kind(site), horizon,
+                    self.config, TRAINING_CONFIG['checkpoint_dir']
+                ): site
+                for site, frame in frames.items()
+            }
+            for future in as_completed(futures):
+                result = future.result()
+                if result is None:
+                    continue
+                path = self._backtest_path(result['site'])
+                with open(f'{path}.tmp', 'w') as f:
+                    json.dump(result, f)
+                os.replace(f'{path}.tmp', path)
+                results[result['site']] = result
+        return results
+
+    def update_live(self, frames):
+        """Score the forecast runs whose horizon has been fully observed since the last call"""
+        target = self.forecast_config['target']
+        scored = {}
+        for site, frame in frames.items():
+            state = self._state.setdefault(site, {'offset': 0})
+            last_actual = frame.index[-1]
+            actuals = frame[target]
+
+            new_errors = []
+            for end_offset, forecast in self.forecast_store.history_since(site, state['offset']):
+                if pd.Timestamp(forecast['timestamps'][-1]) > last_actual:
+                    break  # Horizon not fully observed yet; runs are stored in order
+                errors = _forecast_errors(forecast, actuals)
+                if errors is not None:
+                    new_errors.append(errors)
+                state['offset'] = end_offset
+
+            if new_errors:
+                with open(self._errors_path(site), 'a') as f:
+                    for errors in new_errors:
+                        f.write(json.dumps(errors) + '\n')
+                scored[site] = len(new_errors)
+
+        self._save_state()
+        return scored
+
+    def errors(self, site):
+        """Live error series of a site, one row per scored forecast run"""
+        path = self._errors_path(site)
+        if not os.path.exists(path):
+            return pd.DataFrame(columns=['generated_at', 'last_observed', 'model', 'n', 'mae', 'rmse', 'mape'])
+        errors = pd.read_json(path, lines=True)
+        errors['last_observed'] = pd.to_datetime(errors['last_observed'])
+        return errors
+
+    def backtest(self, site):
+        """Latest backtest result of a site, or None"""
+        path = self._backtest_path(site)
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r') as f:
+            return json.load(f)
+
+    def status(self, site):
+        """Compare a site's recent live MAE with its backtest MAE"""
+        errors = self.errors(site)
+        retrained_at = self._state.get(site, {}).get('retrained_at')
+        if retrained_at is not None and not errors.empty:
+            # Runs of the replaced model no longer count against the site
+            errors = errors[pd.to_datetime(errors['generated_at']) > pd.Timestamp(retrained_at)]
+        recent = errors.tail(self.config['live_window'])
+
+        backtest = self.backtest(site)
+        if backtest is not None and backtest['model'] == 'lstm' and backtest.get('trained_through') is None:
+            backtest = None  # Scored in sample, before checkpoints recorded their training cutoff
+        live_mae = float(recent['mae'].mean()) if not recent.empty else None
+        backtest_mae = backtest['mae'] if backtest is not None else None
+        ratio = live_mae / backtest_mae if live_mae is not None and backtest_mae else None
+
+        return {
+            'site': site,
+            'runs': len(recent),
+            'live_mae': live_mae,
+            'backtest_mae': backtest_mae,
+            'ratio': ratio,
+            'drifted': ratio is not None and len(recent) >= self.config['min_live_runs']
+            and ratio > self.config['drift_ratio']
+        }
+
+    def flagged(self, sites):
+        """Sites whose live error has drifted above their backtest error"""
+        return [site for site in sites if self.status(site)['drifted']]
+
+    def mark_retrained(self, site):
+        """Start a fresh live error window after a site's model was replaced"""
+        self._state.setdefault(site, {'offset': 0})['retrained_at'] = datetime.now().isoformat()
+        self._save_state()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Forecast accuracy monitoring")
+    parser.add_argument('--backtest', action='store_true', help="Run rolling-origin backtests first")
+    parser.add_argument('--retrain', action='store_true', help="Fully retrain flagged LSTM sites")
+    args = parser.parse_args()
+
+    monitor = AccuracyMonitor()
+    frames = series_frames(load_readings(FORECAST_CONFIG['data_folder']))
+    if args.backtest:
+        for site, result in monitor.run_backtests(frames).items():
+            print(f"{site}: backtest MAE {result['mae']:.2f} (seasonal naive {result['baseline_mae']:.2f})")
+
+    print(f"Scored forecast runs: {monitor.update_live(frames)}")
+    flagged = monitor.flagged(frames)
+    print(f"Sites with drifted error: {flagged}")
+
+    if args.retrain:
+        from continual_training import ContinualTrainer
+
+        trainer = ContinualTrainer()
+        for site in flagged:
+            if monitor.model_kind(site) == 'lstm':
+                entry = trainer.update(site, frames[site], force_full=True)
+                monitor.mark_retrained(site)
+                print(f"{site}: retrained as v{entry['version']}")
@@ -0,0 +1,141 @@
+import os
+import numpy as np
+import pandas as pd
+
+from config import BASELINE_CONFIG
+
+
+class BaselineModel:
+    """Expected consumption from occupancy and temperature, by least squares on running normal equations
+
+    For the building total ('Overall') and every zone the model keeps X'X,
+    X'y, y'y and the reading count, with X = [1, features...]. Folding in
+    one reading or a batch only adds to these sums, so the model follows the
+    data without revisiting it; coefficients are one small solve per target,
+    cached until the next update.
+    """
+
+    _ARRAYS = ('xtx', 'xty', 'yty', 'counts')
+
+    def __init__(self, features=None, zones=()):
+        self.features = list(features if features is not None else BASELINE_CONFIG['features'])
+        self.zones = []
+        self.rows = 0  # Readings folded in, to check the model against its store
+        p = len(self.features) + 1
+        self.xtx = np.zeros((1, p, p))
+        self.xty = np.zeros((1, p))
+        self.yty = np.zeros(1)
+        self.counts = np.zeros(1, dtype=np.int64)
+        self._coefficients = None
+        self._grow_zones(list(zones))
+
+    @property
+    def targets(self):
+        return ['Overall'] + self.zones
+
+    @classmethod
+    def from_frame(cls, df, zones=None, zone_consumption=None, features=None):
+        """Model of a frame of readings; zone_consumption is a (readings, zones) matrix"""
+        model = cls(features, zones or ())
+        if not df.empty:
+            model.add(model.design(df), df[BASELINE_CONFIG['target']], zone_consumption)
+        return model
+
+    def design(self, readings):
+        """(readings, features) matrix of a frame or mapping of feature columns"""
+        return np.column_stack([np.asarray(readings[name], dtype=np.float64) for name in self.features])
+
+    def _grow_zones(self, zones):
+        new = [zone for zone in zones if zone not in self.zones]
+        if not new:
+            return
+        p = len(self.features) + 1
+        self.xtx = np.concatenate([self.xtx, np.zeros((len(new), p, p))])
+        self.xty = np.concatenate([self.xty, np.zeros((len(new), p))])
+        self.yty = np.concatenate([self.yty, np.zeros(len(new))])
+        self.counts = np.concatenate([self.counts, np.zeros(len(new), dtype=np.int64)])
+        self.zones = self.zones + new
+
+    def add(self, features, consumption, zone_consumption=None, zones=None):
+        """Fold in readings: features (readings, features), consumption per reading,
+        zone_consumption (readings, zones) in the order of zones (default: the model's)"""
+        features = np.atleast_2d(np.asarray(features, dtype=np.float64))
+        X = np.column_stack([np.ones(len(features)), features])
+        Y = np.full((len(X), len(self.targets)), np.nan)
+        Y[:, 0] = np.asarray(consumption, dtype=np.float64)
+        if zone_consumption is not None:
+            zone_consumption = np.asarray(zone_consumption, dtype=np.float64).reshape(len(X), -1)
+            zones = list(zones) if zones is not None else self.zones[:zone_consumption.shape[1]]
+            self._grow_zones(zones)
+            Y = np.column_stack([Y, np.full((len(X), len(self.targets) - Y.shape[1]), np.nan)])
+            Y[:, [1 + self.zones.index(zone) for zone in zones]] = zone_consumption
+
+        # A reading counts for a target when its features and that target are all observed
+        observed = ~np.isnan(Y) & ~np.isnan(X).any(axis=1)[:, None]
+        X = np.nan_to_num(X)
+        Y = np.where(observed, Y, 0.0)
+        self.xtx += np.einsum('nt,ni,nj->tij', observed.astype(np.float64), X, X)
+        self.xty += np.einsum('nt,ni->ti', Y, X)
+        self.yty += (Y ** 2).sum(axis=0)
+        self.counts += observed.sum(axis=0)
+        self.rows += len(X)
+        self._coefficients = None
+        return self
+
+    def coefficients(self):
+        """(targets, 1 + features) least-squares coefficients, intercept first"""
+        if self._coefficients is None:
+            # The pseudo-inverse keeps degenerate targets (e.g. constant temperature) solvable
+            self._coefficients = np.einsum('tij,tj->ti', np.linalg.pinv(self.xtx), self.xty)
+        return self._coefficients
+
+    def predict(self, features):
+        """(readings, targets) expected consumption"""
+        features = np.atleast_2d(np.asarray(features, dtype=np.float64))
+        coefficients = self.coefficients()
+        return coefficients[:, 0] + features @ coefficients[:, 1:].T
+
+    def residuals(self, features, consumption, zone_consumption=None):
+        """(readings, targets) actual minus expected consumption; NaN where a target is missing"""
+        expected = self.predict(features)
+        actual = np.full_like(expected, np.nan)
+        actual[:, 0] = np.asarray(consumption, dtype=np.float64)
+        if zone_consumption is not None:
+            zone_consumption = np.asarray(zone_consumption, dtype=np.float64)
+            actual[:, 1:1 + zone_consumption.shape[1]] = zone_consumption
+        return actual - expected
+
+    def r2(self):
+        """Coefficient of determination per target, from the running sums alone"""
+        b = self.coefficients()
+        sse = self.yty - 2 * np.einsum('ti,ti->t', b, self.xty) + np.einsum('ti,tij,tj->t', b, self.xtx, b)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            sst = self.yty - self.xty[:, 0] ** 2 / self.counts
+            return np.where(sst > 0, 1 - sse / sst, np.nan)
+
+    def summary(self):
+        """Coefficients, R² and reading count per target"""
+        table = pd.DataFrame(self.coefficients(), index=self.targets, columns=['intercept'] + self.features)
+        table['r2'] = self.r2()
+        table['readings'] = self.counts
+        return table
+
+    def save(self, path):
+        """Write the model to one .npz file, replaced atomically"""
+        tmp_path = f'{path}.tmp.npz'
+        np.savez(tmp_path, rows=np.int64(self.rows), features=np.array(self.features, dtype=str),
+                 zones=np.array(self.zones, dtype=str), **{name: getattr(self, name) for name in self._ARRAYS})
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """Model saved at path, or None if there is none"""
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as data:
+            model = cls(data['features'].tolist())
+            model.zones = data['zones'].tolist()
+            model.rows = int(data['rows'])
+            for name in cls._ARRAYS:
+                setattr(model, name, data[name])
+        return model
@@ -0,0 +1,312 @@
+import os
+import argparse
+import threading
+import numpy as np
+import pandas as pd
+
+from config import BUDGET_CONFIG, TARIFF_CONFIG
+from calendar_features import TOU_PEAK, TOU_OFFPEAK, calendar_columns, ordinal_dates
+from data_processor import load_readings
+
+
+def _day(value):
+    """date_ordinal (days since 1970-01-01) of a date or timestamp"""
+    return int(pd.Timestamp(value).to_datetime64().astype('datetime64[D]').astype(np.int64))
+
+
+class BudgetPlan:
+    """Monthly budgets (₹) per site
+
+    An explicit 'YYYY-MM' amount wins, then the site's default, then the
+    global default. A month's budget is spread evenly over its days.
+    """
+
+    def __init__(self, config=None):
+        config = config if config is not None else BUDGET_CONFIG
+        self.default = config['default_monthly']
+        self.site_defaults = dict(config['site_defaults'])
+        self.amounts = {site: dict(months) for site, months in config['monthly'].items()}
+
+    def set(self, site, month, amount):
+        self.amounts.setdefault(site, {})[pd.Period(month, 'M').strftime('%Y-%m')] = amount
+
+    def monthly(self, site, month):
+        if not (isinstance(month, str) and len(month) == 7):
+            month = pd.Period(month, 'M').strftime('%Y-%m')
+        return self.amounts.get(site, {}).get(month, self.site_defaults.get(site, self.default))
+
+    def between(self, site, first_day, last_day):
+        """Budget of the days first_day..last_day (date ordinals, inclusive), one term per month"""
+        total = 0.0
+        day = first_day
+        while day <= last_day:
+            month = np.datetime64(day, 'D').astype('datetime64[M]')
+            month_start = int(month.astype('datetime64[D]').astype(np.int64))
+            month_end = int((month + 1).astype('datetime64[D]').astype(np.int64))  # Exclusive
+            days = min(last_day + 1, month_end) - day
+            total += self.monthly(site, str(month)) * days / (month_end - month_start)
+            day = month_end
+        return total
+
+    def daily(self, site, first_day, n_days):
+        """Daily budget of n_days consecutive days starting at first_day"""
+        days = np.arange(first_day, first_day + n_days).astype('datetime64[D]')
+        months = days.astype('datetime64[M]')
+        month_days = ((months + 1).astype('datetime64[D]') - months.astype('datetime64[D]')).astype(np.int64)
+        amounts = {m: self.monthly(site, str(m)) for m in np.unique(months)}
+        return np.array([amounts[m] for m in months], dtype=np.float64) / month_days
+
+
+class CostLedger:
+    """Actual cost (₹) and consumption (Wh) of one site per day and TOU band
+
+    Readings are folded in as they arrive. Running totals over the days are
+    kept alongside and only extended from the first day that changed, so the
+    cost of any date range is two lookups and a subtraction.
+    """
+
+    _ARRAYS = ('cost', 'consumption')
+
+    def __init__(self):
+        self.origin = None  # date_ordinal of the first day row
+        self.last_timestamp = None  # Nanoseconds of the newest reading folded in
+        self.cost = np.zeros((0, 2))  # Columns indexed by TOU_OFFPEAK / TOU_PEAK
+        self.consumption = np.zeros((0, 2))
+        self._running = np.zeros((0, 2))
+        self._dirty = 0  # First day row whose running totals are stale
+
+    def add(self, timestamps, consumption):
+        """Fold in readings newer than the last one; returns the number folded in"""
+        timestamps = pd.to_datetime(pd.Series(timestamps)).to_numpy().astype('datetime64[ns]').astype(np.int64)
+        consumption = np.asarray(consumption, dtype=np.float64)
+        if self.last_timestamp is not None:
+            newer = timestamps > self.last_timestamp
+            timestamps, consumption = timestamps[newer], consumption[newer]
+        if len(timestamps) == 0:
+            return 0
+
+        calendar = calendar_columns(timestamps, names=('date_ordinal', 'tou_band'))
+        days = calendar['date_ordinal'].astype(np.int64)
+        bands = calendar['tou_band'].astype(np.int64)
+        self._grow(int(days.min()), int(days.max()))
+
+        rates = np.where(bands == TOU_PEAK, TARIFF_CONFIG['peak_rate'], TARIFF_CONFIG['offpeak_rate']) / 1000  # ₹ per Wh
+        consumption = np.nan_to_num(consumption)
+        rows = days - self.origin
+        np.add.at(self.consumption, (rows, bands), consumption)
+        np.add.at(self.cost, (rows, bands), consumption * rates)
+        self._dirty = min(self._dirty, int(rows.min()))
+        self.last_timestamp = int(timestamps.max())
+        return len(timestamps)
+
+    def _grow(self, first, last):
+        if self.origin is None:
+            self.origin = first
+        if first < self.origin:
+            pad = np.zeros((self.origin - first, 2))
+            self.cost = np.concatenate([pad, self.cost])
+            self.consumption = np.concatenate([pad, self.consumption])
+            self.origin, self._dirty = first, 0
+        pad = last - self.origin + 1 - len(self.cost)
+        if pad > 0:
+            self.cost = np.concatenate([self.cost, np.zeros((pad, 2))])
+            self.consumption = np.concatenate([self.consumption, np.zeros((pad, 2))])
+
+    def running(self):
+        """Running cost totals per day row, extended from the first stale row"""
+        if self._dirty < len(self.cost) or len(self._running) != len(self.cost):
+            start = min(self._dirty, len(self._running))
+            before = self._running[start - 1] if start > 0 else np.zeros(2)
+            self._running = np.concatenate([self._running[:start], before + np.cumsum(self.cost[start:], axis=0)])
+            self._dirty = len(self.cost)
+        return self._running
+
+    def __len__(self):
+        return len(self.cost)
+
+    def days(self, start=None, end=None):
+        """Day rows [lo, hi) covering start <= date <= end"""
+        lo, hi = 0, len(self)
+        if self.origin is None:
+            return 0, 0
+        if start is not None:
+            lo = min(max(_day(start) - self.origin, 0), hi)
+        if end is not None:
+            hi = max(min(_day(end) - self.origin + 1, hi), lo)
+        return lo, hi
+
+    def cost_between(self, start=None, end=None):
+        """(peak, off-peak) cost between start and end"""
+        lo, hi = self.days(start, end)
+        if hi <= lo:
+            return 0.0, 0.0
+        running = self.running()
+        totals = running[hi - 1] - (running[lo - 1] if lo > 0 else 0.0)
+        return float(totals[TOU_PEAK]), float(totals[TOU_OFFPEAK])
+
+    def save(self, path):
+        """Write the ledger to one .npz file, replaced atomically"""
+        tmp_path = f'{path}.tmp.npz'
+        np.savez(tmp_path, origin=np.int64(-1 if self.origin is None else self.origin),
+                 last_timestamp=np.int64(-1 if self.last_timestamp is None else self.last_timestamp),
+                 **{name: getattr(self, name) for name in self._ARRAYS})
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """Ledger saved at path, or None if there is none"""
+        if not os.path.exists(path):
+            return None
+        ledger = cls()
+        with np.load(path) as data:
+            origin, last = int(data['origin']), int(data['last_timestamp'])
+            ledger.origin = None if origin < 0 else origin
+            ledger.last_timestamp = None if last < 0 else last
+            for name in cls._ARRAYS:
+                setattr(ledger, name, data[name])
+        return ledger
+
+
+class BudgetTracker:
+    """Per-site cost ledgers checked against a BudgetPlan
+
+    Actual cost, utilization and variance over any date range are lookups
+    in a site's running totals plus one term per month of budget, so a
+    summary over hundreds of sites does not touch their readings. With a
+    path the ledgers are kept as one .npz file per site, loaded on first use.
+    """
+
+    def __init__(self, path=None, plan=None, config=None):
+        self.config = config if config is not None else BUDGET_CONFIG
+        self.path = path
+        self.plan = plan if plan is not None else BudgetPlan(self.config)
+        self._ledgers = {}
+        self._lock = threading.RLock()  # Guards the ledgers; queries extend their running totals
+
+    def _ledger_path(self, site):
+        return os.path.join(self.path, f'{site}.npz')
+
+    def sites(self):
+        on_disk = []
+        if self.path is not None and os.path.isdir(self.path):
+            on_disk = [f[:-len('.npz')] for f in os.listdir(self.path) if f.endswith('.npz') and not f.endswith('.tmp.npz')]
+        return sorted(set(on_disk) | set(self._ledgers))
+
+    def ledger(self, site):
+        """The site's ledger (empty if it has no readings yet)"""
+        with self._lock:
+            if site not in self._ledgers:
+                ledger = CostLedger.load(self._ledger_path(site)) if self.path is not None else None
+                self._ledgers[site] = ledger if ledger is not None else CostLedger()
+            return self._ledgers[site]
+
+    def ingest(self, df, site=None):
+        """Fold in the readings of a frame not seen yet; sites come from the site column unless given
+
+        Returns the number of readings folded in.
+        """
+        if df.empty:
+            return 0
+        site_column = self.config['site_column']
+        if site is None and site_column in df.columns:
+            return sum(self.ingest(site_df, str(name)) for name, site_df in df.groupby(site_column, sort=False))
+        site = site if site is not None else self.config['default_site']
+
+        with self._lock:
+            ledger = self.ledger(site)
+            timestamps = pd.to_datetime(df['timestamp'])
+            if ledger.last_timestamp is not None and timestamps.is_monotonic_increasing:
+                # Time-ordered frames: skip the readings already folded in without looking at them
+                begin = int(np.searchsorted(timestamps.to_numpy().astype('datetime64[ns]').astype(np.int64),
+                                            ledger.last_timestamp, 'right'))
+                timestamps, df = timestamps.iloc[begin:], df.iloc[begin:]
+            return ledger.add(timestamps, df['total_consumption'])
+
+    def save(self):
+        os.makedirs(self.path, exist_ok=True)
+        with self._lock:
+            for site, ledger in self._ledgers.items():
+                ledger.save(self._ledger_path(site))
+
+    def _dates(self, site, start, end):
+        """Inclusive day range of a query, defaulting to the days of the site's ledger"""
+        with self._lock:
+            ledger = self.ledger(site)
+            if ledger.origin is None and (start is None or end is None):
+                return None
+            first = _day(start) if start is not None else ledger.origin
+            last = _day(end) if end is not None else ledger.origin + len(ledger) - 1
+            return first, last
+
+    def actual(self, site, start=None, end=None):
+        """Actual cost (₹) between start and end, split into peak and off-peak"""
+        with self._lock:
+            peak, offpeak = self.ledger(site).cost_between(start, end)
+        return {'cost': peak + offpeak, 'peak_cost': peak, 'offpeak_cost': offpeak}
+
+    def budget(self, site, start=None, end=None):
+        """Budget (₹) of the days between start and end"""
+        dates = self._dates(site, start, end)
+        return 0.0 if dates is None else self.plan.between(site, *dates)
+
+    def utilization(self, site, start=None, end=None):
+        """Actual cost as a fraction of the budget"""
+        budget = self.budget(site, start, end)
+        return self.actual(site, start, end)['cost'] / budget if budget > 0 else 0.0
+
+    def variance(self, site, start=None, end=None):
+        """Budget left over (negative when overspent)"""
+        return self.budget(site, start, end) - self.actual(site, start, end)['cost']
+
+    def daily(self, site, start=None, end=None):
+        """Budget, actual, peak and off-peak cost per day, one row per calendar day"""
+        with self._lock:
+            ledger = self.ledger(site)
+            dates = self._dates(site, start, end)
+            if dates is None or dates[1] < dates[0]:
+                return pd.DataFrame(columns=['budget', 'actual', 'peak_cost', 'offpeak_cost'])
+            first, last = dates
+            cost = np.zeros((last - first + 1, 2))
+            lo, hi = max(first - (ledger.origin or 0), 0), min(last - (ledger.origin or 0) + 1, len(ledger))
+            if ledger.origin is not None and hi > lo:
+                cost[lo + ledger.origin - first:hi + ledger.origin - first] = ledger.cost[lo:hi]
+        return pd.DataFrame({
+            'budget': self.plan.daily(site, first, len(cost)),
+            'actual': cost.sum(axis=1),
+            'peak_cost': cost[:, TOU_PEAK],
+            'offpeak_cost': cost[:, TOU_OFFPEAK]
+        }, index=pd.DatetimeIndex(ordinal_dates(np.arange(first, last + 1)), name='date'))
+
+    def burn_down(self, site, month):
+        """Budget remaining through a month: actual to date and projected at the current run rate"""
+        period = pd.Period(month, 'M')
+        days = self.daily(site, period.start_time, period.end_time)
+        budget = self.plan.monthly(site, period)
+        spent = days['actual'].cumsum()
+        elapsed = days.index[days['actual'] > 0]
+        run_rate = spent.loc[elapsed[-1]] / (elapsed[-1].day) if len(elapsed) else 0.0
+        return pd.DataFrame({
+            'remaining': budget - spent,
+            'projected': budget - run_rate * np.arange(1, len(days) + 1)
+        }, index=days.index)
+
+    def summary(self, sites=None, start=None, end=None):
+        """Budget, actual, utilization and variance per site"""
+        rows = []
+        for site in sites if sites is not None else self.sites():
+            budget = self.budget(site, start, end)
+            actual = self.actual(site, start, end)['cost']
+            rows.append({'site': site, 'budget': budget, 'actual': actual,
+                         'utilization': actual / budget if budget > 0 else 0.0, 'variance': budget - actual})
+        return pd.DataFrame(rows, columns=['site', 'budget', 'actual', 'utilization', 'variance']).set_index('site')
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fold new readings into the per-site cost ledgers")
+    parser.add_argument('--data-folder', default=BUDGET_CONFIG['data_folder'])
+    args = parser.parse_args()
+
+    tracker = BudgetTracker(BUDGET_CONFIG['path'])
+    added = tracker.ingest(load_readings(args.data_folder))
+    tracker.save()
+    print(f"Folded {added} reading(s) into the ledgers of {len(tracker.sites())} site(s)")
@@ -0,0 +1,79 @@
+import numpy as np
+import pandas as pd
+
+from config import CALENDAR_CONFIG, TARIFF_CONFIG
+
+DAY_NS = 24 * 3600 * 10 ** 9
+HOUR_NS = 3600 * 10 ** 9
+DAY_NAMES = ('Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday')
+
+# Time-of-use bands stored in the tou_band column
+TOU_OFFPEAK = 0
+TOU_PEAK = 1
+
+CALENDAR_COLUMNS = ('hour', 'dow', 'date_ordinal', 'month', 'iso_week', 'is_holiday', 'tou_band')
+
+
+def _nanoseconds(timestamps):
+    values = np.asarray(timestamps)
+    if not np.issubdtype(values.dtype, np.datetime64):
+        values = pd.to_datetime(values).to_numpy()
+    return values.astype('datetime64[ns]').astype(np.int64)
+
+
+def _holiday_mask(days, months, holidays):
+    """Readings on a holiday: 'MM-DD' entries recur every year, 'YYYY-MM-DD' entries are single dates"""
+    recurring = [int(h[:2]) * 100 + int(h[3:5]) for h in holidays if len(h) == 5]
+    dates = np.array([h for h in holidays if len(h) == 10], dtype='datetime64[D]').astype(np.int64)
+    mask = np.isin(days, dates)
+    if recurring:
+        day_of_month = days - days.astype('datetime64[D]').astype('datetime64[M]').astype('datetime64[D]').astype(np.int64) + 1
+        mask |= np.isin(months.astype(np.int64) * 100 + day_of_month, recurring)
+    return mask
+
+
+def calendar_columns(timestamps, names=CALENDAR_COLUMNS, holidays=None, peak_hours=None):
+    """Compact integer calendar features of a timestamp array, decoded in one vectorized pass
+
+    hour (0-23), dow (Monday=0), date_ordinal (days since 1970-01-01),
+    month (1-12), iso_week (1-53), is_holiday and tou_band (TOU_PEAK or
+    TOU_OFFPEAK). Only the requested names are returned.
+    """
+    holidays = holidays if holidays is not None else CALENDAR_CONFIG['holidays']
+    peak_start, peak_end = peak_hours if peak_hours is not None else TARIFF_CONFIG['peak_hours']
+
+    ns = _nanoseconds(timestamps)
+    days = np.floor_divide(ns, DAY_NS)
+    hour = ((ns - days * DAY_NS) // HOUR_NS).astype(np.int8)
+    dow = ((days + 3) % 7).astype(np.int8)  # 1970-01-01 was a Thursday
+    month = (days.astype('datetime64[D]').astype('datetime64[M]').astype(np.int64) % 12 + 1).astype(np.int8)
+
+    columns = {'hour': hour, 'dow': dow, 'date_ordinal': days.astype(np.int32), 'month': month}
+    if 'iso_week' in names:
+        # The ISO week is the week of the year its Thursday falls in
+        thursday = days - dow + 3
+        year_start = thursday.astype('datetime64[D]').astype('datetime64[Y]').astype('datetime64[D]').astype(np.int64)
+        columns['iso_week'] = ((thursday - year_start) // 7 + 1).astype(np.int8)
+    if 'is_holiday' in names:
+        columns['is_holiday'] = _holiday_mask(days, month, holidays)
+    if 'tou_band' in names:
+        columns['tou_band'] = np.where((hour >= peak_start) & (hour < peak_end), TOU_PEAK, TOU_OFFPEAK).astype(np.int8)
+    return {name: columns[name] for name in names}
+
+
+def add_calendar_columns(df, holidays=None, peak_hours=None):
+    """Materialize the calendar columns (and is_weekend) on a frame of readings, in place"""
+    for name, values in calendar_columns(df['timestamp'], holidays=holidays, peak_hours=peak_hours).items():
+        df[name] = values
+    df['is_weekend'] = df['dow'].to_numpy() >= 5
+    return df
+
+
+def day_names(dow):
+    """Day names of a dow column as a categorical, without building a string per row"""
+    return pd.Categorical.from_codes(np.asarray(dow), categories=list(DAY_NAMES))
+
+
+def ordinal_dates(date_ordinal):
+    """datetime64 midnight of each date_ordinal"""
+    return np.asarray(date_ordinal).astype('datetime64[D]').astype('datetime64[ns]')
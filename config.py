@@ -15,7 +15,220 @@ MODEL_CONFIG = {
     'dropout_rate': 0.2,
     'epochs': 50,
     'batch_size': 32,
-    'sequence_length': 24  # 24 hours of data for sequence
+    'sequence_length': 24,  # 24 hours of data for sequence
+    'layer_stack': [1, 0.5, 0.25]  # LSTM layer sizes as fractions of lstm_units
+}
+
+# Hyperparameter search space for EnergyLSTM
+HYPERPARAM_SPACE = {
+    'lstm_units': [16, 32, 50, 64],
+    'dropout_rate': [0.0, 0.1, 0.2, 0.3],
+    'batch_size': [16, 32, 64],
+    'sequence_length': [12, 24, 48],
+    'layer_stack': [[1], [1, 0.5], [1, 0.5, 0.25]]
+}
+
+# Successive-halving tuner settings
+TUNING_CONFIG = {
+    'work_dir': os.path.join(BASE_DIR, 'tuning'),
+    'n_trials': 27,
+    'min_epochs': 3,  # Budget of the first rung
+    'max_epochs': 50,  # Budget of the last rung
+    'reduction_factor': 3,  # Keep the best 1/reduction_factor trials at each rung
+    'max_workers': None,  # Defaults to CPU cores // threads_per_worker
+    'threads_per_worker': 1,
+    'seed': 0
+}
+
+# Forecasting service settings
+FORECAST_CONFIG = {
+    'data_folder': os.path.join(BASE_DIR, 'synthetic_data'),
+    'store_dir': os.path.join(BASE_DIR, 'forecasts'),
+    'site_column': 'site',  # Readings without this column belong to default_site
+    'default_site': 'main',
+    'target': 'total_consumption',
+    'features': ['total_consumption', 'occupancy_level', 'temperature'],
+    'horizon': 24,
+    'refresh_interval_minutes': 60,
+    'retrain_interval_hours': 24,
+    'default_model': 'lstm',  # 'lstm', 'global_lstm', 'seasonal_naive', 'holt_winters' or 'ridge'
+    'site_models': {},  # Per-site override, e.g. {'main': 'holt_winters'}
+    'global_fallback_model': 'holt_winters',  # For global_lstm sites the global checkpoint was not trained on
+    'use_exported': True  # Serve LSTM sites from the NumPy export when one exists
+}
+
+# NumPy-only statistical forecaster settings
+STAT_MODEL_CONFIG = {
+    'target': 'total_consumption',
+    'fit_window': 8 * 168,  # Most recent readings used for fitting
+    'alpha_grid': [0.05, 0.2, 0.5],  # Holt-Winters level smoothing candidates
+    'gamma_grid': [0.05, 0.2],  # Holt-Winters seasonal smoothing candidates
+    'beta': 0.01,  # Holt-Winters trend smoothing
+    'ridge_alpha': 1.0,
+    'covariates': ['temperature', 'occupancy_level']
+}
+
+# Per-site training orchestrator settings
+TRAINING_CONFIG = {
+    'checkpoint_dir': os.path.join(BASE_DIR, 'models'),
+    'max_workers': None,  # Defaults to CPU cores // threads_per_worker
+    'threads_per_worker': 1,  # TensorFlow intra-op threads per worker process
+    'export': True,  # Write a NumPy export next to each checkpoint (served without TensorFlow)
+    'export_quantization': 'float16',  # Export weights as None (float32), 'float16' or 'int8'
+    'parity_tolerance': 0.01,  # Max relative error of the export against the Keras model
+    'zone_features': ['total_floor_consumption', 'occupancy_level', 'temperature']
+}
+
+# Continual (incremental) training settings
+CONTINUAL_CONFIG = {
+    'registry_dir': os.path.join(BASE_DIR, 'models', 'registry'),
+    'fine_tune_epochs': 5,
+    'range_margin': 0.1,  # Scaled values beyond [-margin, 1 + margin] count as out of range
+    'max_out_of_range': 0.05,  # Share of out-of-range values that triggers a full refit
+    'max_mean_shift': 3.0,  # Scaled mean shift (in reference std devs) that triggers a full refit
+    'keep_versions': 5  # Model snapshots kept per site
+}
+
+# Forecast accuracy monitoring settings
+BACKTEST_CONFIG = {
+    'store_dir': os.path.join(BASE_DIR, 'forecasts', 'accuracy'),
+    'n_origins': 30,  # Rolling forecast origins per backtest
+    'origin_step': 24,  # Readings between consecutive origins
+    'live_window': 14,  # Most recent scored forecast runs used for the live error
+    'min_live_runs': 5,  # Scored runs needed before a site can be flagged
+    'drift_ratio': 1.5,  # Flag when live MAE exceeds the backtest MAE by this factor
+    'max_workers': None  # Defaults to CPU cores
+}
+
+# Dashboard data layer settings
+DATA_LAYER_CONFIG = {
+    'max_workers': 4,  # Threads computing dashboard panels, shared by all sessions
+    'panel_timeout_seconds': 120
+}
+
+# Chart downsampling settings
+DOWNSAMPLING_CONFIG = {
+    'max_points': 2000,  # Points per series sent to the browser
+    'method': 'lttb'  # 'lttb' (shape-preserving) or 'minmax' (keeps every bucket's extremes)
+}
+
+# Shared figure cache settings
+FIGURE_CACHE_CONFIG = {
+    'max_entries': 256  # Serialized figures kept across all sessions
+}
+
+# Process-wide shared dataset settings
+SHARED_DATA_CONFIG = {
+    'data_folder': os.path.join(BASE_DIR, 'synthetic_data'),
+    'cache_dir': os.path.join(BASE_DIR, 'cache', 'dataset')  # Memory-mapped column files
+}
+
+# On-disk memory-mapped time-series store settings
+TIMESERIES_STORE_CONFIG = {
+    'path': os.path.join(BASE_DIR, 'store'),
+    'data_folder': os.path.join(BASE_DIR, 'synthetic_data'),
+    'metrics': ['total_consumption', 'peak_load', 'occupancy_level', 'temperature',
+                'computer_consumption', 'projector_consumption'],
+    'zone_metrics': ['fan_consumption', 'light_consumption', 'total_floor_consumption'],
+    'chunk_rows': 1_000_000,  # Rows held in memory at once when scanning the store
+    'heatmap_metric': 'total_consumption',  # Metric of the hour-of-week cube kept with the store
+    'heatmap_zone_metric': 'total_floor_consumption'
+}
+
+# Calendar feature columns materialized at ingest
+CALENDAR_CONFIG = {
+    'holidays': ['01-26', '08-15', '10-02']  # 'MM-DD' recurs every year, 'YYYY-MM-DD' is a single date
+}
+
+# Electricity tariff
+TARIFF_CONFIG = {
+    'peak_hours': (9, 18),  # [start, end) hours billed at the peak rate
+    'peak_rate': 8,  # ₹ per kWh
+    'offpeak_rate': 6  # ₹ per kWh
+}
+
+# Running-total (prefix sum) indexes built at ingest for O(1) range totals
+PREFIX_INDEX_CONFIG = {
+    'metrics': ['total_consumption', 'occupancy_level'],
+    'zone_metrics': ['total_floor_consumption']
+}
+
+# Energy efficiency score, computed for every reading and zone
+EFFICIENCY_CONFIG = {
+    'weights': {'occupancy': 30, 'peak_load': 20, 'equipment': 20, 'temperature': 15, 'time': 15},  # Points, 100 in all
+    'per_occupant_target': 1000,  # Wh per occupant that earns the full occupancy points
+    'optimal_temperature': 22,  # °C
+    'temperature_tolerance': 10,  # °C away from optimal at which the temperature points reach 0
+    'time_scores': {'Morning': 15, 'Afternoon': 10, 'Evening': 5},  # Points per time_of_day
+    'default_time_score': 5,
+    'trend_freq': 'W'  # Resampling frequency of the score trend
+}
+
+# Alert rules evaluated incrementally as readings arrive (see alerting.Rule)
+ALERT_CONFIG = {
+    'data_folder': os.path.join(BASE_DIR, 'synthetic_data'),
+    'sink_path': os.path.join(BASE_DIR, 'alerts', 'alerts.jsonl'),
+    'state_path': os.path.join(BASE_DIR, 'alerts', 'engine.pkl'),  # Running aggregates between runs
+    'site_column': 'site',  # Readings without this column belong to default_site
+    'default_site': 'main',
+    'throttle_seconds': 6 * 3600,  # Minimum time between two alerts of one rule and site
+    'rules': [
+        {'name': 'consumption_spike', 'kind': 'rate_of_change', 'metric': 'total_consumption',
+         'window': 'day', 'op': '>', 'threshold': 0.2,
+         'message': 'Recent consumption is {value:.1%} above average'},
+        {'name': 'budget_burn', 'kind': 'budget_burn', 'window': 'month',  # Budget from BUDGET_CONFIG
+         'op': '>', 'threshold': 0.9, 'severity': 'critical',
+         'message': 'Budget utilization at {value:.0%} of the monthly budget'},
+        {'name': 'peak_cost_share', 'kind': 'ratio', 'metric': 'peak_cost', 'denominator': 'cost',
+         'window': 'month', 'op': '>', 'threshold': 0.6,
+         'message': 'High peak hour usage ({value:.0%} of total cost)'},
+    ]
+}
+
+# Per-site monthly budgets and the cost ledgers they are checked against
+BUDGET_CONFIG = {
+    'path': os.path.join(BASE_DIR, 'budgets'),  # One ledger file per site
+    'data_folder': os.path.join(BASE_DIR, 'synthetic_data'),
+    'site_column': 'site',  # Readings without this column belong to default_site
+    'default_site': 'main',
+    'default_monthly': 150000,  # ₹ per site and month
+    'site_defaults': {},  # Per-site monthly default, e.g. {'annex': 90000}
+    'monthly': {}  # Budgets of given months, e.g. {'main': {'2024-01': 140000}}
+}
+
+# Occupancy/temperature consumption baseline (linear least squares)
+BASELINE_CONFIG = {
+    'features': ['occupancy_level', 'temperature'],  # Regressors besides the intercept
+    'target': 'total_consumption',
+    'zone_target': 'total_floor_consumption'
+}
+
+# External covariate feeds (local CSV/Parquet), aligned to readings by timestamp
+COVARIATE_CONFIG = {
+    'dir': os.path.join(BASE_DIR, 'covariates'),  # Feed files; feeds whose file is absent are skipped
+    'cache_dir': os.path.join(BASE_DIR, 'cache', 'covariates'),  # Aligned feature matrices
+    'cache_entries': 64,  # Aligned matrices kept (in memory and on disk); at least one per site or zone
+    'feeds': [
+        # Point observations: each reading takes the latest one no older than tolerance
+        {'name': 'weather', 'path': 'weather.csv', 'join': 'asof', 'time_column': 'timestamp',
+         'columns': ['outdoor_temperature', 'humidity'], 'tolerance': '2h'},
+        # [start, end) spans: each reading takes the span it falls in
+        {'name': 'bookings', 'path': 'bookings.csv', 'join': 'interval', 'start_column': 'start',
+         'end_column': 'end', 'columns': ['booked_occupancy']}
+    ],
+    'fill': True,  # Fill unmatched readings from neighbouring observations
+    'model_features': []  # Covariates appended to the forecasting features, e.g. ['outdoor_temperature']
+}
+
+# Opt-in tracing of app, dashboard, recommendation and model calls
+INSTRUMENTATION_CONFIG = {
+    'enabled': os.environ.get('EMS_TRACING') == '1',  # Also switchable from the admin Performance page
+    'trace_memory': True,  # Record peak allocations with tracemalloc (slows traced code down)
+    'export_path': os.path.join(BASE_DIR, 'traces', 'spans.jsonl'),  # OTLP JSON lines
+    'service_name': 'energy-dashboard',
+    'max_buffered_spans': 500,  # Export early when this many spans finish before their root
+    'max_bytes': 20 * 2 ** 20,  # Rotate the export file to spans.jsonl.1 past this size
+    'page_span_limit': 20000  # Most recent spans shown on the Performance page
 }
 
 # User credentials configuration
@@ -0,0 +1,114 @@
+import os
+import time
+import argparse
+import pandas as pd
+
+from config import CONTINUAL_CONFIG, FORECAST_CONFIG, MODEL_CONFIG, TRAINING_CONFIG
+from data_processor import load_readings
+from model_registry import ModelRegistry
+from training_orchestrator import _train_site, checkpoint_path, save_checkpoint, series_frames
+
+
+class ContinualTrainer:
+    """Keep per-site EnergyLSTM checkpoints current by fine-tuning on newly arrived readings
+
+    Only the windows ending after the last recorded version are trained on,
+    with the scaler fixed. If the new readings no longer fit that scaler
+    (or there is no model yet) the site is retrained from scratch instead.
+    Every update is recorded as a new version in the ModelRegistry.
+    """
+
+    def __init__(self, config=None, model_config=None, training_config=None, registry=None):
+        self.config = config if config is not None else CONTINUAL_CONFIG
+        self.model_config = model_config if model_config is not None else MODEL_CONFIG
+        self.training_config = training_config if training_config is not None else TRAINING_CONFIG
+        self.registry = registry if registry is not None else ModelRegistry(
+            self.config['registry_dir'], self.config['keep_versions']
+        )
+        self.checkpoint_dir = self.training_config['checkpoint_dir']
+
+    def _full_retrain(self, site, frame, drift=None):
+        result = _train_site(
+            site,
+            frame.to_numpy(dtype=float),
+            frame.index[-1].isoformat(),
+            self.model_config,
+            self.checkpoint_dir,
+            self.training_config
+        )
+        return self.registry.record(
+            site, result['path'], 'full', result['last_observed'],
+            windows=len(frame) - self.model_config['sequence_length'],
+            seconds=result['seconds'],
+            val_loss=result['val_loss'],
+            drift=drift
+        )
+
+    def update(self, site, frame, force_full=False):
+        """Bring one site's model up to date with its readings and return the new version
+
+        Returns None if there are no readings newer than the latest version.
+        force_full retrains from scratch regardless, e.g. when the accuracy
+        monitor flags the site.
+        """
+        from lstm_model import EnergyLSTM
+
+        path = checkpoint_path(self.checkpoint_dir, site)
+        latest = self.registry.latest(site)
+        if force_full or latest is None or not os.path.exists(path):
+            return self._full_retrain(site, frame)
+
+        new = frame[frame.index > pd.Timestamp(latest['trained_through'])]
+        if new.empty:
+            return None
+
+        model = EnergyLSTM.load(path)
+        drift = model.detect_drift(
+            new.to_numpy(dtype=float),
+            margin=self.config['range_margin'],
+            max_out_of_range=self.config['max_out_of_range'],
+            max_mean_shift=self.config['max_mean_shift']
+        )
+        if drift['drifted']:
+            return self._full_retrain(site, frame, drift)
+
+        # The preceding sequence_length readings give the first new reading a full input window
+        context = frame.iloc[-(len(new) + model.sequence_length):]
+        if len(context) <= model.sequence_length:
+            return None
+
+        started = time.perf_counter()
+        history, X = model.fine_tune(context.to_numpy(dtype=float), self.config['fine_tune_epochs'])
+        save_checkpoint(model, path, self.training_config, X, trained_through=frame.index[-1].isoformat())
+
+        return self.registry.record(
+            site, path, 'fine_tune', frame.index[-1].isoformat(),
+            windows=len(X),
+            seconds=time.perf_counter() - started,
+            loss=float(history.history['loss'][-1]),
+            drift=drift
+        )
+
+    def update_all(self, frames):
+        """Update every site with enough history and return the recorded versions"""
+        min_length = self.model_config['sequence_length'] + 2
+        versions = {}
+        for site, frame in frames.items():
+            if len(frame) < min_length:
+                continue
+            entry = self.update(site, frame)
+            if entry is not None:
+                versions[site] = entry
+        return versions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fine-tune EnergyLSTM checkpoints on new readings")
+    parser.add_argument('--by', choices=['site', 'zone'], default='site')
+    args = parser.parse_args()
+
+    trainer = ContinualTrainer()
+    frames = series_frames(load_readings(FORECAST_CONFIG['data_folder']), by=args.by)
+    for site, entry in trainer.update_all(frames).items():
+        print(f"{site}: v{entry['version']} ({entry['kind']}, {entry['windows']} windows) "
+              f"in {entry['seconds']:.1f}s")
@@ -0,0 +1,232 @@
+import os
+import json
+import hashlib
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+
+from config import COVARIATE_CONFIG
+
+JOINS = ('asof', 'interval')
+
+
+def _nanoseconds(values):
+    return pd.to_datetime(pd.Series(values)).to_numpy().astype('datetime64[ns]').astype(np.int64)
+
+
+def fill_gaps(matrix):
+    """Carry the last observed value of each column forward (then the first one back); all-NaN columns become 0"""
+    observed = ~np.isnan(matrix)
+    rows = np.arange(len(matrix))[:, None]
+    last = np.maximum.accumulate(np.where(observed, rows, -1), axis=0)
+    first = np.argmax(observed, axis=0)
+    source = np.where(last >= 0, last, first[None, :])
+    filled = np.take_along_axis(matrix, source, axis=0)
+    return np.nan_to_num(filled, nan=0.0)
+
+
+def _max_table(values):
+    """Sparse table of running maxima: table[k][i] = max(values[i:i + 2 ** k])"""
+    table = [values]
+    while 2 ** len(table) <= len(values):
+        width = 2 ** (len(table) - 1)
+        table.append(np.maximum(table[-1][:-width], table[-1][width:]))
+    return table
+
+
+def covering_spans(starts, ends, table, timestamps):
+    """Position of the latest-starting span with start <= t < end for each t, or -1
+
+    Spans are sorted by start. From the last span starting at or before t,
+    blocks of spans that all end by t are skipped by binary lifting over
+    the sparse table of ends, so a reading inside a long span is found
+    even when shorter spans started (and ended) after it.
+    """
+    position = np.searchsorted(starts, timestamps, 'right')  # Exclusive bound of candidate spans
+    for level in range(len(table) - 1, -1, -1):
+        width = 2 ** level
+        block = position - width
+        valid = block >= 0
+        skip = valid & (table[level][np.maximum(block, 0)] <= timestamps)
+        position = np.where(skip, block, position)
+    found = position - 1
+    covered = found >= 0
+    covered[covered] &= ends[found[covered]] > timestamps[covered]
+    return np.where(covered, found, -1)
+
+
+class CovariateFeed:
+    """One external covariate series, sorted by time, joined onto readings by binary search
+
+    'asof' feeds hold point observations (e.g. hourly weather): a reading
+    takes the latest observation at or before it, if no older than
+    tolerance. 'interval' feeds hold [start, end) spans (e.g. room
+    bookings): a reading takes the values of the span covering it, the
+    latest-starting one where covering spans overlap. Readings with no match
+    get NaN.
+    """
+
+    def __init__(self, name, columns, values, times=None, starts=None, ends=None, join='asof', tolerance=None):
+        if join not in JOINS:
+            raise ValueError(f"Unknown join '{join}' for covariate feed '{name}'")
+        self.name = name
+        self.columns = list(columns)
+        self.join = join
+        self.tolerance = None if tolerance is None else pd.Timedelta(tolerance).value
+        keys = times if join == 'asof' else starts
+        order = np.argsort(keys, kind='stable')
+        self.values = np.asarray(values, dtype=np.float64)[order]
+        self.times = None if times is None else np.asarray(times)[order]
+        self.starts = None if starts is None else np.asarray(starts)[order]
+        self.ends = None if ends is None else np.asarray(ends)[order]
+        self._ends_table = _max_table(self.ends) if join == 'interval' and len(self.ends) else None
+
+    @classmethod
+    def from_frame(cls, name, df, spec):
+        """Feed of a frame of covariates described by a COVARIATE_CONFIG feed spec"""
+        join = spec.get('join', 'asof')
+        values = df[spec['columns']].to_numpy(dtype=np.float64)
+        if join == 'interval':
+            return cls(name, spec['columns'], values, starts=_nanoseconds(df[spec['start_column']]),
+                       ends=_nanoseconds(df[spec['end_column']]), join=join)
+        return cls(name, spec['columns'], values, times=_nanoseconds(df[spec.get('time_column', 'timestamp')]),
+                   join=join, tolerance=spec.get('tolerance'))
+
+    @classmethod
+    def load(cls, spec, base_dir):
+        """Read a local CSV or Parquet feed"""
+        path = os.path.join(base_dir, spec['path'])
+        if path.endswith('.parquet'):
+            df = pd.read_parquet(path)
+        else:
+            df = pd.read_csv(path)
+        return cls.from_frame(spec['name'], df, spec)
+
+    def align(self, timestamps):
+        """(readings, columns) covariate values of each reading timestamp (int64 ns, any order)"""
+        if len(self.values) == 0:
+            return np.full((len(timestamps), len(self.columns)), np.nan)
+        if self.join == 'asof':
+            index = np.searchsorted(self.times, timestamps, 'right') - 1
+            matched = index >= 0
+            index = np.maximum(index, 0)
+            if self.tolerance is not None:
+                matched &= timestamps - self.times[index] <= self.tolerance
+        else:
+            index = covering_spans(self.starts, self.ends, self._ends_table, timestamps)
+            matched = index >= 0
+            index = np.maximum(index, 0)
+        return np.where(matched[:, None], self.values[index], np.nan)
+
+
+class CovariatePipeline:
+    """Loads the configured covariate feeds and aligns them to reading timestamps
+
+    Aligned matrices are cached in memory and as .npy files under cache_dir,
+    keyed by the reading timestamps and the feeds' file versions, so models
+    re-trained on the same readings reuse them. Both caches keep only the
+    cache_entries most recently used matrices; as readings grow, the
+    matrices of earlier timestamp sets age out.
+    """
+
+    def __init__(self, config=None):
+        self.config = config if config is not None else COVARIATE_CONFIG
+        self._feeds = {}  # name -> (file version, CovariateFeed)
+        self._aligned = OrderedDict()
+
+    def _specs(self):
+        """Feed specs whose file exists"""
+        return [spec for spec in self.config['feeds']
+                if os.path.exists(os.path.join(self.config['dir'], spec['path']))]
+
+    def _file_version(self, spec):
+        stat = os.stat(os.path.join(self.config['dir'], spec['path']))
+        return f"{spec['path']}:{stat.st_size}:{stat.st_mtime_ns}"
+
+    def feed(self, spec):
+        """Parsed feed, re-read only when its file changes"""
+        version = self._file_version(spec)
+        cached = self._feeds.get(spec['name'])
+        if cached is None or cached[0] != version:
+            cached = (version, CovariateFeed.load(spec, self.config['dir']))
+            self._feeds[spec['name']] = cached
+        return cached[1]
+
+    @property
+    def columns(self):
+        return [column for spec in self._specs() for column in spec['columns']]
+
+    def _key(self, timestamps, specs):
+        digest = hashlib.sha1(np.ascontiguousarray(timestamps).tobytes())
+        digest.update(json.dumps([[spec, self._file_version(spec)] for spec in specs], sort_keys=True).encode())
+        digest.update(str(self.config.get('fill', True)).encode())
+        return digest.hexdigest()[:16]
+
+    def align(self, timestamps):
+        """DataFrame of every configured covariate column for the given reading timestamps
+
+        Gaps are filled from the neighbouring observations when
+        COVARIATE_CONFIG['fill'] is set, so the matrix can go straight to a model.
+        """
+        index = pd.DatetimeIndex(pd.to_datetime(pd.Series(timestamps)))
+        timestamps = index.to_numpy().astype('datetime64[ns]').astype(np.int64)
+        specs = self._specs()
+        columns = [column for spec in specs for column in spec['columns']]
+        if not specs:
+            return pd.DataFrame(index=index)
+
+        key = self._key(timestamps, specs)
+        matrix = self._aligned.get(key)
+        cache_path = os.path.join(self.config['cache_dir'], f'{key}.npy')
+        if matrix is None and os.path.exists(cache_path):
+            matrix = np.load(cache_path)
+            os.utime(cache_path)  # Most recently used entries survive pruning
+        if matrix is None:
+            matrix = np.hstack([self.feed(spec).align(timestamps) for spec in specs])
+            if self.config.get('fill', True):
+                matrix = fill_gaps(matrix)
+            os.makedirs(self.config['cache_dir'], exist_ok=True)
+            tmp_path = f'{cache_path}.tmp.npy'
+            np.save(tmp_path, matrix)
+            os.replace(tmp_path, cache_path)
+            self._prune()
+        self._aligned[key] = matrix
+        self._aligned.move_to_end(key)
+        while len(self._aligned) > self.config['cache_entries']:
+            self._aligned.popitem(last=False)
+        return pd.DataFrame(matrix, index=index, columns=columns)
+
+    def _prune(self):
+        """Delete all but the cache_entries most recently used matrices on disk"""
+        cache_dir = self.config['cache_dir']
+        paths = [os.path.join(cache_dir, name) for name in os.listdir(cache_dir)
+                 if name.endswith('.npy') and not name.endswith('.tmp.npy')]
+        paths.sort(key=os.path.getmtime, reverse=True)
+        for path in paths[self.config['cache_entries']:]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass  # Pruned by another process
+
+    def join(self, frame, columns=None):
+        """Frame indexed by timestamp with the given covariate columns appended (default: the model features)"""
+        columns = columns if columns is not None else self.config['model_features']
+        if not columns:
+            return frame
+        aligned = self.align(frame.index)
+        missing = [column for column in columns if column not in aligned.columns]
+        if missing:
+            raise ValueError(f"Covariate column(s) {missing} are not provided by any available feed")
+        aligned.index = frame.index
+        return pd.concat([frame, aligned[columns]], axis=1)
+
+
+_pipeline = None
+
+
+def default_pipeline():
+    """Process-wide pipeline over COVARIATE_CONFIG, so parsed feeds and aligned matrices are shared"""
+    global _pipeline
+    if _pipeline is None:
+        _pipeline = CovariatePipeline()
+    return _pipeline
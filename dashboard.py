@@ -4,10 +4,87 @@ import pandas as pd
 import numpy as np
 import streamlit as st
 
+from calendar_features import DAY_NAMES, TOU_OFFPEAK, TOU_PEAK, add_calendar_columns
+from config import ALERT_CONFIG, BUDGET_CONFIG, TARIFF_CONFIG
+from downsampling import downsample
+from figure_cache import cached_figure, data_version, window_version
+from instrumentation import traced
+from heatmap_cube import HeatmapCube
+from prefix_index import PrefixIndex
+from efficiency import EfficiencyScores
+from alerting import AlertEngine, JsonlAlertSink
+from budget import BudgetTracker
+from baseline_model import BaselineModel
+from data_processor import extract_zone_readings
+from query_plan import Query, QueryEngine
+
+TIME_FRAME_FREQ = {"Daily": 'D', "Weekly": 'W', "Monthly": 'M', "Yearly": 'Y'}
+
+# Aggregations behind the dashboard metrics and panels. They are registered
+# with the QueryEngine together, so a page is computed in one pass over the readings.
+PEAK_RATE = TARIFF_CONFIG['peak_rate']  # ₹ per kWh
+OFFPEAK_RATE = TARIFF_CONFIG['offpeak_rate']
+TOTALS = Query().agg(
+    total_consumption=('total_consumption', 'sum'),
+    avg_occupancy=('occupancy_level', 'mean')
+)
+DAILY = Query().group_by('date').agg(
+    total=('total_consumption', 'sum'),
+    mean=('total_consumption', 'mean')
+)
+HOURLY = Query().group_by('hour').agg(
+    mean=('total_consumption', 'mean'),
+    tou_band=('tou_band', 'max')
+)
+BY_OCCUPANCY = Query().group_by('occupancy_level').agg(consumption=('total_consumption', 'mean'))
+DASHBOARD_QUERIES = (TOTALS, DAILY, HOURLY, BY_OCCUPANCY)
+# Shared equipment per band; collected on demand, as not every frame carries equipment columns
+EQUIPMENT_BY_BAND = Query().group_by('tou_band').agg(
+    computer=('computer_consumption', 'sum'),
+    projector=('projector_consumption', 'sum')
+)
+
+# Aggregations over the floor_data lists flattened to one row per reading and
+# zone, registered together with the engine over that frame (zone_queries())
+ZONE_COLUMNS = ('zone', 'fan_consumption', 'light_consumption', 'total_floor_consumption')
+BY_ZONE = Query().group_by('zone').agg(
+    total=('total_floor_consumption', 'sum'),
+    fan=('fan_consumption', 'sum'),
+    light=('light_consumption', 'sum')
+)
+BY_ZONE_BAND = Query().group_by('zone', 'tou_band').agg(
+    total=('total_floor_consumption', 'sum'),
+    fan=('fan_consumption', 'sum'),
+    light=('light_consumption', 'sum')
+)
+ZONE_QUERIES = (BY_ZONE, BY_ZONE_BAND)
+
 class DashboardComponents:
-    def __init__(self, df, theme_colors=None):
-        self.df = df.copy()
+    def __init__(self, df, theme_colors=None, figure_cache=None, store=None, prefix=None, efficiency=None,
+                 budget=None, site=None, baseline=None, source_version=None):
+        # With a FigureCache the figure builders return cached Plotly JSON dicts
+        self.figure_cache = figure_cache
+        # With a TimeSeriesStore the long-range charts aggregate the on-disk history instead of df
+        self.store = store
+        # PrefixIndex of the readings df is a contiguous time slice of; range totals become lookups
+        self.prefix = prefix
+        # EfficiencyScores of the same history; the dashboard's scores are a slice of it
+        self.efficiency = efficiency
+        self._efficiency_window = None
+        # BudgetTracker holding this site's cost ledger; built from df when not given
+        self.budget = budget
+        self.site = site if site is not None else BUDGET_CONFIG['default_site']
+        # BaselineModel of the history; fitted from df when not given
+        self.baseline = baseline
+        # Version of the dataset df is a contiguous window of (SharedDataset.version); keys cached figures
+        self.source_version = source_version
+        self._data_version = None
+        self.df = df.copy(deep=False)  # Copy-on-write: columns are only copied if written
         self.df['timestamp'] = pd.to_datetime(self.df['timestamp'])  # Add this line
+        if 'tou_band' not in self.df.columns:
+            add_calendar_columns(self.df)  # Normally materialized at ingest
+        self.queries = QueryEngine(self.df).register(*DASHBOARD_QUERIES)
+        self._zone_queries = None
         self.colors = theme_colors if theme_colors is not None else {
             'primary': '#1f77b4',
             'secondary': '#ff7f0e',
@@ -15,6 +92,40 @@ class DashboardComponents:
             'quaternary': '#d62728'
         }
 
+    @property
+    def data_version(self):
+        """Fingerprint of the readings behind this dashboard, computed once"""
+        if self._data_version is None:
+            if self.source_version is not None:
+                self._data_version = window_version(self.source_version, self.df)
+            else:
+                self._data_version = data_version(self.df)
+            if self.store is not None:
+                self._data_version += f'@{self.store.version}'
+        return self._data_version
+
+    def _resample(self, freq, how):
+        """total_consumption per period over the dashboard's date range"""
+        if self.store is not None:
+            start = self.df['timestamp'].min() if not self.df.empty else None
+            end = self.df['timestamp'].max() if not self.df.empty else None
+            return self.store.resample('total_consumption', freq, how, start, end)
+        return getattr(self.df.resample(freq, on='timestamp')['total_consumption'], how)()
+
+    def zone_queries(self):
+        """QueryEngine over the readings flattened to one row per reading and zone, built on first use"""
+        if self._zone_queries is None:
+            keys = ['timestamp', 'tou_band']
+            zones = extract_zone_readings(self.df, keys=keys).reindex(columns=keys + list(ZONE_COLUMNS))
+            self._zone_queries = QueryEngine(zones).register(*ZONE_QUERIES)
+        return self._zone_queries
+
+    @staticmethod
+    def _tou_cost(consumption):
+        """Cost in ₹ of consumption (Watt-hour) indexed by time-of-use band, each band at its own rate"""
+        bands = consumption.index.get_level_values('tou_band')
+        return float((consumption * np.where(bands == TOU_PEAK, PEAK_RATE, OFFPEAK_RATE)).sum()) / 1000
+
     # Rest of the class methods remain unchanged
     # def create_consumption_timeline(self):
     #     """Create interactive timeline of energy consumption"""
@@ -38,21 +149,22 @@ class DashboardComponents:
         
     #     return fig
 
-    def create_consumption_timeline(self, time_frame="Daily"):
-        """Create interactive timeline of energy consumption with adjustable time frame."""
-        if time_frame == "Weekly":
-            df_resampled = self.df.resample('W', on='timestamp').sum()
-        elif time_frame == "Monthly":
-            df_resampled = self.df.resample('M', on='timestamp').sum()
-        elif time_frame == "Yearly":
-            df_resampled = self.df.resample('Y', on='timestamp').sum()
-        else:  # Default to daily
-            df_resampled = self.df.resample('D', on='timestamp').sum()
+    @traced()
+    @cached_figure
+    def create_consumption_timeline(self, time_frame="Daily", x_range=None, max_points=None):
+        """Create interactive timeline of energy consumption with adjustable time frame.
+
+        The series is downsampled to max_points; pass the zoomed x_range to
+        re-query that window at full resolution.
+        """
+        consumption = self._resample(TIME_FRAME_FREQ.get(time_frame, 'D'), 'sum')
         
+        x, y = downsample(consumption.index, consumption,
+                          max_points=max_points, x_range=x_range)
         fig = go.Figure()
         fig.add_trace(go.Scatter(
-            x=df_resampled.index,
-            y=df_resampled['total_consumption'],
+            x=x,
+            y=y,
             mode='lines',
             name='Total Consumption',
             line=dict(color=self.colors['primary'])
@@ -68,6 +180,8 @@ class DashboardComponents:
 
         return fig
 
+    @traced()
+    @cached_figure
     def plot_consumption_trend(self, time_frame="Daily"):
         """
         Plots energy consumption trend based on the selected time frame.
@@ -78,20 +192,10 @@ class DashboardComponents:
         Returns:
             fig (plotly.graph_objs._figure.Figure): Plotly figure for energy consumption trend
         """
-        # Ensure timestamp is datetime
-        self.df['timestamp'] = pd.to_datetime(self.df['timestamp'])
-        
         # Resample data based on selected time frame
-        if time_frame == "Daily":
-            df_resampled = self.df.resample('D', on='timestamp').sum()
-        elif time_frame == "Weekly":
-            df_resampled = self.df.resample('W', on='timestamp').sum()
-        elif time_frame == "Monthly":
-            df_resampled = self.df.resample('M', on='timestamp').sum()
-        elif time_frame == "Yearly":
-            df_resampled = self.df.resample('Y', on='timestamp').sum()
-        else:
+        if time_frame not in TIME_FRAME_FREQ:
             raise ValueError("Invalid time frame. Choose from 'Daily', 'Weekly', 'Monthly', or 'Yearly'.")
+        df_resampled = self._resample(TIME_FRAME_FREQ[time_frame], 'sum').to_frame()
 
         # Plot the resampled data
         fig = px.line(
@@ -110,24 +214,22 @@ class DashboardComponents:
 
         return fig
 
-    def plot_peak_consumption(self, time_frame="Daily"):
-        """Plot peak consumption over a specified time frame."""
-        # Filter for numeric columns
-        numeric_df = self.df.set_index('timestamp').select_dtypes(include=[np.number])
+    @traced()
+    @cached_figure
+    def plot_peak_consumption(self, time_frame="Daily", x_range=None, max_points=None):
+        """Plot peak consumption over a specified time frame.
 
-        if time_frame == "Weekly":
-             df_resampled = numeric_df.resample('W').max()
-        elif time_frame == "Monthly":
-            df_resampled = numeric_df.resample('M').max()
-        elif time_frame == "Yearly":
-           df_resampled = numeric_df.resample('Y').max()
-        else:  # Default to daily
-            df_resampled = numeric_df.resample('D').max()
+        Long series are cut to max_points with min/max buckets so that no
+        peak is lost; x_range re-queries a zoomed window at full resolution.
+        """
+        peaks = self._resample(TIME_FRAME_FREQ.get(time_frame, 'D'), 'max')
         
+        x, y = downsample(peaks.index, peaks,
+                          max_points=max_points, method='minmax', x_range=x_range)
         fig = go.Figure()
         fig.add_trace(go.Scatter(
-            x=df_resampled.index,
-            y=df_resampled['total_consumption'],
+            x=x,
+            y=y,
             mode='lines+markers',
             name='Peak Consumption',
             line=dict(color=self.colors['tertiary'])
@@ -143,26 +245,18 @@ class DashboardComponents:
         return fig
 
 
+    @traced()
+    @cached_figure
     def plot_monthly_trend(self, time_frame="Daily"):
         """Create consumption trend based on the selected time frame"""
         
-        # Set numeric columns and index
-        numeric_df = self.df.set_index('timestamp').select_dtypes(include=[np.number])
-        
         # Resample data based on the time frame
-        if time_frame == "Weekly":
-            df_resampled = numeric_df.resample('W').sum()  # Summing up weekly consumption
-        elif time_frame == "Monthly":
-            df_resampled = numeric_df.resample('M').sum()  # Summing up monthly consumption
-        elif time_frame == "Yearly":
-            df_resampled = numeric_df.resample('Y').sum()  # Summing up yearly consumption
-        else:  # Default to daily
-            df_resampled = numeric_df.resample('D').sum()  # Summing up daily consumption
+        consumption = self._resample(TIME_FRAME_FREQ.get(time_frame, 'D'), 'sum')
         
         # Create the figure based on the resampled data
         fig = go.Figure(data=go.Bar(
-            x=df_resampled.index,
-            y=df_resampled['total_consumption'],  # Adjust according to your column name
+            x=consumption.index,
+            y=consumption,
             marker_color=self.colors['primary']
         ))
         
@@ -176,26 +270,37 @@ class DashboardComponents:
         
         return fig
 
-    def create_heatmap(self):
-        """Create hourly consumption heatmap"""
-        # Pivot data for heatmap
-        heatmap_data = self.df.pivot_table(
-            values='total_consumption',
-            index=self.df['timestamp'].dt.day_name(),
-            columns=self.df['timestamp'].dt.hour,
-            aggfunc='mean'
-        )
+    @traced()
+    @cached_figure
+    def create_heatmap(self, zone=None):
+        """Create hourly consumption heatmap
+
+        Rendered from the hour-of-week cube kept with the time-series store
+        (restricted to the dashboard's dates), or from a cube of df. A zone
+        selects that zone's slice of the store's per-zone cube.
+        """
+        if self.store is not None and len(self.store):
+            cube = self.store.heatmap_cube()
+            start = self.df['timestamp'].min() if not self.df.empty else None
+            end = self.df['timestamp'].max() if not self.df.empty else None
+            heatmap_data = cube.means(start, end, zones=zone is not None)
+            if zone is not None:
+                heatmap_data = heatmap_data[:, :, self.store.zones.index(zone)]
+        elif zone is not None:
+            raise ValueError("Per-zone heatmaps need the time-series store")
+        else:
+            heatmap_data = HeatmapCube.from_frame(self.df).means()
         
         fig = go.Figure(data=go.Heatmap(
-            z=heatmap_data.values,
-            x=heatmap_data.columns,
-            y=heatmap_data.index,
+            z=heatmap_data,
+            x=list(range(24)),
+            y=list(DAY_NAMES),
             colorscale='Blues',
             hoverongaps=False
         ))
         
         fig.update_layout(
-            title='Hourly Consumption Patterns',
+            title='Hourly Consumption Patterns' if zone is None else f'Hourly Consumption Patterns ({zone})',
             xaxis_title='Hour of Day',
             yaxis_title='Day of Week',
             template='plotly_white'
@@ -203,6 +308,7 @@ class DashboardComponents:
         
         return fig
 
+    @traced()
     def create_equipment_breakdown(self, equipment_data):
         """Create equipment consumption breakdown"""
         fig = go.Figure(data=[go.Pie(
@@ -222,48 +328,37 @@ class DashboardComponents:
         
         return fig
 
+    @traced()
+    @cached_figure
     def create_floor_comparison(self):
         """Create improved floor-wise consumption comparison"""
         # Aggregate floor-wise consumption
-        floor_data = {}
-        
-        for _, row in self.df.iterrows():
-            for floor in row['floor_data']:
-                floor_name = floor['floor']
-                if floor_name not in floor_data:
-                    floor_data[floor_name] = {
-                        'total': 0,
-                        'fan': 0,
-                        'light': 0
-                    }
-                floor_data[floor_name]['total'] += floor['total_floor_consumption']
-                floor_data[floor_name]['fan'] += floor['fan_consumption']
-                floor_data[floor_name]['light'] += floor['light_consumption']
+        floor_data = self.zone_queries().collect(BY_ZONE)
         
         # Create grouped bar chart
         fig = go.Figure()
         
         # Add bars for each consumption type
-        floors = list(floor_data.keys())
+        floors = floor_data.index.tolist()
         
         fig.add_trace(go.Bar(
             name='Total Consumption',
             x=floors,
-            y=[floor_data[floor]['total'] for floor in floors],
+            y=floor_data['total'].tolist(),
             marker_color=self.colors['primary']
         ))
         
         fig.add_trace(go.Bar(
             name='Fan Consumption',
             x=floors,
-            y=[floor_data[floor]['fan'] for floor in floors],
+            y=floor_data['fan'].tolist(),
             marker_color=self.colors['secondary']
         ))
         
         fig.add_trace(go.Bar(
             name='Light Consumption',
             x=floors,
-            y=[floor_data[floor]['light'] for floor in floors],
+            y=floor_data['light'].tolist(),
             marker_color=self.colors['tertiary']
         ))
         
@@ -285,21 +380,12 @@ class DashboardComponents:
         
         return fig
 
+    @traced()
+    @cached_figure
     def create_occupancy_correlation(self):
         """Create improved occupancy vs consumption visualization"""
-        # Prepare data
-        df_hourly = pd.DataFrame({
-            'timestamp': self.df['timestamp'],
-            'occupancy': self.df['occupancy_level'],
-            'consumption': self.df['total_consumption'],
-            'hour': self.df['timestamp'].dt.hour,
-            'day': self.df['timestamp'].dt.date
-        })
-        
         # Calculate average consumption for different occupancy levels
-        occupancy_consumption = df_hourly.groupby('occupancy').agg({
-            'consumption': 'mean'
-        }).reset_index()
+        occupancy_consumption = self.queries.collect(BY_OCCUPANCY).rename_axis('occupancy').reset_index()
         
         # Create scatter plot with trend line
         fig = go.Figure()
@@ -319,16 +405,16 @@ class DashboardComponents:
             )
         ))
         
-        # Add trend line
-        z = np.polyfit(occupancy_consumption['occupancy'], 
-                       occupancy_consumption['consumption'], 1)
-        p = np.poly1d(z)
+        # Add the baseline model's expected consumption, other features held at their mean
+        model = self.baseline_model()
+        features = np.tile(np.nanmean(model.design(self.df), axis=0), (len(occupancy_consumption), 1))
+        features[:, model.features.index('occupancy_level')] = occupancy_consumption['occupancy']
         
         fig.add_trace(go.Scatter(
             x=occupancy_consumption['occupancy'],
-            y=p(occupancy_consumption['occupancy']),
+            y=model.predict(features)[:, 0],
             mode='lines',
-            name='Trend Line',
+            name='Baseline',
             line=dict(color='red', dash='dash')
         ))
         
@@ -354,8 +440,9 @@ class DashboardComponents:
             occupancy_consumption['consumption']
         )
         
+        per_point = model.coefficients()[0, 1 + model.features.index('occupancy_level')]
         fig.add_annotation(
-            text=f'Correlation: {correlation:.2f}',
+            text=f'Correlation: {correlation:.2f}<br>Baseline: {per_point:+.1f} Wh per occupancy point',
             xref="paper", yref="paper",
             x=0.02, y=0.98,
             showarrow=False,
@@ -390,21 +477,31 @@ class DashboardComponents:
         
         return fig
 
-    def create_prediction_plot(self, actual, predicted, dates):
-        """Create prediction comparison plot"""
+    @traced()
+    def create_prediction_plot(self, actual, predicted, dates, forecast_dates=None, max_points=None):
+        """Create prediction comparison plot
+
+        When forecast_dates is given the predictions are plotted on those
+        (future) timestamps instead of sharing the actual dates. Both series
+        are downsampled to max_points.
+        """
+        actual_x, actual_y = downsample(dates, actual, max_points=max_points)
+        predicted_x, predicted_y = downsample(
+            dates if forecast_dates is None else forecast_dates, predicted, max_points=max_points
+        )
         fig = go.Figure()
         
         fig.add_trace(go.Scatter(
-            x=dates,
-            y=actual,
+            x=actual_x,
+            y=actual_y,
             mode='lines',
             name='Actual',
             line=dict(color=self.colors['primary'])
         ))
         
         fig.add_trace(go.Scatter(
-            x=dates,
-            y=predicted,
+            x=predicted_x,
+            y=predicted_y,
             mode='lines',
             name='Predicted',
             line=dict(color=self.colors['secondary'])
@@ -420,6 +517,37 @@ class DashboardComponents:
         
         return fig
 
+    @traced()
+    def create_error_plot(self, errors, backtest_mae=None):
+        """Create live forecast error plot, one point per scored forecast run"""
+        fig = go.Figure()
+
+        fig.add_trace(go.Scatter(
+            x=errors['last_observed'],
+            y=errors['mae'],
+            mode='lines+markers',
+            name='Live MAE',
+            line=dict(color=self.colors['primary'])
+        ))
+
+        if backtest_mae is not None:
+            fig.add_hline(
+                y=backtest_mae,
+                line_dash='dash',
+                line_color=self.colors['quaternary'],
+                annotation_text='Backtest MAE'
+            )
+
+        fig.update_layout(
+            title='Forecast Error',
+            xaxis_title='Forecast Origin',
+            yaxis_title='MAE (Watt-hour)',
+            template='plotly_white',
+            hovermode='x unified'
+        )
+
+        return fig
+
     # def get_summary_metrics(self):
     #     """Calculate and return summary metrics"""
     #     total_consumption = self.df['total_consumption'].sum()
@@ -436,106 +564,69 @@ class DashboardComponents:
     
     def display_cost_analysis(self):
         """Display cost analysis"""
-        total_consumption = self.df['total_consumption'].sum()
+        total_consumption = self.queries.collect(TOTALS)['total_consumption']
         total_cost = total_consumption * 0.12  # Assuming cost per Watt-hour
         st.write(f"Total Consumption: {total_consumption / 1000:.2f} kWh")
         st.write(f"Total Cost: ${total_cost:.2f}")
 
+    @traced()
     def get_summary_metrics(self):
-        """Calculate and return summary metrics for the dashboard"""
-        try:
-            # Calculate total consumption
-            total_consumption = self.df['total_consumption'].sum()
-            
-            # Calculate daily average consumption
-            daily_consumption = self.df.groupby(
-                self.df['timestamp'].dt.date
-            )['total_consumption'].sum().mean()
-            
-            # Calculate total cost (using peak/off-peak rates)
-            peak_hours = range(9, 18)  # 9 AM to 6 PM
-            peak_consumption = self.df[
-                self.df['timestamp'].dt.hour.isin(peak_hours)
-            ]['total_consumption'].sum()
-            offpeak_consumption = self.df[
-                ~self.df['timestamp'].dt.hour.isin(peak_hours)
-            ]['total_consumption'].sum()
-            total_cost = (peak_consumption * 8 + offpeak_consumption * 6) / 1000  # Convert to kWh
-            
-            # Calculate average occupancy
-            avg_occupancy = self.df['occupancy_level'].mean()
-            
-            return {
-                'total_consumption': total_consumption,
-                'avg_daily_consumption': daily_consumption,
-                'total_cost': total_cost,
-                'avg_occupancy': avg_occupancy,
-                'peak_consumption': peak_consumption,
-                'offpeak_consumption': offpeak_consumption
-            }
-        except Exception as e:
-            st.error(f"Error calculating summary metrics: {str(e)}")
-            return {
-                'total_consumption': 0,
-                'avg_daily_consumption': 0,
-                'total_cost': 0,
-                'avg_occupancy': 0,
-                'peak_consumption': 0,
-                'offpeak_consumption': 0
-            }
+        """Calculate and return summary metrics for the dashboard
+
+        Runs on the data layer's pool; errors propagate to the page, which reports them.
+        """
+        totals = self.range_totals()
+
+        # Calculate total consumption
+        total_consumption = totals['total_consumption']
+        
+        # Calculate daily average consumption
+        daily_consumption = self.queries.collect(DAILY)['total'].mean()
+        
+        # Calculate total cost (using peak/off-peak rates)
+        peak_consumption, offpeak_consumption = totals['peak_consumption'], totals['offpeak_consumption']
+        total_cost = (peak_consumption * PEAK_RATE + offpeak_consumption * OFFPEAK_RATE) / 1000  # Convert to kWh
+        
+        # Calculate average occupancy
+        avg_occupancy = totals['avg_occupancy']
+        
+        return {
+            'total_consumption': total_consumption,
+            'avg_daily_consumption': daily_consumption,
+            'total_cost': total_cost,
+            'avg_occupancy': avg_occupancy,
+            'peak_consumption': peak_consumption,
+            'offpeak_consumption': offpeak_consumption
+        }
+
+    def efficiency_scores(self):
+        """EfficiencyScores of the dashboard's readings, sliced from the shared history when there is one"""
+        if self._efficiency_window is None:
+            if self.efficiency is None or self.df.empty:
+                self._efficiency_window = EfficiencyScores.from_frame(self.df)
+            else:
+                self._efficiency_window = self.efficiency.window(self.df['timestamp'].iloc[0], self.df['timestamp'].iloc[-1])
+        return self._efficiency_window
+
     def calculate_efficiency_score(self):
         """Calculate energy efficiency score based on multiple metrics"""
         try:
-            latest_data = self.df.iloc[-1]  # Get most recent data point
-            
-            score = 100
-            metrics = {}
-            
-            # 1. Occupancy Efficiency (30 points)
-            per_person_consumption = latest_data['total_consumption'] / latest_data['occupancy_level']
-            metrics['occupancy_score'] = min(30, (30 * (1000 / per_person_consumption)))
-            
-            # 2. Peak Load Efficiency (20 points)
-            peak_load_ratio = latest_data['total_consumption'] / latest_data['peak_load']
-            metrics['peak_load_score'] = 20 * peak_load_ratio
-            
-            # 3. Equipment Utilization (20 points)
-            floor_data = latest_data['floor_data'] if isinstance(latest_data['floor_data'], list) else []
-            total_equipment = sum(
-                floor.get('fan_consumption', 0) + floor.get('light_consumption', 0) 
-                for floor in floor_data
-            )
-            equipment_ratio = total_equipment / latest_data['total_consumption']
-            metrics['equipment_score'] = 20 * (1 - equipment_ratio)
-            
-            # 4. Temperature Optimization (15 points)
-            optimal_temp = 22
-            temp_diff = abs(latest_data['temperature'] - optimal_temp)
-            metrics['temperature_score'] = 15 * (1 - (temp_diff / 10))
-            
-            # 5. Time-based Usage (15 points)
-            time_scores = {
-                "Morning": 15,
-                "Afternoon": 10,
-                "Evening": 5
-            }
-            metrics['time_score'] = time_scores.get(latest_data['time_of_day'], 5)
-            
-            # Calculate final score
-            final_score = sum(metrics.values())
-            final_score = max(0, min(100, round(final_score)))
-            
-            return final_score, metrics
+            # Occupancy (30), peak load (20), equipment (20), temperature (15)
+            # and time-of-day (15) points of the most recent reading
+            return self.efficiency_scores().latest()
             
         except Exception as e:
             st.error(f"Error calculating efficiency score: {str(e)}")
             return 0, {}
 
-    def create_efficiency_gauge(self, score):
-        """Create an efficiency gauge visualization"""
+    @traced()
+    @cached_figure
+    def create_efficiency_gauge(self, score, reference=None):
+        """Create an efficiency gauge visualization, with the change from reference when given"""
         fig = go.Figure(go.Indicator(
-            mode="gauge+number",
+            mode="gauge+number" if reference is None else "gauge+number+delta",
             value=score,
+            delta=None if reference is None else {'reference': reference},
             domain={'x': [0, 1], 'y': [0, 1]},
             gauge={
                 'axis': {'range': [0, 100]},
@@ -562,6 +653,36 @@ class DashboardComponents:
         
         return fig
 
+    @traced()
+    @cached_figure
+    def plot_efficiency_trend(self, freq=None):
+        """Mean efficiency score per period, with the band between its 10th and 90th percentiles"""
+        trend = self.efficiency_scores().trend(freq)
+        fig = go.Figure()
+        fig.add_trace(go.Scatter(
+            x=trend.index, y=trend['p90'], mode='lines', line=dict(width=0),
+            showlegend=False, hoverinfo='skip'
+        ))
+        fig.add_trace(go.Scatter(
+            x=trend.index, y=trend['p10'], mode='lines', line=dict(width=0),
+            fill='tonexty', fillcolor='rgba(100, 149, 237, 0.2)', name='10th-90th percentile'
+        ))
+        fig.add_trace(go.Scatter(
+            x=trend.index, y=trend['mean'], mode='lines', name='Mean Score',
+            line=dict(color=self.colors['primary'])
+        ))
+
+        fig.update_layout(
+            title='Efficiency Score Trend',
+            xaxis_title='Time',
+            yaxis_title='Score',
+            yaxis_range=[0, 100],
+            template='plotly_white',
+            hovermode='x unified'
+        )
+
+        return fig
+
     def display_efficiency_metrics(self, metrics):
         """Display detailed breakdown of efficiency metrics"""
         col1, col2 = st.columns(2)
@@ -636,23 +757,49 @@ class DashboardComponents:
 
     def calculate_total_cost(self):
         """Calculate total energy cost"""
-        # Using standard rates: Peak (₹8/kWh), Off-peak (₹6/kWh)
-        peak_hours = range(9, 18)  # 9 AM to 6 PM
-        
-        peak_consumption = self.df[
-            self.df['timestamp'].dt.hour.isin(peak_hours)
-        ]['total_consumption'].sum()
+        # Using the tariff's peak and off-peak rates
+        peak_consumption, offpeak_consumption = self._tou_consumption()
         
-        offpeak_consumption = self.df[
-            ~self.df['timestamp'].dt.hour.isin(peak_hours)
-        ]['total_consumption'].sum()
-        
-        total_cost = (peak_consumption * 8 + offpeak_consumption * 6) / 1000  # Convert to kWh
+        total_cost = (peak_consumption * PEAK_RATE + offpeak_consumption * OFFPEAK_RATE) / 1000  # Convert to kWh
         return total_cost
 
+    def _tou_consumption(self):
+        """Total consumption in the peak and off-peak bands"""
+        totals = self.range_totals()
+        return totals['peak_consumption'], totals['offpeak_consumption']
+
+    def range_totals(self, start=None, end=None, floors=False):
+        """Consumption totals between start and end, clipped to the dashboard's dates
+
+        Each total is two lookups in the prefix index, so any range costs the
+        same over any history length. Without a shared index one is built
+        from df on first use. With floors=True the result also holds
+        {floor: (total, peak)} sums of total_floor_consumption.
+        """
+        if self.df.empty:
+            return {'total_consumption': 0, 'peak_consumption': 0, 'offpeak_consumption': 0,
+                    'avg_occupancy': np.nan, 'readings': 0, 'floors': {}}
+        first, last = self.df['timestamp'].iloc[0], self.df['timestamp'].iloc[-1]
+        start = first if start is None else max(pd.Timestamp(start), first)
+        end = last if end is None else min(pd.Timestamp(end), last)
+
+        if self.prefix is None or (floors and 'zone.total_floor_consumption' not in self.prefix.sums):
+            self.prefix = PrefixIndex.from_frame(self.df, zone_metrics=['total_floor_consumption'] if floors else [])
+        peak, offpeak = self.prefix.split('total_consumption', start, end)
+        readings = self.prefix.count(start, end)
+        occupancy = self.prefix.total('occupancy_level', start, end) if 'occupancy_level' in self.prefix.sums else np.nan
+        return {
+            'total_consumption': peak + offpeak,
+            'peak_consumption': peak,
+            'offpeak_consumption': offpeak,
+            'avg_occupancy': occupancy / readings if readings else np.nan,
+            'readings': readings,
+            'floors': self.prefix.zone_split('total_floor_consumption', start, end) if floors else {}
+        }
+
     def calculate_cost_change(self):
         """Calculate percentage change in cost compared to previous period"""
-        current_period = self.df['total_consumption'].sum()
+        current_period = self.queries.collect(TOTALS)['total_consumption']
         previous_period = self.df.shift(1)['total_consumption'].sum()
         
         if previous_period == 0:
@@ -663,7 +810,7 @@ class DashboardComponents:
 
     def calculate_cost_per_kwh(self):
         """Calculate average cost per kWh"""
-        total_consumption_kwh = self.df['total_consumption'].sum() / 1000
+        total_consumption_kwh = self.queries.collect(TOTALS)['total_consumption'] / 1000
         total_cost = self.calculate_total_cost()
         
         if total_consumption_kwh == 0:
@@ -673,35 +820,28 @@ class DashboardComponents:
 
     def calculate_peak_hour_cost(self):
         """Calculate cost during peak hours"""
-        peak_hours = range(9, 18)
-        peak_consumption = self.df[
-            self.df['timestamp'].dt.hour.isin(peak_hours)
-        ]['total_consumption'].sum()
+        peak_consumption, _ = self._tou_consumption()
         
-        return (peak_consumption * 8) / 1000  # ₹8 per kWh during peak hours
+        return (peak_consumption * PEAK_RATE) / 1000
 
     def project_monthly_cost(self):
         """Project next month's cost based on current trends"""
         # Calculate daily average cost
-        daily_costs = self.df.groupby(self.df['timestamp'].dt.date)['total_consumption'].sum()
+        daily_costs = self.queries.collect(DAILY)['total']
         avg_daily_cost = (daily_costs.mean() * 7) / 1000  # ₹7 average per kWh
         
         # Project for 30 days
         return avg_daily_cost * 30
 
+    @traced()
+    @cached_figure
     def plot_time_of_use_costs(self):
         """Create time-of-use cost distribution visualization"""
-        hourly_consumption = self.df.groupby(
-            self.df['timestamp'].dt.hour
-        )['total_consumption'].mean()
+        hourly = self.queries.collect(HOURLY)
         
         # Apply different rates for peak and off-peak hours
-        hourly_costs = hourly_consumption.copy()
-        peak_hours = range(9, 18)
-        
-        for hour, consumption in hourly_consumption.items():
-            rate = 8 if hour in peak_hours else 6  # ₹8 peak, ₹6 off-peak
-            hourly_costs[hour] = (consumption * rate) / 1000
+        rates = np.where(hourly['tou_band'] == TOU_PEAK, PEAK_RATE, OFFPEAK_RATE)
+        hourly_costs = hourly['mean'] * rates / 1000
         
         fig = go.Figure()
         fig.add_trace(go.Bar(
@@ -720,17 +860,11 @@ class DashboardComponents:
         
         return fig
 
+    @traced()
+    @cached_figure
     def plot_peak_vs_offpeak(self):
         """Create peak vs off-peak comparison visualization"""
-        peak_hours = range(9, 18)
-        
-        peak_data = self.df[
-            self.df['timestamp'].dt.hour.isin(peak_hours)
-        ]['total_consumption'].sum()
-        
-        offpeak_data = self.df[
-            ~self.df['timestamp'].dt.hour.isin(peak_hours)
-        ]['total_consumption'].sum()
+        peak_data, offpeak_data = self._tou_consumption()
         
         fig = go.Figure(data=[go.Pie(
             labels=['Peak Hours', 'Off-Peak Hours'],
@@ -746,33 +880,23 @@ class DashboardComponents:
         
         return fig
 
+    @traced()
+    @cached_figure
     def plot_equipment_costs(self):
         """Create equipment-wise cost distribution visualization using actual data"""
-        # Initialize containers for equipment costs
+        # Consumption per time-of-use band, each band converted at its own rate
+        zones = self.zone_queries().collect(BY_ZONE_BAND).groupby(level='tou_band').sum()
+        equipment = self.queries.collect(EQUIPMENT_BY_BAND)
         equipment_costs = {
-            'Fans': 0,
-            'Lights': 0,
-            'Computers': 0,
-            'Projectors': 0
+            'Fans': self._tou_cost(zones['fan']),
+            'Lights': self._tou_cost(zones['light']),
+            'Computers': self._tou_cost(equipment['computer']),
+            'Projectors': self._tou_cost(equipment['projector'])
         }
         
-        # Aggregate floor-wise equipment consumption
-        for _, row in self.df.iterrows():
-            for floor in row['floor_data']:
-                equipment_costs['Fans'] += floor['fan_consumption']
-                equipment_costs['Lights'] += floor['light_consumption']
-            
-            # Add shared equipment consumption
-            equipment_costs['Computers'] += row['shared_equipment']['computer_consumption']
-            equipment_costs['Projectors'] += row['shared_equipment']['projector_consumption']
-        
-        # Convert consumption to costs (₹8 per kWh for peak, ₹6 for off-peak)
-        rate = 8 if 9 <= pd.to_datetime(row['timestamp']).hour < 18 else 6
-        equipment_costs = {k: (v * rate) / 1000 for k, v in equipment_costs.items()}
-        
         fig = go.Figure(data=[go.Pie(
-            labels=list(equipment_data.keys()),
-            values=list(equipment_data.values()),
+            labels=list(equipment_costs.keys()),
+            values=list(equipment_costs.values()),
             hole=.3,
             marker_colors=[self.colors['primary'], 
                           self.colors['secondary'],
@@ -798,14 +922,17 @@ class DashboardComponents:
         }
         return pd.DataFrame(equipment_data)
 
+    @traced()
+    @cached_figure
     def plot_floor_costs(self):
         """Create floor-wise cost analysis visualization"""
         # Assuming floor data is available in self.df
+        total_consumption = self.queries.collect(TOTALS)['total_consumption']
         floor_consumption = {
-            'Floor 1': self.df['total_consumption'].sum() * 0.3,
-            'Floor 2': self.df['total_consumption'].sum() * 0.25,
-            'Floor 3': self.df['total_consumption'].sum() * 0.25,
-            'Floor 4': self.df['total_consumption'].sum() * 0.2
+            'Floor 1': total_consumption * 0.3,
+            'Floor 2': total_consumption * 0.25,
+            'Floor 3': total_consumption * 0.25,
+            'Floor 4': total_consumption * 0.2
         }
         
         fig = go.Figure(data=[go.Bar(
@@ -823,9 +950,10 @@ class DashboardComponents:
         
         return fig
 
+    @traced()
     def calculate_saving_opportunities(self):
         """Calculate potential cost saving opportunities"""
-        total_consumption = self.df['total_consumption'].sum()
+        total_consumption = self.queries.collect(TOTALS)['total_consumption']
         
         return [
             {
@@ -848,17 +976,17 @@ class DashboardComponents:
             }
         ]
 
+    @traced()
+    @cached_figure
     def plot_cost_trends(self):
         """Create historical cost trends visualization"""
-        daily_costs = self.df.groupby(self.df['timestamp'].dt.date).agg({
-            'total_consumption': 'sum'
-        }).reset_index()
+        daily_costs = self.queries.collect(DAILY)[['total']].reset_index()
         
-        daily_costs['cost'] = daily_costs['total_consumption'] * 7 / 1000  # Average ₹7 per kWh
+        daily_costs['cost'] = daily_costs['total'] * 7 / 1000  # Average ₹7 per kWh
         
         fig = go.Figure()
         fig.add_trace(go.Scatter(
-            x=daily_costs['timestamp'],
+            x=daily_costs['date'],
             y=daily_costs['cost'],
             mode='lines',
             name='Daily Cost',
@@ -874,27 +1002,44 @@ class DashboardComponents:
         
         return fig
 
-    def plot_budget_vs_actual(self):
-        """Create budget vs actual comparison visualization"""
-        # Sample budget data - replace with actual budget data
-        dates = self.df['timestamp'].dt.date.unique()
-        budget_data = pd.DataFrame({
-            'date': dates,
-            'budget': [5000] * len(dates),  # Sample daily budget
-            'actual': self.df.groupby(self.df['timestamp'].dt.date)['total_consumption'].sum() * 7 / 1000
-        })
+    def baseline_model(self):
+        """BaselineModel of consumption against occupancy and temperature, fitted from df unless given"""
+        if self.baseline is None:
+            self.baseline = BaselineModel.from_frame(self.df)
+        return self.baseline
+
+    def budget_tracker(self):
+        """BudgetTracker with this site's costs, built from df unless a shared one was given"""
+        if self.budget is None:
+            self.budget = BudgetTracker()
+            self.budget.ingest(self.df, site=self.site)
+        return self.budget
+
+    def _date_range(self):
+        if self.df.empty:
+            return None, None
+        return self.df['timestamp'].iloc[0], self.df['timestamp'].iloc[-1]
+
+    @traced()
+    @cached_figure
+    def plot_budget_vs_actual(self, start=None, end=None):
+        """Create budget vs actual comparison visualization, over df's dates unless given"""
+        if start is None and end is None:
+            start, end = self._date_range()
+        # One row per calendar day, budget and actual aligned on the date
+        daily = self.budget_tracker().daily(self.site, start, end)
         
         fig = go.Figure()
         fig.add_trace(go.Scatter(
-            x=budget_data['date'],
-            y=budget_data['budget'],
+            x=daily.index,
+            y=daily['budget'],
             mode='lines',
             name='Budget',
             line=dict(color=self.colors['secondary'])
         ))
         fig.add_trace(go.Scatter(
-            x=budget_data['date'],
-            y=budget_data['actual'],
+            x=daily.index,
+            y=daily['actual'],
             mode='lines',
             name='Actual',
             line=dict(color=self.colors['primary'])
@@ -911,45 +1056,27 @@ class DashboardComponents:
 
     def calculate_budget_utilization(self):
         """Calculate budget utilization percentage"""
-        total_actual = self.df['total_consumption'].sum() * 7 / 1000
-        total_budget = len(self.df['timestamp'].dt.date.unique()) * 5000  # Sample budget
-        
-        return (total_actual / total_budget) * 100 if total_budget > 0 else 0
+        return self.budget_tracker().utilization(self.site, *self._date_range()) * 100
 
     def project_budget_variance(self):
         """Project budget variance for the period"""
-        total_actual = self.df['total_consumption'].sum() * 7 / 1000
-        total_budget = len(self.df['timestamp'].dt.date.unique()) * 5000  # Sample budget
-        
-        return total_budget - total_actual
+        return self.budget_tracker().variance(self.site, *self._date_range())
 
+    @traced()
     def get_cost_alerts(self):
         """Generate cost-related alerts"""
-        alerts = []
-        
-        # Check for unusual consumption patterns
-        avg_daily_consumption = self.df.groupby(
-            self.df['timestamp'].dt.date
-        )['total_consumption'].mean().mean()
-        
-        recent_consumption = self.df.groupby(
-            self.df['timestamp'].dt.date
-        )['total_consumption'].mean().iloc[-1]
-        
-        if recent_consumption > avg_daily_consumption * 1.2:
-            alerts.append(f"⚠️ Recent consumption is {((recent_consumption/avg_daily_consumption)-1)*100:.1f}% above average")
-        
-        # Check budget utilization
-        if self.calculate_budget_utilization() > 90:
-            alerts.append("⚠️ Budget utilization above 90%")
-        
-        # Check peak hour usage
-        peak_ratio = self.calculate_peak_hour_cost() / self.calculate_total_cost()
-        if peak_ratio > 0.6:
-            alerts.append("⚠️ High peak hour usage (>60% of total cost)")
-        
-        return alerts
+        # The declared rules (ALERT_CONFIG) firing at the latest reading, as kept by
+        # `python alerting.py` over the whole history rather than the sidebar window
+        engine = AlertEngine.load(ALERT_CONFIG['state_path'])
+        if engine is None:
+            return []
+        return [f"⚠️ {alert['message']}" for alert in engine.active(self.site)]
 
+    def recent_alerts(self, n=20):
+        """The last n alerts raised for this site, newest first"""
+        return JsonlAlertSink(ALERT_CONFIG['sink_path']).recent(n, site=self.site)
+
+    @traced()
     def generate_cost_report(self, format='Excel'):
         """Generate exportable cost report"""
         # Create a comprehensive report
@@ -969,96 +1096,30 @@ class DashboardComponents:
         else:  # PDF
             return pd.DataFrame([report_data]).to_json()  # Placeholder for PDF generation
 
+    @traced()
     def calculate_floor_costs(self):
         """Calculate detailed floor-wise costs"""
-        floor_details = {}
-        
-        for _, row in self.df.iterrows():
-            for floor_data in row['floor_data']:
-                floor_name = floor_data['floor']
-                if floor_name not in floor_details:
-                    floor_details[floor_name] = {
-                        'total_consumption': 0,
-                        'peak_consumption': 0,
-                        'off_peak_consumption': 0,
-                        'fan_consumption': 0,
-                        'light_consumption': 0,
-                        'total_cost': 0
-                    }
-                
-                # Add consumption data
-                floor_details[floor_name]['total_consumption'] += floor_data['total_floor_consumption']
-                floor_details[floor_name]['fan_consumption'] += floor_data['fan_consumption']
-                floor_details[floor_name]['light_consumption'] += floor_data['light_consumption']
-                
-                # Calculate costs based on time of day
-                hour = pd.to_datetime(row['timestamp']).hour
-                rate = 8 if 9 <= hour < 18 else 6  # ₹8 for peak, ₹6 for off-peak
-                
-                if 9 <= hour < 18:
-                    floor_details[floor_name]['peak_consumption'] += floor_data['total_floor_consumption']
-                else:
-                    floor_details[floor_name]['off_peak_consumption'] += floor_data['total_floor_consumption']
-                
-                floor_details[floor_name]['total_cost'] += (floor_data['total_floor_consumption'] * rate) / 1000
+        zones = self.zone_queries().collect(BY_ZONE)
+        by_band = self.zone_queries().collect(BY_ZONE_BAND)['total'].unstack('tou_band')
+        bands = by_band.reindex(index=zones.index, columns=[TOU_PEAK, TOU_OFFPEAK], fill_value=0)
+        
+        floor_details = pd.DataFrame({
+            'total_consumption': zones['total'],
+            'peak_consumption': bands[TOU_PEAK],
+            'off_peak_consumption': bands[TOU_OFFPEAK],
+            'fan_consumption': zones['fan'],
+            'light_consumption': zones['light'],
+            # Costs based on the time-of-use band
+            'total_cost': (bands[TOU_PEAK] * PEAK_RATE + bands[TOU_OFFPEAK] * OFFPEAK_RATE) / 1000
+        }).to_dict('index')
         
         return floor_details
 
+    @traced()
     def calculate_efficiency_metrics(self):
         """Calculate efficiency metrics for each floor and overall building"""
         try:
-            metrics = {}
-            
-            # Calculate overall building metrics first
-            total_consumption = self.df['total_consumption'].sum()
-            total_peak_load = self.df['peak_load'].sum()
-            avg_occupancy = self.df['occupancy_level'].mean()
-            
-            # Calculate metrics for each floor
-            for _, row in self.df.iterrows():
-                for floor_data in row['floor_data']:
-                    floor_name = floor_data['floor']
-                    if floor_name not in metrics:
-                        metrics[floor_name] = {
-                            'total_consumption': 0,
-                            'consumption_per_occupant': 0,
-                            'peak_efficiency': 0,
-                            'utilization_rate': 0
-                        }
-                    
-                    # Update floor metrics
-                    floor_consumption = floor_data['total_floor_consumption']
-                    metrics[floor_name]['total_consumption'] += floor_consumption
-                    
-                    # Calculate consumption per occupant (if occupancy data available)
-                    if row['occupancy_level'] > 0:
-                        metrics[floor_name]['consumption_per_occupant'] = (
-                            floor_consumption / row['occupancy_level']
-                        )
-                    
-                    # Calculate peak efficiency (consumption vs peak load)
-                    if row['peak_load'] > 0:
-                        metrics[floor_name]['peak_efficiency'] = (
-                            floor_consumption / row['peak_load']
-                        )
-                    
-                    # Calculate utilization rate (actual vs maximum possible consumption)
-                    max_possible = (floor_data['fan_consumption'] + 
-                                  floor_data['light_consumption']) * 24  # assuming 24h max
-                    if max_possible > 0:
-                        metrics[floor_name]['utilization_rate'] = (
-                            floor_consumption / max_possible
-                        )
-            
-            # Add overall building efficiency
-            metrics['Overall'] = {
-                'total_consumption': total_consumption,
-                'consumption_per_occupant': total_consumption / avg_occupancy if avg_occupancy > 0 else 0,
-                'peak_efficiency': total_consumption / total_peak_load if total_peak_load > 0 else 0,
-                'utilization_rate': sum(m['utilization_rate'] for m in metrics.values()) / len(metrics)
-            }
-            
-            return metrics
+            return self.efficiency_scores().floor_metrics()
         
         except Exception as e:
             st.error(f"Error calculating efficiency metrics: {str(e)}")
@@ -1071,6 +1132,8 @@ class DashboardComponents:
                 }
             }
 
+    @traced()
+    @cached_figure
     def plot_appliance_costs(self):
         """Create appliance-wise cost distribution visualization"""
         try:
@@ -1084,15 +1147,15 @@ class DashboardComponents:
             }
             
             # Aggregate consumption by appliance type
-            for _, row in self.df.iterrows():
-                for floor_data in row['floor_data']:
-                    appliance_consumption['Fan'] += floor_data['fan_consumption']
-                    appliance_consumption['Light'] += floor_data['light_consumption']
-                
-                # Add shared equipment consumption
-                if 'shared_equipment' in row:
-                    appliance_consumption['Computer'] += row['shared_equipment'].get('computer_consumption', 0)
-                    appliance_consumption['Projector'] += row['shared_equipment'].get('projector_consumption', 0)
+            zones = self.zone_queries().collect(BY_ZONE)
+            appliance_consumption['Fan'] = zones['fan'].sum()
+            appliance_consumption['Light'] = zones['light'].sum()
+            
+            # Add shared equipment consumption
+            if {'computer_consumption', 'shared_equipment.computer_consumption'} & set(self.df.columns):
+                equipment = self.queries.collect(EQUIPMENT_BY_BAND)
+                appliance_consumption['Computer'] = equipment['computer'].sum()
+                appliance_consumption['Projector'] = equipment['projector'].sum()
             
             # Calculate costs (using average rate of ₹7/kWh)
             appliance_costs = {
@@ -0,0 +1,108 @@
+import threading
+import contextvars
+from concurrent.futures import CancelledError, ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from config import DATA_LAYER_CONFIG
+
+
+class PanelRun:
+    """The panels of one page render, computed concurrently and consumed as each completes
+
+    Panel functions run on the shared pool and must not call Streamlit
+    themselves; the page renders their results on the script thread. Used
+    as a context manager, leaving the block (including Streamlit stopping
+    the script when the user navigates away) cancels whatever is left.
+    """
+
+    def __init__(self, executor, on_exit=None):
+        self._executor = executor
+        self._on_exit = on_exit  # Called with the run when its block is left
+        self._futures = {}  # future -> panel name
+        self._cancelled = threading.Event()
+
+    def submit(self, name, fn, *args, **kwargs):
+        """Start computing a panel in the background"""
+        # Runs in a copy of the caller's context, so tracing spans nest under the page render
+        future = self._executor.submit(contextvars.copy_context().run, self._run, fn, args, kwargs)
+        self._futures[future] = name
+        return future
+
+    def _run(self, fn, args, kwargs):
+        # Work queued before a cancellation is skipped once a thread picks it up
+        if self._cancelled.is_set():
+            raise CancelledError()
+        return fn(*args, **kwargs)
+
+    def as_completed(self, timeout=None):
+        """Yield (name, future) pairs in the order the panels finish"""
+        pending = set(self._futures)
+        while pending and not self._cancelled.is_set():
+            done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                raise TimeoutError(f"Panels still running: {sorted(self._futures[f] for f in pending)}")
+            for future in done:
+                yield self._futures[future], future
+
+    def cancel(self):
+        """Drop every panel that has not started yet and stop yielding results"""
+        self._cancelled.set()
+        for future in self._futures:
+            future.cancel()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.cancel()
+        if self._on_exit is not None:
+            self._on_exit(self)
+        return False
+
+
+class DataLayer:
+    """Process-wide thread pool that computes dashboard panels for every session
+
+    Each session has at most one live PanelRun: starting a new one (a rerun
+    or navigation to another page) cancels the panels of the previous one.
+    A run is forgotten once its page has rendered, so sessions that end
+    leave nothing behind.
+    """
+
+    def __init__(self, max_workers=None):
+        max_workers = max_workers if max_workers is not None else DATA_LAYER_CONFIG['max_workers']
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='panel')
+        self._runs = {}  # session key -> PanelRun
+        self._lock = threading.Lock()
+
+    def start(self, session_key):
+        """Begin a new page render for a session"""
+        run = PanelRun(self._executor, on_exit=lambda finished: self._release(session_key, finished))
+        with self._lock:
+            previous = self._runs.get(session_key)
+            self._runs[session_key] = run
+        if previous is not None:
+            previous.cancel()
+        return run
+
+    def _release(self, session_key, run):
+        with self._lock:
+            if self._runs.get(session_key) is run:
+                del self._runs[session_key]
+
+    def cancel(self, session_key):
+        """Cancel the outstanding panels of a session"""
+        with self._lock:
+            run = self._runs.pop(session_key, None)
+        if run is not None:
+            run.cancel()
+
+    def shutdown(self):
+        with self._lock:
+            runs, self._runs = list(self._runs.values()), {}
+        for run in runs:
+            run.cancel()
+        self._executor.shutdown(wait=False, cancel_futures=True)
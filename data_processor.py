@@ -1,26 +1,251 @@
+import os
+import json
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
 
+from aggregates import GroupedSums, RunningStats
+from calendar_features import add_calendar_columns, calendar_columns, day_names
+
+def load_readings(data_folder):
+    """Load every data_*.json reading in a folder into one time-ordered frame"""
+    json_files = [f for f in os.listdir(data_folder)
+                  if f.startswith('data_') and f.endswith('.json')]
+
+    all_data = []
+    for file in json_files:
+        with open(os.path.join(data_folder, file), 'r') as f:
+            all_data.append(pd.json_normalize(json.load(f)))
+
+    if not all_data:
+        return pd.DataFrame()
+
+    df = pd.concat(all_data, ignore_index=True)
+    df['timestamp'] = pd.to_datetime(df['timestamp'])
+    return df.sort_values('timestamp', ignore_index=True)
+
+def extract_zone_readings(df, keys=('timestamp',)):
+    """Flatten the nested floor_data lists into one row per reading and zone, led by the key columns"""
+    keys = list(keys)
+    exploded = df[keys + ['floor_data']].explode('floor_data', ignore_index=True)
+    exploded = exploded.dropna(subset=['floor_data'])
+
+    zones = pd.DataFrame(exploded['floor_data'].tolist())
+    for i, key in enumerate(keys):
+        zones.insert(i, key, exploded[key].to_numpy())
+    return zones.rename(columns={'floor': 'zone'})
+
+# Columns of the reading frames produced in chunked mode
+CHUNK_COLUMNS = ('timestamp', 'total_consumption', 'occupancy_level', 'computer_consumption',
+                 'projector_consumption', 'total_fan_consumption', 'total_light_consumption')
+
+def store_chunks(store, chunk_rows=None):
+    """Yield fixed-size reading frames from a TimeSeriesStore"""
+    for timestamps, columns in store.scan(
+        ['total_consumption', 'occupancy_level', 'computer_consumption', 'projector_consumption'],
+        ['fan_consumption', 'light_consumption'],
+        chunk_rows=chunk_rows
+    ):
+        yield pd.DataFrame({
+            'timestamp': timestamps.view('datetime64[ns]'),
+            'total_consumption': columns['total_consumption'],
+            'occupancy_level': columns['occupancy_level'],
+            'computer_consumption': columns['computer_consumption'],
+            'projector_consumption': columns['projector_consumption'],
+            'total_fan_consumption': np.nansum(columns['zone.fan_consumption'], axis=1),
+            'total_light_consumption': np.nansum(columns['zone.light_consumption'], axis=1)
+        }, copy=False)
+
+def _flatten_chunk(df):
+    """Reduce raw normalized readings to CHUNK_COLUMNS"""
+    zone_totals = lambda key: df['floor_data'].map(lambda floors: sum(f.get(key, 0) for f in floors))
+    return pd.DataFrame({
+        'timestamp': pd.to_datetime(df['timestamp']),
+        'total_consumption': df['total_consumption'],
+        'occupancy_level': df['occupancy_level'],
+        'computer_consumption': df.get('shared_equipment.computer_consumption', np.nan),
+        'projector_consumption': df.get('shared_equipment.projector_consumption', np.nan),
+        'total_fan_consumption': zone_totals('fan_consumption'),
+        'total_light_consumption': zone_totals('light_consumption')
+    })
+
+def file_chunks(data_folder, chunk_rows=10000):
+    """Yield reading frames of about chunk_rows rows, parsing the data_*.json files lazily"""
+    json_files = sorted(f for f in os.listdir(data_folder)
+                        if f.startswith('data_') and f.endswith('.json'))
+    batch, rows = [], 0
+    for file in json_files:
+        with open(os.path.join(data_folder, file), 'r') as f:
+            batch.append(pd.json_normalize(json.load(f)))
+        rows += len(batch[-1])
+        if rows >= chunk_rows:
+            yield _flatten_chunk(pd.concat(batch, ignore_index=True))
+            batch, rows = [], 0
+    if batch:
+        yield _flatten_chunk(pd.concat(batch, ignore_index=True))
+
+def _split(items, n_workers):
+    """Contiguous partitions of items, a few per worker so uneven partitions still balance"""
+    n_parts = min(len(items), n_workers * 4)
+    if n_parts == 0:
+        return []
+    bounds = np.linspace(0, len(items), n_parts + 1).astype(int)
+    return [items[lo:hi] for lo, hi in zip(bounds[:-1], bounds[1:])]
+
+_BRACKETS = np.zeros(256, dtype=bool)
+_BRACKETS[np.frombuffer(b'{}[]', dtype=np.uint8)] = True
+
+def _record_spans(path, block_bytes=1 << 22):
+    """Byte offsets (starts, ends) of the objects in the top-level array of a JSON file
+
+    One vectorized pass over the raw bytes, a block at a time, tracks string
+    and nesting state without parsing any record. Returns None if the file
+    does not hold an array.
+    """
+    starts, ends = [], []
+    depth, in_string, backslashes, offset = 0, False, 0, 0
+    with open(path, 'rb') as f:
+        while True:
+            block = np.frombuffer(f.read(block_bytes), dtype=np.uint8)
+            if len(block) == 0:
+                break
+
+            # A quote preceded by an odd run of backslashes is escaped
+            quotes = np.flatnonzero(block == ord('"'))
+            slashes = np.flatnonzero(block == ord('\\'))
+            carried = backslashes
+            backslashes = 0
+            if len(quotes) and quotes[0] == 0 and carried % 2:
+                quotes = quotes[1:]
+            if len(slashes):
+                breaks = np.flatnonzero(np.diff(slashes) != 1)
+                run_starts = slashes[np.concatenate([[0], breaks + 1])]
+                run_ends = slashes[np.concatenate([breaks, [len(slashes) - 1]])]
+                lengths = run_ends - run_starts + 1 + np.where(run_starts == 0, carried, 0)
+                follows = np.flatnonzero((block[np.maximum(quotes - 1, 0)] == ord('\\')) & (quotes > 0))
+                run = np.searchsorted(run_ends, quotes[follows] - 1)
+                quotes = np.delete(quotes, follows[lengths[run] % 2 == 1])
+                if run_ends[-1] == len(block) - 1:
+                    backslashes = int(lengths[-1])
+
+            # Brackets outside strings change the nesting depth
+            brackets = np.flatnonzero(_BRACKETS[block])
+            brackets = brackets[(np.searchsorted(quotes, brackets) & 1).astype(bool) == in_string]
+            chars = block[brackets]
+            step = np.where((chars == ord('{')) | (chars == ord('[')), 1, -1)
+            after = depth + np.cumsum(step)
+            if offset == 0 and len(chars) and chars[0] != ord('['):
+                return None
+            starts.append(offset + brackets[(chars == ord('{')) & (after == 2)])
+            ends.append(offset + brackets[(chars == ord('}')) & (after == 1)] + 1)
+
+            depth = int(after[-1]) if len(after) else depth
+            in_string ^= bool(len(quotes) % 2)
+            offset += len(block)
+    if offset == 0:
+        return None
+    return np.concatenate(starts), np.concatenate(ends)
+
+def _timestamp_partitions(path, n_parts):
+    """Byte ranges of about equal size of a JSON array file, each starting at a new timestamp
+
+    Readings sharing a timestamp (e.g. of several sites) stay in one
+    partition. Returns None if the file does not hold an array.
+    """
+    spans = _record_spans(path)
+    if spans is None:
+        return None
+    starts, ends = spans
+    if len(starts) == 0:
+        return []
+
+    with open(path, 'rb') as f:
+        def timestamp(i):
+            f.seek(starts[i])
+            return json.loads(f.read(ends[i] - starts[i])).get('timestamp')
+
+        cuts = [0]
+        targets = np.searchsorted(starts, np.linspace(starts[0], ends[-1], n_parts + 1)[1:-1])
+        for cut in targets:
+            cut = max(int(cut), cuts[-1] + 1)
+            while cut < len(starts) and timestamp(cut) == timestamp(cut - 1):
+                cut += 1
+            if cut < len(starts):
+                cuts.append(cut)
+    cuts.append(len(starts))
+    return [(path, int(starts[lo]), int(ends[hi - 1])) for lo, hi in zip(cuts[:-1], cuts[1:])]
+
+def _preprocess_partition(partition):
+    """Run the whole preprocessing chain on one partition in a worker process"""
+    kind, items = partition
+    records = []
+    if kind == 'files':
+        for path in items:
+            with open(path, 'r') as f:
+                data = json.load(f)
+            records.extend(data if isinstance(data, list) else [data])
+    else:
+        # A byte range holding whole records of one JSON array
+        path, start, end = items
+        with open(path, 'rb') as f:
+            f.seek(start)
+            records = json.loads(b'[' + f.read(end - start) + b']')
+    if not records:
+        return pd.DataFrame()
+
+    processor = DataProcessor(None)
+    processor.df = pd.DataFrame(records)
+    processor._preprocess()
+    if kind == 'files':
+        processor.df = processor.df.sort_values('timestamp', kind='stable', ignore_index=True)
+    return processor.df
+
 class DataProcessor:
     def __init__(self, data_path):
         self.data_path = data_path
         self.df = None
+        self.chunks = None  # In chunked mode, a callable returning an iterator of reading frames
+
+    @classmethod
+    def from_store(cls, store, chunk_rows=None):
+        """Compute the metrics by scanning a TimeSeriesStore chunk by chunk instead of loading a frame"""
+        processor = cls(store.path)
+        processor.chunks = lambda: store_chunks(store, chunk_rows)
+        return processor
+
+    @classmethod
+    def from_files(cls, data_folder, chunk_rows=10000):
+        """Compute the metrics by parsing the data_*.json files a batch of readings at a time"""
+        processor = cls(data_folder)
+        processor.chunks = lambda: file_chunks(data_folder, chunk_rows)
+        return processor
         
-    def load_and_preprocess(self):
-        """Load and preprocess the energy consumption data"""
+    def load_and_preprocess(self, parallel=False, max_workers=None):
+        """Load and preprocess the energy consumption data
+
+        With parallel=True the input is split into partitions (byte ranges
+        of a JSON file cut where the timestamp changes, or groups of
+        data_*.json shards of a folder) and each partition is parsed and runs
+        the whole preprocessing chain in its own process.
+        """
+        if parallel:
+            return self._load_parallel(max_workers)
+
         # Load data
         self.df = pd.read_json(self.data_path)
-        
+        return self._preprocess()
+
+    def _preprocess(self):
+        """Derive the temporal, floor and equipment columns of self.df"""
         # Convert timestamp to datetime
         self.df['timestamp'] = pd.to_datetime(self.df['timestamp'])
         
-        # Extract temporal features
-        self.df['hour'] = self.df['timestamp'].dt.hour
+        # Extract temporal features (integer calendar columns, decoded once)
+        add_calendar_columns(self.df)
         self.df['day'] = self.df['timestamp'].dt.day
-        self.df['month'] = self.df['timestamp'].dt.month
-        self.df['day_of_week'] = self.df['timestamp'].dt.day_name()
-        self.df['is_weekend'] = self.df['day_of_week'].isin(['Saturday', 'Sunday'])
+        self.df['day_of_week'] = day_names(self.df['dow'])
         
         # Process floor data
         self._process_floor_data()
@@ -29,6 +254,34 @@ class DataProcessor:
         self._process_equipment_data()
         
         return self.df
+
+    def _load_parallel(self, max_workers=None):
+        max_workers = max_workers or os.cpu_count() or 1
+        if os.path.isdir(self.data_path):
+            files = sorted(os.path.join(self.data_path, f) for f in os.listdir(self.data_path)
+                           if f.startswith('data_') and f.endswith('.json'))
+            partitions = [('files', list(part)) for part in _split(files, max_workers)]
+        else:
+            # Only record boundaries are found here; the workers parse their own ranges
+            ranges = _timestamp_partitions(self.data_path, max_workers * 4)
+            partitions = [('bytes', r) for r in ranges] if ranges is not None else [('files', [self.data_path])]
+
+        if not partitions:
+            self.df = pd.DataFrame()
+            return self.df
+
+        with ProcessPoolExecutor(
+            max_workers=min(max_workers, len(partitions)),
+            mp_context=multiprocessing.get_context('spawn')
+        ) as executor:
+            # map() keeps the partitions in input order
+            parts = [part for part in executor.map(_preprocess_partition, partitions) if not part.empty]
+
+        # One copy of each column into the final blocks; the partitions are dropped as it goes
+        self.df = pd.concat(parts, ignore_index=True) if parts else pd.DataFrame()
+        if partitions[0][0] == 'files' and not self.df.empty and not self.df['timestamp'].is_monotonic_increasing:
+            self.df = self.df.sort_values('timestamp', kind='stable', ignore_index=True)
+        return self.df
     
     def _process_floor_data(self):
         """Process nested floor data"""
@@ -64,6 +317,8 @@ class DataProcessor:
     
     def get_consumption_metrics(self):
         """Calculate key consumption metrics"""
+        if self.chunks is not None:
+            return self._chunked_consumption_metrics()
         metrics = {
             'total_consumption': self.df['total_consumption'].sum(),
             'average_daily_consumption': self.df.groupby(
@@ -79,10 +334,14 @@ class DataProcessor:
     
     def get_hourly_patterns(self):
         """Analyze hourly consumption patterns"""
+        if self.chunks is not None:
+            return self._chunked_hourly_patterns()
         return self.df.groupby('hour')['total_consumption'].mean()
     
     def get_equipment_usage(self):
         """Analyze equipment-wise consumption"""
+        if self.chunks is not None:
+            return self._chunked_equipment_usage()
         equipment_consumption = {
             'Fans': self.df['total_fan_consumption'].sum(),
             'Lights': self.df['total_light_consumption'].sum(),
@@ -93,6 +352,8 @@ class DataProcessor:
     
     def identify_anomalies(self, threshold=2):
         """Identify anomalous consumption patterns"""
+        if self.chunks is not None:
+            return self._chunked_anomalies(threshold)
         # Calculate Z-scores for total consumption
         self.df['consumption_zscore'] = np.abs(
             (self.df['total_consumption'] - self.df['total_consumption'].mean()) 
@@ -105,6 +366,8 @@ class DataProcessor:
     
     def get_efficiency_score(self):
         """Calculate energy efficiency score"""
+        if self.chunks is not None:
+            return self._chunked_efficiency_score()
         # Calculate baseline metrics
         avg_consumption = self.df['total_consumption'].mean()
         occupancy_ratio = self.df['occupancy_level'].mean() / 100
@@ -120,4 +383,78 @@ class DataProcessor:
             (1 - equipment_utilization) * 30
         )
         
-        return min(max(efficiency_score, 0), 100)  # Ensure score is between 0 and 100
\ No newline at end of file
+        return min(max(efficiency_score, 0), 100)  # Ensure score is between 0 and 100
+
+    # Chunked versions of the metrics above: each chunk is reduced to mergeable partial
+    # aggregates, so memory stays constant however long the history is
+
+    def _chunked_consumption_metrics(self):
+        consumption, occupancy, daily = RunningStats(), RunningStats(), GroupedSums()
+        for chunk in self.chunks():
+            timestamps = chunk['timestamp'].to_numpy()
+            values = chunk['total_consumption'].to_numpy(dtype=float)
+            consumption.merge(RunningStats.of(values, timestamps))
+            occupancy.merge(RunningStats.of(chunk['occupancy_level']))
+            daily.update(timestamps.astype('datetime64[D]').astype(np.int64), values)
+
+        return {
+            'total_consumption': consumption.total,
+            'average_daily_consumption': daily.means().mean() if daily.keys().size else np.nan,
+            'peak_consumption': consumption.max if consumption.count else np.nan,
+            'peak_time': pd.Timestamp(consumption.argmax) if consumption.argmax is not None else None,
+            'average_occupancy': occupancy.mean if occupancy.count else np.nan
+        }
+
+    def _chunked_hourly_patterns(self):
+        hourly = GroupedSums()
+        for chunk in self.chunks():
+            hourly.update(calendar_columns(chunk['timestamp'], names=('hour',))['hour'], chunk['total_consumption'])
+        return pd.Series(hourly.means(), index=pd.Index(hourly.keys(), name='hour'), name='total_consumption')
+
+    def _chunked_equipment_usage(self):
+        columns = {
+            'Fans': 'total_fan_consumption',
+            'Lights': 'total_light_consumption',
+            'Computers': 'computer_consumption',
+            'Projectors': 'projector_consumption'
+        }
+        usage = {name: RunningStats() for name in columns}
+        for chunk in self.chunks():
+            for name, column in columns.items():
+                usage[name].merge(RunningStats.of(chunk[column]))
+        return {name: stats.total for name, stats in usage.items()}
+
+    def _chunked_anomalies(self, threshold):
+        # First pass for the mean and standard deviation, second to pick out the outliers
+        consumption = RunningStats()
+        for chunk in self.chunks():
+            consumption.merge(RunningStats.of(chunk['total_consumption']))
+        mean, std = consumption.mean, consumption.std()
+
+        anomalies = []
+        if consumption.count > 1 and std > 0:
+            for chunk in self.chunks():
+                zscore = np.abs((chunk['total_consumption'] - mean) / std)
+                anomalies.append(chunk[zscore > threshold].assign(consumption_zscore=zscore[zscore > threshold]))
+        if not anomalies:
+            return pd.DataFrame(columns=list(CHUNK_COLUMNS) + ['consumption_zscore'])
+        return pd.concat(anomalies, ignore_index=True)
+
+    def _chunked_efficiency_score(self):
+        stats = {column: RunningStats() for column in CHUNK_COLUMNS[1:]}
+        for chunk in self.chunks():
+            for column, partial in stats.items():
+                partial.merge(RunningStats.of(chunk[column]))
+
+        consumption = stats['total_consumption']
+        occupancy_ratio = stats['occupancy_level'].mean / 100
+        equipment_utilization = (
+            stats['computer_consumption'].mean
+            + stats['projector_consumption'].mean
+        ) / consumption.mean
+        efficiency_score = (
+            (1 - (consumption.mean / consumption.max)) * 40 +
+            occupancy_ratio * 30 +
+            (1 - equipment_utilization) * 30
+        )
+        return min(max(efficiency_score, 0), 100)
@@ -0,0 +1,92 @@
+import numpy as np
+import pandas as pd
+
+from config import DOWNSAMPLING_CONFIG
+
+
+def _numeric(x):
+    """Positions of x as float64, with datetimes in nanoseconds"""
+    values = np.asarray(x)
+    if np.issubdtype(values.dtype, np.datetime64) or values.dtype == object:
+        return pd.to_datetime(values).to_numpy().astype('datetime64[ns]').astype(np.int64).astype(float)
+    return values.astype(float)
+
+
+def lttb_indices(x, y, n_out):
+    """Largest-Triangle-Three-Buckets: indices of n_out points that keep the shape of y over x
+
+    The first and last points are always kept. Each of the n_out - 2
+    buckets in between contributes the point forming the largest triangle
+    with the previously kept point and the average of the next bucket.
+    """
+    n = len(y)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    # Average of every bucket (the final "bucket" is the last point)
+    counts = np.diff(np.append(edges, n))
+    mean_x = np.add.reduceat(x, edges) / counts
+    mean_y = np.add.reduceat(y, edges) / counts
+
+    keep = np.empty(n_out, dtype=int)
+    keep[0], keep[-1] = 0, n - 1
+    previous = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        bx, by = x[start:end], y[start:end]
+        area = np.abs(
+            (x[previous] - mean_x[i + 1]) * (by - y[previous])
+            - (x[previous] - bx) * (mean_y[i + 1] - y[previous])
+        )
+        previous = start + int(np.argmax(area))
+        keep[i + 1] = previous
+    return keep
+
+
+def minmax_indices(y, n_out):
+    """Indices of the minimum and maximum of each of n_out // 2 buckets, in time order
+
+    Every local extreme survives, which is what peak charts need.
+    """
+    n = len(y)
+    if n_out >= n or n_out < 2:
+        return np.arange(n)
+
+    n_buckets = n_out // 2
+    bucket = np.repeat(np.arange(n_buckets), np.diff(np.linspace(0, n, n_buckets + 1).astype(int)))
+    order = np.lexsort((y, bucket))
+    starts = np.searchsorted(bucket[order], np.arange(n_buckets))
+    ends = np.append(starts[1:], n) - 1
+    return np.unique(np.concatenate([order[starts], order[ends], [0, n - 1]]))
+
+
+def downsample(x, y, max_points=None, method=None, x_range=None):
+    """Reduce a series to at most about max_points points for plotting
+
+    method is 'lttb' (shape-preserving) or 'minmax' (keeps every bucket's
+    extremes). x_range=(start, end) first restricts the series to the
+    visible window, so zooming in re-queries at full resolution.
+    Returns the kept x and y values as arrays.
+    """
+    max_points = max_points if max_points is not None else DOWNSAMPLING_CONFIG['max_points']
+    method = method if method is not None else DOWNSAMPLING_CONFIG['method']
+    if method not in ('lttb', 'minmax'):
+        raise ValueError("method must be 'lttb' or 'minmax'")
+
+    x_values = np.asarray(x)
+    y_values = np.asarray(y, dtype=float)
+    positions = _numeric(x_values)
+
+    mask = np.isfinite(y_values)
+    if x_range is not None:
+        bounds = np.array(list(x_range), dtype=x_values.dtype if x_values.dtype != object else object)
+        start, end = _numeric(bounds)
+        mask &= (positions >= start) & (positions <= end)
+    selected = np.flatnonzero(mask)
+
+    if method == 'lttb':
+        keep = lttb_indices(positions[selected], y_values[selected], max_points)
+    else:
+        keep = minmax_indices(y_values[selected], max_points)
+    return x_values[selected[keep]], y_values[selected[keep]]
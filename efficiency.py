@@ -0,0 +1,180 @@
+import numpy as np
+import pandas as pd
+
+from config import EFFICIENCY_CONFIG
+from prefix_index import zone_matrices
+
+COMPONENTS = ('occupancy_score', 'peak_load_score', 'equipment_score', 'temperature_score', 'time_score')
+READING_COLUMNS = ('total_consumption', 'occupancy_level', 'peak_load', 'temperature')
+ZONE_METRICS = ('fan_consumption', 'light_consumption', 'total_floor_consumption')
+
+
+def _ratio(numerator, denominator):
+    """numerator / denominator, NaN where the denominator is not positive"""
+    numerator = np.asarray(numerator, dtype=np.float64)
+    denominator = np.asarray(denominator, dtype=np.float64)
+    out = np.full(np.broadcast(numerator, denominator).shape, np.nan)
+    np.divide(numerator, denominator, out=out, where=denominator > 0)
+    return out
+
+
+def _points(values, weight):
+    """Component points clipped to [0, weight]; readings it cannot be computed for score 0"""
+    return np.clip(np.nan_to_num(values, nan=0.0, posinf=weight, neginf=0.0), 0, weight)
+
+
+def score_components(readings, zone_values=None, config=None):
+    """Efficiency score components of every reading, and the score of every reading and zone
+
+    readings maps READING_COLUMNS (and optionally time_of_day) to per-reading
+    arrays; zone_values maps ZONE_METRICS to (readings, zones) matrices. A
+    zone scores like its building except for the equipment component, which
+    uses the zone's own fan and light share.
+    Returns ({component: points}, scores, zone scores or None).
+    """
+    config = config or EFFICIENCY_CONFIG
+    weights = config['weights']
+    column = lambda name: np.asarray(readings[name], dtype=np.float64) if name in readings else np.full(len(readings['total_consumption']), np.nan)
+    total = column('total_consumption')
+
+    equipment = np.zeros(len(total))
+    if zone_values is not None:
+        equipment = np.nansum(zone_values['fan_consumption'] + zone_values['light_consumption'], axis=1)
+
+    if 'time_of_day' in readings:
+        time_points = pd.Series(readings['time_of_day']).map(config['time_scores']).astype(np.float64)
+        time_points = time_points.fillna(config['default_time_score']).to_numpy()
+    else:
+        time_points = np.full(len(total), float(config['default_time_score']))
+
+    temperature_error = np.abs(column('temperature') - config['optimal_temperature']) / config['temperature_tolerance']
+    components = {
+        'occupancy_score': _points(weights['occupancy'] * config['per_occupant_target'] * _ratio(column('occupancy_level'), total), weights['occupancy']),
+        'peak_load_score': _points(weights['peak_load'] * _ratio(total, column('peak_load')), weights['peak_load']),
+        'equipment_score': _points(weights['equipment'] * (1 - _ratio(equipment, total)), weights['equipment']),
+        'temperature_score': _points(weights['temperature'] * (1 - temperature_error), weights['temperature']),
+        'time_score': _points(time_points, weights['time']),
+    }
+    scores = np.clip(sum(components.values()), 0, 100)
+
+    zone_scores = None
+    if zone_values is not None:
+        zone_equipment = _ratio(zone_values['fan_consumption'] + zone_values['light_consumption'],
+                                zone_values['total_floor_consumption'])
+        zone_scores = (scores - components['equipment_score'])[:, None] + _points(weights['equipment'] * (1 - zone_equipment), weights['equipment'])
+        zone_scores = np.where(np.isnan(zone_values['total_floor_consumption']), np.nan, np.clip(zone_scores, 0, 100))
+    return components, scores, zone_scores
+
+
+class EfficiencyScores:
+    """Efficiency score time series of every reading and zone, with its components
+
+    Scores are computed for the whole history in one vectorized pass and
+    kept with the inputs they came from, so a date window is a slice and
+    trends, percentiles and per-floor metrics are array reductions.
+    """
+
+    def __init__(self, timestamps, readings, components, scores, zones=(), zone_values=None, zone_scores=None):
+        self.timestamps = timestamps  # datetime64[ns], ascending
+        self.readings = readings
+        self.components = components
+        self.scores = scores
+        self.zones = list(zones)
+        self.zone_values = zone_values
+        self.zone_scores = zone_scores
+        self._sorted = None
+
+    @classmethod
+    def from_frame(cls, df, zones=None, zone_values=None, config=None):
+        """Scores of a frame of readings; zone matrices are taken from floor_data unless given"""
+        if df.empty:
+            empty = np.empty(0)
+            return cls(np.empty(0, dtype='datetime64[ns]'), {name: empty for name in READING_COLUMNS},
+                       {name: empty for name in COMPONENTS}, empty)
+        if zone_values is None and 'floor_data' in df.columns:
+            zones, zone_values = zone_matrices(df, ZONE_METRICS)
+        readings = {name: df[name].to_numpy() for name in READING_COLUMNS + ('time_of_day',) if name in df.columns}
+        components, scores, zone_scores = score_components(readings, zone_values, config)
+        timestamps = pd.to_datetime(df['timestamp']).to_numpy().astype('datetime64[ns]')
+        return cls(timestamps, readings, components, scores, zones or (), zone_values, zone_scores)
+
+    def __len__(self):
+        return len(self.scores)
+
+    def window(self, start=None, end=None):
+        """Scores of the readings with start <= timestamp <= end, as views of these arrays"""
+        lo = 0 if start is None else int(np.searchsorted(self.timestamps, np.datetime64(pd.Timestamp(start)), 'left'))
+        hi = len(self) if end is None else int(np.searchsorted(self.timestamps, np.datetime64(pd.Timestamp(end)), 'right'))
+        part = lambda arrays: None if arrays is None else {name: values[lo:hi] for name, values in arrays.items()}
+        return EfficiencyScores(
+            self.timestamps[lo:hi], part(self.readings), part(self.components), self.scores[lo:hi], self.zones,
+            part(self.zone_values), None if self.zone_scores is None else self.zone_scores[lo:hi]
+        )
+
+    def latest(self):
+        """(rounded score, {component: points}) of the most recent reading"""
+        if len(self) == 0:
+            return 0, {}
+        return int(round(self.scores[-1])), {name: float(values[-1]) for name, values in self.components.items()}
+
+    def mean(self):
+        return float(self.scores.mean()) if len(self) else np.nan
+
+    def percentile_of(self, score):
+        """Percentage of readings scoring at or below score"""
+        if len(self) == 0:
+            return np.nan
+        if self._sorted is None:
+            self._sorted = np.sort(self.scores)
+        return 100.0 * np.searchsorted(self._sorted, score, 'right') / len(self)
+
+    def percentiles(self, q=(10, 50, 90)):
+        return np.percentile(self.scores, q) if len(self) else np.full(len(q), np.nan)
+
+    def trend(self, freq=None):
+        """Mean, 10th and 90th percentile score per period"""
+        freq = freq or EFFICIENCY_CONFIG['trend_freq']
+        resampled = pd.Series(self.scores, index=pd.DatetimeIndex(self.timestamps)).resample(freq)
+        return pd.DataFrame({'mean': resampled.mean(), 'p10': resampled.quantile(0.1),
+                             'p90': resampled.quantile(0.9)}).dropna()
+
+    def floor_metrics(self):
+        """Consumption, per-occupant, peak-load and utilization ratios per floor and overall
+
+        Every ratio is a ratio of sums over the window, so readings weigh by
+        their size instead of the last one overwriting the rest. The
+        exception is the overall consumption_per_occupant, which keeps its
+        original definition: the window's consumption over its mean occupancy.
+        """
+        total = self.readings['total_consumption'].astype(np.float64)
+        occupancy = self.readings.get('occupancy_level', np.full(len(self), np.nan)).astype(np.float64)
+        peak_load = self.readings.get('peak_load', np.full(len(self), np.nan)).astype(np.float64)
+
+        metrics = {}
+        if self.zone_values is not None and len(self):
+            consumption = self.zone_values['total_floor_consumption']
+            observed = ~np.isnan(consumption)
+            floor_totals = np.nansum(consumption, axis=0)
+            capacity = np.nansum((self.zone_values['fan_consumption'] + self.zone_values['light_consumption']) * 24, axis=0)  # assuming 24h max
+            occupants = np.where(observed, np.nan_to_num(occupancy)[:, None], 0).sum(axis=0)
+            peak_loads = np.where(observed, np.nan_to_num(peak_load)[:, None], 0).sum(axis=0)
+            per_occupant = np.nan_to_num(_ratio(floor_totals, occupants))
+            peak_efficiency = np.nan_to_num(_ratio(floor_totals, peak_loads))
+            utilization = np.nan_to_num(_ratio(floor_totals, capacity))
+            for i, zone in enumerate(self.zones):
+                metrics[zone] = {
+                    'total_consumption': float(floor_totals[i]),
+                    'consumption_per_occupant': float(per_occupant[i]),
+                    'peak_efficiency': float(peak_efficiency[i]),
+                    'utilization_rate': float(utilization[i])
+                }
+
+        total_consumption = float(np.nansum(total))
+        avg_occupancy = np.nanmean(occupancy) if (~np.isnan(occupancy)).any() else np.nan
+        metrics['Overall'] = {
+            'total_consumption': total_consumption,
+            'consumption_per_occupant': float(np.nan_to_num(_ratio(total_consumption, avg_occupancy))),
+            'peak_efficiency': float(np.nan_to_num(_ratio(total_consumption, np.nansum(peak_load)))),
+            'utilization_rate': float(np.mean([m['utilization_rate'] for m in metrics.values()])) if metrics else 0.0
+        }
+        return metrics
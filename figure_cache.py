@@ -0,0 +1,110 @@
+import json
+import hashlib
+import functools
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+from config import FIGURE_CACHE_CONFIG
+
+
+def data_version(df):
+    """Fingerprint of the readings a figure is built from: every column, nested ones (floor_data) by their text"""
+    if df.empty:
+        return f'empty-{len(df)}'
+    digest = hashlib.sha1()
+    for name in df.columns:
+        column = df[name]
+        try:
+            hashed = pd.util.hash_pandas_object(column, index=False)
+        except TypeError:
+            hashed = pd.util.hash_pandas_object(column.map(repr), index=False)
+        digest.update(f'{name};'.encode())
+        digest.update(hashed.to_numpy().tobytes())
+    return f'{len(df)}-{digest.hexdigest()[:16]}'
+
+
+def window_version(source_version, df):
+    """Version of a contiguous time window of a versioned dataset, without hashing its readings"""
+    if df.empty:
+        return f'{source_version}:empty'
+    timestamps = df['timestamp']
+    return f'{source_version}:{timestamps.iloc[0]}:{timestamps.iloc[-1]}:{len(df)}'
+
+
+class FigureCache:
+    """Process-wide LRU of serialized Plotly figures, keyed on (builder, data version, parameters)
+
+    Figures are stored as Plotly JSON and handed out as plain dicts, which
+    st.plotly_chart accepts directly. Concurrent requests for the same key
+    wait for a single build instead of each building the figure. Entries of
+    an older data version are never served; they age out of the LRU or can
+    be dropped with invalidate().
+    """
+
+    def __init__(self, max_entries=None):
+        self.max_entries = max_entries if max_entries is not None else FIGURE_CACHE_CONFIG['max_entries']
+        self._payloads = OrderedDict()  # key -> JSON string
+        self._building = {}  # key -> lock held while that key is built
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(builder, version, args=(), kwargs=None, theme=None):
+        return (builder, version, json.dumps([args, kwargs or {}, theme], sort_keys=True, default=str))
+
+    def get_or_build(self, key, build):
+        """Return the payload for key, calling build() to create the figure only on a miss"""
+        with self._lock:
+            payload = self._lookup(key)
+            if payload is not None:
+                return json.loads(payload)
+            build_lock = self._building.setdefault(key, threading.Lock())
+
+        with build_lock:
+            # Another session may have built it while this one waited
+            with self._lock:
+                payload = self._lookup(key)
+            if payload is None:
+                try:
+                    payload = build().to_json()
+                except Exception:
+                    with self._lock:
+                        self._building.pop(key, None)
+                    raise
+                with self._lock:
+                    self.misses += 1
+                    self._payloads[key] = payload
+                    while len(self._payloads) > self.max_entries:
+                        self._payloads.popitem(last=False)
+                    self._building.pop(key, None)
+        return json.loads(payload)
+
+    def _lookup(self, key):
+        payload = self._payloads.get(key)
+        if payload is not None:
+            self._payloads.move_to_end(key)
+            self.hits += 1
+        return payload
+
+    def invalidate(self, version=None):
+        """Drop every cached figure, or only those built from one data version"""
+        with self._lock:
+            if version is None:
+                self._payloads.clear()
+            else:
+                for key in [k for k in self._payloads if k[1] == version]:
+                    del self._payloads[key]
+
+
+def cached_figure(builder):
+    """Serve a DashboardComponents figure builder from its figure cache, if it has one"""
+    @functools.wraps(builder)
+    def wrapper(self, *args, **kwargs):
+        if self.figure_cache is None:
+            return builder(self, *args, **kwargs)
+        key = FigureCache.key(builder.__name__, self.data_version, args, kwargs, self.colors)
+        return self.figure_cache.get_or_build(key, lambda: builder(self, *args, **kwargs))
+    return wrapper
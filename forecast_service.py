@@ -0,0 +1,331 @@
+import os
+import json
+import time
+import pickle
+import argparse
+from datetime import datetime, timedelta
+import pandas as pd
+
+from config import FORECAST_CONFIG, MODEL_CONFIG, TRAINING_CONFIG
+from covariates import default_pipeline
+from data_processor import load_readings
+from lstm_export import EXPORT_FILE, NumpyGlobalLSTMRunner, NumpyLSTMRunner
+from statistical_forecaster import StatisticalForecaster, create_forecaster
+from training_orchestrator import GLOBAL_MODEL_NAME, checkpoint_path, save_checkpoint
+
+
+class ForecastStore:
+    """Forecasts per site and horizon, persisted as JSON with the latest run kept in memory"""
+
+    def __init__(self, store_dir):
+        self.store_dir = store_dir
+        self.history_dir = os.path.join(store_dir, 'history')
+        os.makedirs(self.history_dir, exist_ok=True)
+        self._latest = {}  # site -> (file mtime, forecast record)
+
+    def _latest_path(self, site):
+        return os.path.join(self.store_dir, f'{site}.json')
+
+    def write(self, forecast):
+        """Persist a forecast record as the site's latest and append it to its history"""
+        site = forecast['site']
+        path = self._latest_path(site)
+
+        # Write to a temporary file first so readers never see a partial forecast
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(forecast, f)
+        os.replace(tmp_path, path)
+
+        with open(os.path.join(self.history_dir, f'{site}.jsonl'), 'a') as f:
+            f.write(json.dumps(forecast) + '\n')
+
+        self._latest[site] = (os.stat(path).st_mtime, forecast)
+
+    def latest(self, site):
+        """Return the most recent forecast for a site, or None if none was scored yet"""
+        path = self._latest_path(site)
+        try:
+            mtime = os.stat(path).st_mtime
+        except FileNotFoundError:
+            return None
+
+        cached = self._latest.get(site)
+        if cached is None or cached[0] != mtime:
+            with open(path, 'r') as f:
+                cached = (mtime, json.load(f))
+            self._latest[site] = cached
+        return cached[1]
+
+    def history(self, site):
+        """Return every stored forecast run for a site, oldest first"""
+        path = os.path.join(self.history_dir, f'{site}.jsonl')
+        if not os.path.exists(path):
+            return []
+        with open(path, 'r') as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    def history_since(self, site, offset=0):
+        """Return (end offset, record) for every forecast run appended after a byte offset
+
+        Keeping the offset of the last consumed record lets readers follow
+        the history without re-reading it from the start.
+        """
+        path = os.path.join(self.history_dir, f'{site}.jsonl')
+        if not os.path.exists(path):
+            return []
+        records = []
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break  # Record still being appended
+                offset += len(line)
+                if line.strip():
+                    records.append((offset, json.loads(line)))
+        return records
+
+    def sites(self):
+        """List sites that have a latest forecast (files directly in store_dir are forecasts only)"""
+        return sorted(
+            f[:-len('.json')] for f in os.listdir(self.store_dir) if f.endswith('.json')
+        )
+
+
+class ForecastService:
+    """Batch scoring job that keeps per-site forecasts in a ForecastStore up to date
+
+    The service keeps its own files under <store_dir>/service: the last
+    reading scored per site, and the statistical forecasters it fitted, so
+    a fresh process (e.g. each --once run) only refits models that are due.
+    LSTMs it has to train itself are saved as regular checkpoints.
+    """
+
+    def __init__(self, config=None, model_config=None, store=None):
+        self.config = config if config is not None else FORECAST_CONFIG
+        self.model_config = model_config if model_config is not None else MODEL_CONFIG
+        self.store = store if store is not None else ForecastStore(self.config['store_dir'])
+        self.horizon = self.config['horizon']
+        self._models = {}  # site -> (model, trained_at, kind)
+        self.service_dir = os.path.join(self.store.store_dir, 'service')
+        os.makedirs(os.path.join(self.service_dir, 'models'), exist_ok=True)
+        self._state_path = os.path.join(self.service_dir, 'state.json')
+        self._state = self._load_state()
+
+    def _load_state(self):
+        if os.path.exists(self._state_path):
+            with open(self._state_path, 'r') as f:
+                return json.load(f)
+        # Earlier versions kept the state among the forecasts, where it was listed as a site
+        legacy_path = os.path.join(self.store.store_dir, 'state.json')
+        if os.path.exists(legacy_path):
+            with open(legacy_path, 'r') as f:
+                state = json.load(f)
+            self._state = state
+            self._save_state()
+            os.remove(legacy_path)
+            return state
+        return {}
+
+    def _save_state(self):
+        tmp_path = f'{self._state_path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self._state, f)
+        os.replace(tmp_path, self._state_path)
+
+    def _model_path(self, site):
+        return os.path.join(self.service_dir, 'models', f'{site}.pkl')
+
+    def split_sites(self, df):
+        """Split readings into one time-ordered feature frame per site"""
+        site_column = self.config['site_column']
+        if site_column in df.columns:
+            groups = df.groupby(site_column)
+        else:
+            groups = [(self.config['default_site'], df)]
+
+        covariates = default_pipeline()
+        frames = {}
+        for site, site_df in groups:
+            site_df = site_df.sort_values('timestamp')
+            frames[str(site)] = covariates.join(site_df.set_index('timestamp')[self.config['features']])
+        return frames
+
+    def _needs_training(self, site, kind=None):
+        kind = kind if kind is not None else self.model_kind(site)
+        if site not in self._models and os.path.exists(self._model_path(site)):
+            with open(self._model_path(site), 'rb') as f:
+                self._models[site] = pickle.load(f)
+        if site not in self._models or self._models[site][2] != kind:
+            return True
+        trained_at = self._models[site][1]
+        retrain_after = timedelta(hours=self.config['retrain_interval_hours'])
+        return datetime.now() - trained_at >= retrain_after
+
+    def model_kind(self, site):
+        """Forecaster selected for a site"""
+        return self.config['site_models'].get(site, self.config['default_model'])
+
+    def _train(self, site, frame, kind=None):
+        """Fit a fresh forecaster on the history of a site"""
+        kind = kind if kind is not None else self.model_kind(site)
+        if kind == 'lstm':
+            # Prefer the checkpoint written by the nightly training orchestrator
+            path = checkpoint_path(TRAINING_CONFIG['checkpoint_dir'], site)
+            exported = os.path.join(path, EXPORT_FILE)
+            if self.config['use_exported'] and os.path.exists(exported):
+                model = NumpyLSTMRunner(exported)  # No TensorFlow runtime needed
+            elif os.path.exists(path):
+                from lstm_model import EnergyLSTM
+                model = EnergyLSTM.load(path)
+            else:
+                from lstm_model import EnergyLSTM  # TensorFlow is only needed to train here
+                model = EnergyLSTM(self.model_config)
+                X_train, X_val, y_train, y_val = model.preprocess_data(frame.to_numpy(dtype=float))
+                model.train(X_train, y_train, X_val, y_val, verbose=0)
+                save_checkpoint(model, path, trained_through=frame.index[-1].isoformat())
+            self._models[site] = (model, datetime.now(), kind)
+        else:
+            model = create_forecaster(kind).fit(frame)
+            self._models[site] = (model, datetime.now(), kind)
+            tmp_path = f'{self._model_path(site)}.tmp'
+            with open(tmp_path, 'wb') as f:
+                pickle.dump(self._models[site], f)
+            os.replace(tmp_path, self._model_path(site))
+        return model
+
+    def _future_index(self, index):
+        """Timestamps of the next forecast steps, spaced like the recent readings"""
+        step = pd.Series(index[-self.model_config['sequence_length']:]).diff().median()
+        if pd.isna(step):
+            step = pd.Timedelta(hours=1)
+        return [index[-1] + step * (i + 1) for i in range(self.horizon)]
+
+    def score_site(self, site, frame, kind=None):
+        """Forecast the next horizon steps for one site and store the result
+
+        kind overrides the site's configured forecaster.
+        """
+        if self._needs_training(site, kind):
+            model = self._train(site, frame, kind)
+        else:
+            model = self._models[site][0]
+
+        # Only the latest window is scored; the model is reused until it is due for retraining
+        if isinstance(model, StatisticalForecaster):
+            values = model.forecast(frame, self.horizon)
+        else:
+            last_sequence = model.scaler.transform(
+                frame.to_numpy(dtype=float)[-model.sequence_length:]
+            )
+            target_idx = self.config['features'].index(self.config['target'])
+            values = model.forecast_next_24h(last_sequence)[:self.horizon, target_idx]
+
+        return self._write_forecast(site, frame, values, type(model).__name__)
+
+    def score_global(self, frames, training_frames=None):
+        """Forecast every given site with the shared GlobalEnergyLSTM in one batched call
+
+        Without a checkpoint the model is first trained here, on
+        training_frames (default: frames). Sites the model was not trained
+        on get no forecast and are left out of the returned list.
+        """
+        if self._needs_training(GLOBAL_MODEL_NAME, 'global_lstm'):
+            path = checkpoint_path(TRAINING_CONFIG['checkpoint_dir'], GLOBAL_MODEL_NAME)
+            exported = os.path.join(path, EXPORT_FILE)
+            if self.config['use_exported'] and os.path.exists(exported):
+                model = NumpyGlobalLSTMRunner(exported)  # No TensorFlow runtime needed
+            elif os.path.exists(path):
+                from lstm_model import GlobalEnergyLSTM
+                model = GlobalEnergyLSTM.load(path)
+            else:
+                from lstm_model import GlobalEnergyLSTM  # TensorFlow is only needed to train here
+                model = GlobalEnergyLSTM(self.model_config)
+                training_frames = training_frames if training_frames is not None else frames
+                X_train, X_val, y_train, y_val = model.preprocess_series(training_frames)
+                model.train(X_train, y_train, X_val, y_val, verbose=0)
+                last_observed = max(frame.index[-1] for frame in training_frames.values())
+                save_checkpoint(model, path, trained_through=last_observed.isoformat())
+            self._models[GLOBAL_MODEL_NAME] = (model, datetime.now(), 'global_lstm')
+        else:
+            model = self._models[GLOBAL_MODEL_NAME][0]
+
+        target_idx = self.config['features'].index(self.config['target'])
+        forecasts = model.forecast_all(frames, self.horizon)
+        return [
+            self._write_forecast(site, frames[site], values[:, target_idx], type(model).__name__)
+            for site, values in forecasts.items()
+        ]
+
+    def _write_forecast(self, site, frame, values, model_name):
+        forecast = {
+            'site': site,
+            'generated_at': datetime.now().isoformat(),
+            'last_observed': frame.index[-1].isoformat(),
+            'model': model_name,
+            'target': self.config['target'],
+            'horizons': list(range(1, self.horizon + 1)),
+            'timestamps': [ts.isoformat() for ts in self._future_index(frame.index)],
+            'values': [float(v) for v in values]
+        }
+        self.store.write(forecast)
+        return forecast
+
+    def run_batch(self, df):
+        """Score every site that received new readings since its last forecast"""
+        frames = {
+            site: frame for site, frame in self.split_sites(df).items()
+            if len(frame) > self.model_config['sequence_length']
+        }
+        # Sites with no new readings keep their stored forecast
+        stale = {
+            site: frame for site, frame in frames.items()
+            if self._state.get(site) != frame.index[-1].isoformat()
+        }
+
+        # Sites on the global model are scored together, the rest one by one
+        global_sites = {s: f for s, f in stale.items() if self.model_kind(s) == 'global_lstm'}
+        scored = []
+        if global_sites:
+            # A global model trained here learns every global site, not just the stale ones
+            training_frames = {s: f for s, f in frames.items() if self.model_kind(s) == 'global_lstm'}
+            scored += [forecast['site'] for forecast in self.score_global(global_sites, training_frames)]
+        for site, frame in stale.items():
+            if site in scored:
+                continue
+            # Sites the global model has not been trained on yet use the fallback forecaster
+            self.score_site(site, frame, self.config['global_fallback_model'] if site in global_sites else None)
+            scored.append(site)
+
+        for site in scored:
+            self._state[site] = stale[site].index[-1].isoformat()
+        self._save_state()
+        return scored
+
+    def run_forever(self, load_fn=None):
+        """Re-run the batch job on a fixed schedule"""
+        load_fn = load_fn if load_fn is not None else (
+            lambda: load_readings(self.config['data_folder'])
+        )
+        interval = self.config['refresh_interval_minutes'] * 60
+
+        while True:
+            started = time.time()
+            df = load_fn()
+            if not df.empty:
+                scored = self.run_batch(df)
+                print(f"[{datetime.now():%Y-%m-%d %H:%M:%S}] scored {len(scored)} site(s) "
+                      f"in {time.time() - started:.1f}s")
+            time.sleep(max(0, interval - (time.time() - started)))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Batch forecast scoring job")
+    parser.add_argument('--once', action='store_true', help="Run a single batch and exit")
+    args = parser.parse_args()
+
+    service = ForecastService()
+    if args.once:
+        print(f"Scored sites: {service.run_batch(load_readings(service.config['data_folder']))}")
+    else:
+        service.run_forever()
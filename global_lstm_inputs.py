@@ -0,0 +1,84 @@
+import numpy as np
+import pandas as pd
+
+
+class GlobalSeriesInputs:
+    """Input windows and batched inference of a global LSTM, without TensorFlow
+
+    Shared by GlobalEnergyLSTM and the exported NumpyGlobalLSTMRunner so both
+    build identical inputs. Every timestep carries the series' scaled
+    features, a one-hot series identifier and hour/weekday calendar
+    encodings. Classes using it provide sequence_length, series, scalers and
+    n_features, and _predict_windows(), which maps a batch of windows to
+    scaled next-step predictions.
+    """
+
+    def _require_model(self):
+        """Raise if there is nothing to predict with; exported runners always have weights"""
+
+    def _predict_windows(self, windows):
+        """Scaled next-step predictions for windows of shape (n, sequence_length, inputs)"""
+        raise NotImplementedError
+
+    def _calendar(self, index):
+        """Cyclical hour-of-day and day-of-week encodings"""
+        index = pd.DatetimeIndex(index)
+        hour = 2 * np.pi * index.hour.to_numpy() / 24
+        dow = 2 * np.pi * index.dayofweek.to_numpy() / 7
+        return np.column_stack([np.sin(hour), np.cos(hour), np.sin(dow), np.cos(dow)])
+
+    def _inputs(self, name, scaled, index):
+        """Stack scaled features, series one-hot and calendar features per timestep"""
+        one_hot = np.zeros((len(scaled), len(self.series)))
+        one_hot[:, self.series.index(name)] = 1
+        return np.hstack([scaled, one_hot, self._calendar(index)])
+
+    def _last_windows(self, frames, names):
+        windows = []
+        for name in names:
+            frame = frames[name].sort_index().iloc[-self.sequence_length:]
+            scaled = self.scalers[name].transform(frame.to_numpy(dtype=float))
+            windows.append(self._inputs(name, scaled, frame.index))
+        return np.stack(windows)
+
+    def predict_all(self, frames):
+        """Predict the next step of every series in one batched call"""
+        self._require_model()
+
+        names = [name for name in frames if name in self.scalers]
+        predictions = self._predict_windows(self._last_windows(frames, names))
+        return {
+            name: self.scalers[name].inverse_transform(predictions[i:i + 1])[0]
+            for i, name in enumerate(names)
+        }
+
+    def forecast_all(self, frames, horizon=24):
+        """Recursively forecast horizon steps for every series, batched across series"""
+        self._require_model()
+
+        names = [name for name in frames if name in self.scalers]
+        windows = self._last_windows(frames, names)
+
+        # Future timestamps per series, spaced like its recent readings
+        future = []
+        for name in names:
+            index = frames[name].sort_index().index[-self.sequence_length:]
+            step = pd.Series(index).diff().median()
+            step = step if not pd.isna(step) else pd.Timedelta(hours=1)
+            future.append(self._calendar([index[-1] + step * (h + 1) for h in range(horizon)]))
+
+        steps = []
+        for h in range(horizon):
+            pred = self._predict_windows(windows)
+            steps.append(pred)
+
+            next_inputs = windows[:, -1].copy()
+            next_inputs[:, :self.n_features] = pred
+            next_inputs[:, -4:] = np.stack([f[h] for f in future])
+            windows = np.concatenate([windows[:, 1:], next_inputs[:, None]], axis=1)
+
+        steps = np.stack(steps, axis=1)  # (series, horizon, features)
+        return {
+            name: self.scalers[name].inverse_transform(steps[i])
+            for i, name in enumerate(names)
+        }
@@ -0,0 +1,161 @@
+import os
+import numpy as np
+import pandas as pd
+
+from calendar_features import calendar_columns
+
+
+class HeatmapCube:
+    """Hour-of-week (7x24, and 7x24xZ per zone) sums and counts of a metric
+
+    Readings are folded in as they arrive and kept as per-day deltas: one
+    24-hour row of sums and counts per calendar day. Running totals per
+    weekday answer the full-history heatmap in constant time; any date range
+    is answered by summing the deltas of its days, seven strided sums over
+    at most a few thousand rows.
+    """
+
+    _ARRAYS = ('sums', 'counts', 'zone_sums', 'zone_counts',
+               'totals', 'total_counts', 'zone_totals', 'zone_total_counts')
+
+    def __init__(self, n_zones=0):
+        self.origin = None  # date_ordinal of the first day row
+        self.rows = 0  # Readings folded in, to check the cube against its store
+        self.sums = np.zeros((0, 24))
+        self.counts = np.zeros((0, 24), dtype=np.int64)
+        self.zone_sums = np.zeros((0, 24, n_zones))
+        self.zone_counts = np.zeros((0, 24, n_zones), dtype=np.int64)
+        self.totals = np.zeros((7, 24))
+        self.total_counts = np.zeros((7, 24), dtype=np.int64)
+        self.zone_totals = np.zeros((7, 24, n_zones))
+        self.zone_total_counts = np.zeros((7, 24, n_zones), dtype=np.int64)
+
+    @property
+    def n_zones(self):
+        return self.zone_sums.shape[2]
+
+    @classmethod
+    def from_frame(cls, df, metric='total_consumption'):
+        """Cube of one metric of a frame of readings (no per-zone part)"""
+        cube = cls()
+        if not df.empty:
+            cube.add(df['timestamp'], df[metric])
+        return cube
+
+    def add(self, timestamps, values, zone_values=None):
+        """Fold in readings: values per reading, zone_values a (readings, zones) matrix"""
+        calendar = calendar_columns(timestamps, names=('hour', 'dow', 'date_ordinal'))
+        if len(calendar['hour']) == 0:
+            return self
+        days = calendar['date_ordinal'].astype(np.int64)
+        hours = calendar['hour'].astype(np.int64)
+        dows = calendar['dow'].astype(np.int64)
+        self._grow_days(int(days.min()), int(days.max()))
+        day_index = days - self.origin
+
+        values = np.asarray(values, dtype=np.float64)
+        observed = ~np.isnan(values)
+        np.add.at(self.sums, (day_index[observed], hours[observed]), values[observed])
+        np.add.at(self.counts, (day_index[observed], hours[observed]), 1)
+        np.add.at(self.totals, (dows[observed], hours[observed]), values[observed])
+        np.add.at(self.total_counts, (dows[observed], hours[observed]), 1)
+
+        if zone_values is not None:
+            zone_values = np.asarray(zone_values, dtype=np.float64)
+            self._grow_zones(zone_values.shape[1])
+            for zone in range(zone_values.shape[1]):
+                column = zone_values[:, zone]
+                observed = ~np.isnan(column)
+                index = (day_index[observed], hours[observed], zone)
+                np.add.at(self.zone_sums, index, column[observed])
+                np.add.at(self.zone_counts, index, 1)
+                index = (dows[observed], hours[observed], zone)
+                np.add.at(self.zone_totals, index, column[observed])
+                np.add.at(self.zone_total_counts, index, 1)
+
+        self.rows += len(values)
+        return self
+
+    def _grow_days(self, first, last):
+        if self.origin is None:
+            self.origin = first
+        if first < self.origin:
+            pad = self.origin - first
+            self.sums = np.concatenate([np.zeros((pad, 24)), self.sums])
+            self.counts = np.concatenate([np.zeros((pad, 24), dtype=np.int64), self.counts])
+            self.zone_sums = np.concatenate([np.zeros((pad, 24, self.n_zones)), self.zone_sums])
+            self.zone_counts = np.concatenate([np.zeros((pad, 24, self.n_zones), dtype=np.int64), self.zone_counts])
+            self.origin = first
+        pad = last - self.origin + 1 - len(self.sums)
+        if pad > 0:
+            self.sums = np.concatenate([self.sums, np.zeros((pad, 24))])
+            self.counts = np.concatenate([self.counts, np.zeros((pad, 24), dtype=np.int64)])
+            self.zone_sums = np.concatenate([self.zone_sums, np.zeros((pad, 24, self.n_zones))])
+            self.zone_counts = np.concatenate([self.zone_counts, np.zeros((pad, 24, self.n_zones), dtype=np.int64)])
+
+    def _grow_zones(self, n_zones):
+        pad = n_zones - self.n_zones
+        if pad <= 0:
+            return
+        widen = lambda a: np.concatenate([a, np.zeros(a.shape[:-1] + (pad,), dtype=a.dtype)], axis=-1)
+        self.zone_sums, self.zone_counts = widen(self.zone_sums), widen(self.zone_counts)
+        self.zone_totals, self.zone_total_counts = widen(self.zone_totals), widen(self.zone_total_counts)
+
+    def _day_range(self, start, end):
+        """Day rows [lo, hi) covering start <= date <= end (both dates or timestamps)"""
+        day = lambda value: int(pd.Timestamp(value).to_datetime64().astype('datetime64[D]').astype(np.int64))
+        lo, hi = 0, len(self.sums)
+        if start is not None:
+            lo = min(max(day(start) - self.origin, 0), hi)
+        if end is not None:
+            hi = max(min(day(end) - self.origin + 1, hi), lo)
+        return lo, hi
+
+    def cube(self, start=None, end=None, zones=False):
+        """(sums, counts) by weekday (Monday first) and hour, optionally restricted to a date range
+
+        With zones=True the arrays are 7x24xZ, one slice per zone.
+        """
+        if zones:
+            sums, counts, totals, total_counts = self.zone_sums, self.zone_counts, self.zone_totals, self.zone_total_counts
+        else:
+            sums, counts, totals, total_counts = self.sums, self.counts, self.totals, self.total_counts
+        if self.origin is None or (start is None and end is None):
+            return totals.copy(), total_counts.copy()
+
+        lo, hi = self._day_range(start, end)
+        range_sums = np.zeros_like(totals)
+        range_counts = np.zeros_like(total_counts)
+        for offset in range(7):
+            day = lo + offset
+            dow = (self.origin + day + 3) % 7  # 1970-01-01 was a Thursday
+            range_sums[dow] = sums[day:hi:7].sum(axis=0)
+            range_counts[dow] = counts[day:hi:7].sum(axis=0)
+        return range_sums, range_counts
+
+    def means(self, start=None, end=None, zones=False):
+        """Mean per weekday and hour; NaN where there are no readings"""
+        sums, counts = self.cube(start, end, zones)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(counts > 0, sums / np.maximum(counts, 1), np.nan)
+
+    def save(self, path):
+        """Write the cube to one .npz file, replaced atomically"""
+        tmp_path = f'{path}.tmp.npz'
+        np.savez(tmp_path, origin=np.int64(-1 if self.origin is None else self.origin),
+                 rows=np.int64(self.rows), **{name: getattr(self, name) for name in self._ARRAYS})
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """Cube saved at path, or None if there is none"""
+        if not os.path.exists(path):
+            return None
+        cube = cls()
+        with np.load(path) as data:
+            origin = int(data['origin'])
+            cube.origin = None if origin < 0 else origin
+            cube.rows = int(data['rows'])
+            for name in cls._ARRAYS:
+                setattr(cube, name, data[name])
+        return cube
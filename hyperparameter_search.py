@@ -0,0 +1,209 @@
+import os
+import time
+import shutil
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import pandas as pd
+
+from config import FORECAST_CONFIG, HYPERPARAM_SPACE, MODEL_CONFIG, TUNING_CONFIG
+from data_processor import load_readings
+from training_orchestrator import _init_worker, save_checkpoint, series_frames
+
+
+def _run_trial(trial_id, params, values, epochs, target_idx, model_config, work_dir):
+    """Train one trial for a number of additional epochs (runs inside a worker process)
+
+    Trials promoted to the next rung resume from their saved weights instead
+    of starting over.
+    """
+    from lstm_model import EnergyLSTM
+
+    config = dict(model_config, **params, epochs=epochs)
+    path = os.path.join(work_dir, f'trial_{trial_id}')
+    if os.path.exists(path):
+        model = EnergyLSTM.load(path)
+        model.config = config
+    else:
+        model = EnergyLSTM(config)
+
+    X_train, X_val, y_train, y_val = model.preprocess_data(values)
+
+    started = time.perf_counter()
+    history = model.train(X_train, y_train, X_val, y_val, verbose=0)
+    train_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    predictions = model.model.predict(X_val, verbose=0)
+    inference_seconds = time.perf_counter() - started
+
+    # Accuracy on the target in original units
+    predictions = model.scaler.inverse_transform(predictions)[:, target_idx]
+    actual = model.scaler.inverse_transform(y_val)[:, target_idx]
+
+    save_checkpoint(model, path)
+
+    return {
+        'trial': trial_id,
+        'epochs_run': len(history.history['loss']),
+        'val_mae': float(np.mean(np.abs(predictions - actual))),
+        'train_seconds': train_seconds,
+        'inference_ms': 1000 * inference_seconds / max(1, len(X_val)),
+        'parameters': int(model.model.count_params())
+    }
+
+
+class HyperparameterSearch:
+    """Successive-halving search over EnergyLSTM hyperparameters with parallel CPU trials
+
+    All trials start on a small epoch budget; after each rung only the best
+    1/reduction_factor continue, with the budget multiplied by the same
+    factor, until max_epochs. A trial whose training fails is recorded as
+    failed and leaves the search. The leaderboard reports accuracy next to
+    the training and inference cost of every trial.
+    """
+
+    def __init__(self, space=None, config=None, model_config=None):
+        self.space = space if space is not None else HYPERPARAM_SPACE
+        self.config = config if config is not None else TUNING_CONFIG
+        self.model_config = model_config if model_config is not None else MODEL_CONFIG
+        self.work_dir = self.config['work_dir']
+        self.leaderboard = None
+
+    def sample(self, n_trials):
+        """Draw distinct random configurations from the search space"""
+        rng = np.random.default_rng(self.config['seed'])
+        keys = sorted(self.space)
+        total = int(np.prod([len(self.space[key]) for key in keys]))
+
+        trials, seen = [], set()
+        while len(trials) < min(n_trials, total):
+            params = {key: self.space[key][rng.integers(len(self.space[key]))] for key in keys}
+            fingerprint = repr(sorted(params.items()))
+            if fingerprint not in seen:
+                seen.add(fingerprint)
+                trials.append(params)
+        return trials
+
+    def budgets(self):
+        """Cumulative epoch budget of each rung"""
+        eta = self.config['reduction_factor']
+        budgets = [self.config['min_epochs']]
+        while budgets[-1] < self.config['max_epochs']:
+            budgets.append(min(budgets[-1] * eta, self.config['max_epochs']))
+        return budgets
+
+    def run(self, frame, target=None):
+        """Search on one time-indexed feature frame and return the leaderboard"""
+        target = target if target is not None else FORECAST_CONFIG['target']
+        target_idx = list(frame.columns).index(target)
+        values = frame.to_numpy(dtype=float)
+
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+        os.makedirs(self.work_dir)
+
+        params = self.sample(self.config['n_trials'])
+        records = {
+            i: dict(p, trial=i, status='running', rung=0, epochs=0,
+                    train_seconds=0.0, val_mae=np.nan, inference_ms=np.nan, parameters=0, error='')
+            for i, p in enumerate(params)
+        }
+
+        threads = self.config['threads_per_worker']
+        max_workers = self.config['max_workers'] or max(1, (os.cpu_count() or 1) // threads)
+        executor = ProcessPoolExecutor(
+            max_workers=max_workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker,
+            initargs=(threads,)
+        )
+
+        survivors = list(records)
+        budgets = self.budgets()
+        try:
+            for rung, budget in enumerate(budgets):
+                started = time.perf_counter()
+                futures = {
+                    executor.submit(
+                        _run_trial, i, params[i], values, budget - records[i]['epochs'],
+                        target_idx, self.model_config, self.work_dir
+                    ): i
+                    for i in survivors
+                }
+                for future in as_completed(futures):
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        records[futures[future]].update(status='failed', rung=rung, error=str(e))
+                        survivors.remove(futures[future])
+                        continue
+                    record = records[result['trial']]
+                    record.update(
+                        rung=rung,
+                        epochs=budget,
+                        val_mae=result['val_mae'],
+                        inference_ms=result['inference_ms'],
+                        parameters=result['parameters']
+                    )
+                    record['train_seconds'] += result['train_seconds']
+
+                print(f"Rung {rung}: {len(survivors)} trial(s) at {budget} epochs "
+                      f"in {time.perf_counter() - started:.1f}s, {len(futures) - len(survivors)} failed")
+
+                if rung == len(budgets) - 1 or not survivors:
+                    break
+
+                # Promote the best 1/eta of the trials, prune the rest
+                survivors.sort(key=lambda i: records[i]['val_mae'])
+                keep = max(1, len(survivors) // self.config['reduction_factor'])
+                for i in survivors[keep:]:
+                    records[i]['status'] = 'pruned'
+                survivors = survivors[:keep]
+        finally:
+            executor.shutdown(cancel_futures=True)
+
+        for i in survivors:
+            records[i]['status'] = 'completed'
+
+        self.leaderboard = pd.DataFrame(list(records.values())).sort_values(
+            ['rung', 'val_mae'], ascending=[False, True], ignore_index=True
+        )
+        self.leaderboard.to_csv(os.path.join(self.work_dir, 'leaderboard.csv'), index=False)
+        return self.leaderboard
+
+    def cheapest_meeting(self, target_mae):
+        """Cheapest trial (inference, then training cost) whose validation MAE meets the target
+
+        Only trials trained to the final budget count: a pruned trial's MAE
+        is from fewer epochs than its settings would be trained for.
+        """
+        if self.leaderboard is None:
+            raise ValueError("Run the search before querying the leaderboard")
+
+        completed = self.leaderboard[self.leaderboard['status'] == 'completed']
+        eligible = completed[completed['val_mae'] <= target_mae]
+        if eligible.empty:
+            return None
+        best = eligible.sort_values(['inference_ms', 'train_seconds', 'val_mae']).iloc[0]
+        return {key: best[key] for key in self.space} | {
+            'val_mae': best['val_mae'],
+            'inference_ms': best['inference_ms'],
+            'train_seconds': best['train_seconds'],
+            'trial': int(best['trial'])
+        }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Successive-halving search for EnergyLSTM")
+    parser.add_argument('--site', default=FORECAST_CONFIG['default_site'])
+    parser.add_argument('--target-mae', type=float, help="Report the cheapest model meeting this MAE")
+    args = parser.parse_args()
+
+    frames = series_frames(load_readings(FORECAST_CONFIG['data_folder']))
+    search = HyperparameterSearch()
+    leaderboard = search.run(frames[args.site])
+    print(leaderboard.to_string(index=False))
+
+    if args.target_mae is not None:
+        print(f"Cheapest model meeting MAE <= {args.target_mae}: {search.cheapest_meeting(args.target_mae)}")
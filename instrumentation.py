@@ -0,0 +1,239 @@
+import os
+import json
+import time
+import functools
+import threading
+import contextvars
+import tracemalloc
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+from config import INSTRUMENTATION_CONFIG
+
+_current = contextvars.ContextVar('current_span', default=None)
+
+
+def _sized(value):
+    return isinstance(value, (pd.DataFrame, pd.Series, np.ndarray))
+
+
+def default_rows(result, args):
+    """Rows a span worked on: the returned frame or array, else the instance's readings, else the first array argument"""
+    if _sized(result):
+        return len(result)
+    if args and isinstance(getattr(args[0], 'df', None), pd.DataFrame):
+        return len(args[0].df)
+    for arg in args:
+        if _sized(arg):
+            return len(arg)
+    return None
+
+
+def _attribute(key, value):
+    if isinstance(value, bool):
+        return {'key': key, 'value': {'boolValue': value}}
+    if isinstance(value, (int, np.integer)):
+        return {'key': key, 'value': {'intValue': str(int(value))}}  # OTLP JSON carries int64 as strings
+    if isinstance(value, (float, np.floating)):
+        return {'key': key, 'value': {'doubleValue': float(value)}}
+    return {'key': key, 'value': {'stringValue': str(value)}}
+
+
+class Span:
+    """One timed call: wall and CPU time, peak traced allocations and rows processed"""
+
+    __slots__ = ('name', 'trace_id', 'span_id', 'parent_id', 'attributes', 'start_ns', 'end_ns',
+                 'cpu_ns', 'base_bytes', 'peak_bytes', 'error', '_cpu_start', '_perf_start')
+
+    def __init__(self, name, parent, attributes):
+        self.name = name
+        self.trace_id = parent.trace_id if parent is not None else os.urandom(16).hex()
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent.span_id if parent is not None else ''
+        self.attributes = dict(attributes)
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.cpu_ns = 0
+        self.base_bytes = None  # Traced memory when the span started, if memory is traced
+        self.peak_bytes = 0  # Highest traced memory seen while the span was open
+        self.error = None
+        self._cpu_start = time.thread_time_ns()
+        self._perf_start = time.perf_counter_ns()
+
+    def to_otlp(self):
+        attributes = dict(self.attributes, **{'cpu.time_ms': self.cpu_ns / 1e6})
+        if self.base_bytes is not None:
+            attributes['memory.peak_bytes'] = max(self.peak_bytes - self.base_bytes, 0)
+        return {
+            'traceId': self.trace_id,
+            'spanId': self.span_id,
+            'parentSpanId': self.parent_id,
+            'name': self.name,
+            'kind': 1,  # SPAN_KIND_INTERNAL
+            'startTimeUnixNano': str(self.start_ns),
+            'endTimeUnixNano': str(self.end_ns),
+            'attributes': [_attribute(key, value) for key, value in attributes.items() if value is not None],
+            'status': {'code': 2, 'message': self.error} if self.error else {'code': 1}
+        }
+
+
+class Tracer:
+    """Opt-in spans around the expensive calls of the app, exported as OTLP JSON lines
+
+    Disabled, a traced call costs one attribute check. Enabled, each span
+    records wall time, CPU time of its thread and rows; with trace_memory it
+    also records the peak of tracemalloc-traced allocations above what was
+    allocated when it started (tracemalloc slows Python code down noticeably,
+    and spans running in parallel threads see each other's allocations).
+    The current span travels in a context variable, so panels computed on
+    the data layer's pool nest under the page render that submitted them.
+    Finished spans are buffered and written, one OTLP ExportTraceServiceRequest
+    per line, whenever a root span ends.
+    """
+
+    def __init__(self, config=None):
+        self.config = config if config is not None else INSTRUMENTATION_CONFIG
+        self.enabled = self.config['enabled']
+        self.path = self.config['export_path']
+        self._open = set()  # Spans whose memory peak is still being tracked
+        self._finished = []
+        self._lock = threading.Lock()
+
+    def enable(self, enabled=True):
+        """Switch tracing on or off for the whole process"""
+        self.enabled = enabled
+        if enabled and self.config['trace_memory'] and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        elif not enabled and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    def _sample_peak(self):
+        """Fold the traced peak into every open span, then restart peak tracking from now"""
+        current, peak = tracemalloc.get_traced_memory()
+        for span in self._open:
+            span.peak_bytes = max(span.peak_bytes, peak)
+        tracemalloc.reset_peak()
+        return current
+
+    @contextmanager
+    def span(self, name, **attributes):
+        """Time the enclosed block as a span; yields the span (None when tracing is off)"""
+        if not self.enabled:
+            yield None
+            return
+        span = Span(name, _current.get(), attributes)
+        if tracemalloc.is_tracing():
+            with self._lock:
+                span.base_bytes = span.peak_bytes = self._sample_peak()
+                self._open.add(span)
+        token = _current.set(span)
+        try:
+            yield span
+        except BaseException as exc:
+            span.error = f'{type(exc).__name__}: {exc}'
+            raise
+        finally:
+            _current.reset(token)
+            self._finish(span)
+
+    def _finish(self, span):
+        span.cpu_ns = time.thread_time_ns() - span._cpu_start
+        span.end_ns = span.start_ns + time.perf_counter_ns() - span._perf_start
+        with self._lock:
+            if span in self._open:
+                self._sample_peak()
+                self._open.discard(span)
+            self._finished.append(span)
+            if not span.parent_id or len(self._finished) >= self.config['max_buffered_spans']:
+                self._flush()
+
+    def _flush(self):
+        spans, self._finished = self._finished, []
+        request = {'resourceSpans': [{
+            'resource': {'attributes': [_attribute('service.name', self.config['service_name'])]},
+            'scopeSpans': [{'scope': {'name': __name__}, 'spans': [span.to_otlp() for span in spans]}]
+        }]}
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        if os.path.exists(self.path) and os.path.getsize(self.path) > self.config['max_bytes']:
+            os.replace(self.path, f'{self.path}.1')
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(request) + '\n')
+
+    def traced(self, name=None, rows=default_rows):
+        """Decorator recording a span per call, named after the function unless given a name
+
+        rows(result, args) gives the row count attribute; see default_rows.
+        """
+        def decorator(fn):
+            span_name = name or fn.__qualname__
+
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return fn(*args, **kwargs)
+                with self.span(span_name, **{'code.function': fn.__qualname__}) as span:
+                    result = fn(*args, **kwargs)
+                    span.attributes['rows'] = rows(result, args)
+                    return result
+            return wrapper
+        return decorator
+
+    def load(self, limit=None):
+        """Exported spans, most recent last: one row per span with times in milliseconds"""
+        paths = [path for path in (f'{self.path}.1', self.path) if os.path.exists(path)]
+        records = []
+        for path in paths:
+            with open(path) as f:
+                for line in f:
+                    for resource in json.loads(line)['resourceSpans']:
+                        for scope in resource['scopeSpans']:
+                            records.extend(scope['spans'])
+        if limit is not None:
+            records = records[-limit:]
+
+        rows = []
+        for record in records:
+            attributes = {item['key']: next(iter(item['value'].values())) for item in record['attributes']}
+            measured = {key: attributes.pop(key, np.nan) for key in ('cpu.time_ms', 'memory.peak_bytes', 'rows')}
+            start, end = int(record['startTimeUnixNano']), int(record['endTimeUnixNano'])
+            rows.append({
+                'name': record['name'],
+                'trace_id': record['traceId'],
+                'span_id': record['spanId'],
+                'parent_id': record['parentSpanId'],
+                'start': pd.Timestamp(start, unit='ns'),
+                'end': pd.Timestamp(end, unit='ns'),
+                'wall_ms': (end - start) / 1e6,
+                'cpu_ms': float(measured['cpu.time_ms']),
+                'peak_mb': float(measured['memory.peak_bytes']) / 2 ** 20,
+                'rows': float(measured['rows']),
+                'error': record['status'].get('message', '') if record['status'].get('code') == 2 else '',
+                'attributes': attributes
+            })
+        columns = ['name', 'trace_id', 'span_id', 'parent_id', 'start', 'end', 'wall_ms', 'cpu_ms',
+                   'peak_mb', 'rows', 'error', 'attributes']
+        return pd.DataFrame(rows, columns=columns)
+
+    @staticmethod
+    def summarize(spans):
+        """Per span name: calls, wall time percentiles, CPU time, peak memory and rows"""
+        grouped = spans.groupby('name')
+        summary = pd.DataFrame({
+            'calls': grouped.size(),
+            'p50_ms': grouped['wall_ms'].median(),
+            'p95_ms': grouped['wall_ms'].quantile(0.95),
+            'max_ms': grouped['wall_ms'].max(),
+            'cpu_ms': grouped['cpu_ms'].mean(),
+            'peak_mb': grouped['peak_mb'].max(),
+            'rows': grouped['rows'].mean(),
+            'errors': grouped['error'].apply(lambda errors: int((errors != '').sum()))
+        })
+        return summary.sort_values('p95_ms', ascending=False)
+
+
+TRACER = Tracer()
+if TRACER.enabled:
+    TRACER.enable()
+traced = TRACER.traced
@@ -0,0 +1,217 @@
+import json
+import time
+import numpy as np
+
+from global_lstm_inputs import GlobalSeriesInputs
+
+EXPORT_FILE = 'model.npz'
+
+
+def _quantize(weights, quantize):
+    """Encode a weight matrix as float32, float16 or per-column symmetric int8"""
+    if quantize == 'float16':
+        return {'w': weights.astype(np.float16)}
+    if quantize == 'int8':
+        scale = np.abs(weights).max(axis=0) / 127
+        scale[scale == 0] = 1
+        return {'q': np.round(weights / scale).astype(np.int8), 'scale': scale.astype(np.float32)}
+    return {'w': weights.astype(np.float32)}
+
+
+def _dequantize(arrays, prefix):
+    if f'{prefix}.q' in arrays:
+        return arrays[f'{prefix}.q'].astype(np.float32) * arrays[f'{prefix}.scale']
+    return arrays[f'{prefix}.w'].astype(np.float32)
+
+
+def export_model(lstm, path, quantize=None):
+    """Export a trained EnergyLSTM to a NumPy archive runnable without TensorFlow
+
+    quantize is None (float32), 'float16' or 'int8'; biases and the scaler
+    always stay in float32. A GlobalEnergyLSTM keeps its per-series scalers
+    and is served by NumpyGlobalLSTMRunner.
+    """
+    from tensorflow.keras.layers import LSTM, Dense
+
+    if lstm.model is None:
+        raise ValueError("Model needs to be trained before it can be exported")
+    if quantize not in (None, 'float16', 'int8'):
+        raise ValueError("quantize must be None, 'float16' or 'int8'")
+
+    arrays, layers = {}, []
+    for layer in lstm.model.layers:
+        if isinstance(layer, LSTM):
+            kernel, recurrent, bias = layer.get_weights()
+            name = f'lstm{len(layers)}'
+            layers.append({'type': 'lstm', 'name': name, 'units': layer.units,
+                           'return_sequences': layer.return_sequences})
+            for key, weights in (('kernel', kernel), ('recurrent', recurrent)):
+                for suffix, value in _quantize(weights, quantize).items():
+                    arrays[f'{name}.{key}.{suffix}'] = value
+            arrays[f'{name}.bias'] = bias.astype(np.float32)
+        elif isinstance(layer, Dense):
+            weights, bias = layer.get_weights()
+            name = f'dense{len(layers)}'
+            layers.append({'type': 'dense', 'name': name})
+            for suffix, value in _quantize(weights, quantize).items():
+                arrays[f'{name}.kernel.{suffix}'] = value
+            arrays[f'{name}.bias'] = bias.astype(np.float32)
+        # Dropout is a no-op at inference time
+
+    meta = {'sequence_length': lstm.sequence_length, 'quantize': quantize, 'layers': layers}
+    if hasattr(lstm, 'scalers'):
+        meta.update(series=lstm.series, n_features=lstm.n_features)
+        arrays['series.min'] = np.stack([lstm.scalers[name].min_ for name in lstm.series]).astype(np.float64)
+        arrays['series.scale'] = np.stack([lstm.scalers[name].scale_ for name in lstm.series]).astype(np.float64)
+    else:
+        arrays['scaler.min'] = lstm.scaler.min_.astype(np.float64)
+        arrays['scaler.scale'] = lstm.scaler.scale_.astype(np.float64)
+    arrays['meta'] = np.array(json.dumps(meta))
+
+    np.savez(path, **arrays)
+
+
+class _MinMaxScaler:
+    """Transform-only stand-in for a fitted sklearn MinMaxScaler"""
+
+    def __init__(self, min_, scale_):
+        self.min_ = min_
+        self.scale_ = scale_
+
+    def transform(self, X):
+        return np.asarray(X, dtype=float) * self.scale_ + self.min_
+
+    def inverse_transform(self, X):
+        return (np.asarray(X, dtype=float) - self.min_) / self.scale_
+
+
+def _sigmoid(x):
+    return 1 / (1 + np.exp(-x))
+
+
+class NumpyLSTMRunner:
+    """Pure NumPy inference for an exported EnergyLSTM
+
+    Mirrors EnergyLSTM's predict/forecast_next_24h, so it can stand in for
+    the Keras model wherever only inference is needed.
+    """
+
+    def __init__(self, path):
+        with np.load(path) as archive:
+            arrays = {key: archive[key] for key in archive.files}
+
+        meta = json.loads(str(arrays['meta']))
+        self.sequence_length = meta['sequence_length']
+        self.quantize = meta['quantize']
+        self._load_scalers(arrays, meta)
+
+        # Weights are dequantized once at load time and kept as float32
+        self.layers = []
+        for layer in meta['layers']:
+            name = layer['name']
+            if layer['type'] == 'lstm':
+                self.layers.append(('lstm', layer['units'], layer['return_sequences'],
+                                    _dequantize(arrays, f'{name}.kernel'),
+                                    _dequantize(arrays, f'{name}.recurrent'),
+                                    arrays[f'{name}.bias']))
+            else:
+                self.layers.append(('dense', _dequantize(arrays, f'{name}.kernel'),
+                                    arrays[f'{name}.bias']))
+
+    def _load_scalers(self, arrays, meta):
+        self.scaler = _MinMaxScaler(arrays['scaler.min'], arrays['scaler.scale'])
+
+    def _forward(self, X):
+        """Run the stacked LSTM on scaled windows of shape (n, sequence_length, features)"""
+        h = np.asarray(X, dtype=np.float32)
+        for layer in self.layers:
+            if layer[0] == 'dense':
+                _, kernel, bias = layer
+                h = h @ kernel + bias
+                continue
+
+            _, units, return_sequences, kernel, recurrent, bias = layer
+            # Input projections for every timestep at once; only the recurrence is sequential
+            projected = h @ kernel + bias
+            state = np.zeros((h.shape[0], units), dtype=np.float32)
+            cell = np.zeros_like(state)
+            outputs = []
+            for t in range(projected.shape[1]):
+                z = projected[:, t] + state @ recurrent
+                i = _sigmoid(z[:, :units])
+                f = _sigmoid(z[:, units:2 * units])
+                g = np.tanh(z[:, 2 * units:3 * units])
+                o = _sigmoid(z[:, 3 * units:])
+                cell = f * cell + i * g
+                state = o * np.tanh(cell)
+                if return_sequences:
+                    outputs.append(state)
+            h = np.stack(outputs, axis=1) if return_sequences else state
+        return h
+
+    def predict(self, X):
+        """Make predictions in original units from scaled windows"""
+        return self.scaler.inverse_transform(self._forward(X))
+
+    def forecast_next_24h(self, last_sequence):
+        """Forecast next 24 hours of consumption"""
+        predictions = []
+        current_sequence = np.array(last_sequence, dtype=np.float32)
+
+        for _ in range(24):
+            pred = self._forward(current_sequence.reshape(1, self.sequence_length, -1))[0]
+            predictions.append(pred)
+            current_sequence = np.roll(current_sequence, -1, axis=0)
+            current_sequence[-1] = pred
+
+        return self.scaler.inverse_transform(np.array(predictions))
+
+
+class NumpyGlobalLSTMRunner(GlobalSeriesInputs, NumpyLSTMRunner):
+    """Pure NumPy inference for an exported GlobalEnergyLSTM
+
+    Mirrors GlobalEnergyLSTM's predict_all/forecast_all, building the same
+    inputs: scaled features, series one-hot and hour/weekday encodings.
+    """
+
+    def _load_scalers(self, arrays, meta):
+        self.series = meta['series']
+        self.n_features = meta['n_features']
+        self.scalers = {
+            name: _MinMaxScaler(arrays['series.min'][i], arrays['series.scale'][i])
+            for i, name in enumerate(self.series)
+        }
+
+    def _predict_windows(self, windows):
+        return self._forward(windows)
+
+
+def check_parity(lstm, runner, X, tolerance=0.01):
+    """Compare exported and Keras predictions on the same scaled windows
+
+    The error is measured in original units and reported relative to the
+    mean absolute Keras prediction; parity holds if it is within tolerance.
+    A global model's windows mix series with scalers of their own, so its
+    predictions are compared in scaled units.
+    """
+    pooled = hasattr(lstm, 'scalers')
+    started = time.perf_counter()
+    expected = lstm.model.predict(X, verbose=0)
+    if not pooled:
+        expected = lstm.scaler.inverse_transform(expected)
+    keras_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    actual = runner._forward(X) if pooled else runner.predict(X)
+    numpy_seconds = time.perf_counter() - started
+
+    error = np.abs(actual - expected)
+    relative_error = float(error.mean() / max(np.abs(expected).mean(), 1e-12))
+    return {
+        'max_abs_error': float(error.max()),
+        'mean_abs_error': float(error.mean()),
+        'relative_error': relative_error,
+        'keras_ms': 1000 * keras_seconds,
+        'numpy_ms': 1000 * numpy_seconds,
+        'passed': relative_error <= tolerance
+    }
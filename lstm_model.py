@@ -1,3 +1,6 @@
+import os
+import json
+import pickle
 import numpy as np
 import pandas as pd
 from tensorflow.keras.models import Sequential
@@ -7,12 +10,16 @@ from sklearn.preprocessing import MinMaxScaler
 from sklearn.metrics import mean_absolute_error, mean_squared_error
 import tensorflow as tf
 
+from instrumentation import traced
+from global_lstm_inputs import GlobalSeriesInputs
+
 class EnergyLSTM:
     def __init__(self, config):
         self.config = config
         self.model = None
         self.scaler = MinMaxScaler()
         self.sequence_length = config['sequence_length']
+        self.reference_stats = None  # Scaled mean/std of the data the scaler was fitted on
         
     def create_sequences(self, data):
         """Create sequences for LSTM model"""
@@ -22,10 +29,15 @@ class EnergyLSTM:
             y.append(data[i + self.sequence_length])
         return np.array(X), np.array(y)
     
+    @traced()
     def preprocess_data(self, df):
         """Preprocess data for LSTM model"""
         # Scale the features
         scaled_data = self.scaler.fit_transform(df)
+        self.reference_stats = {
+            'mean': scaled_data.mean(axis=0).tolist(),
+            'std': scaled_data.std(axis=0).tolist()
+        }
         
         # Create sequences
         X, y = self.create_sequences(scaled_data)
@@ -37,16 +49,25 @@ class EnergyLSTM:
         
         return X_train, X_val, y_train, y_val
     
-    def build_model(self, input_shape):
+    def build_model(self, input_shape, output_dim=None):
         """Build LSTM model architecture"""
-        self.model = Sequential([
-            LSTM(self.config['lstm_units'], return_sequences=True, input_shape=input_shape),
-            Dropout(self.config['dropout_rate']),
-            LSTM(self.config['lstm_units'] // 2, return_sequences=True),
-            Dropout(self.config['dropout_rate']),
-            LSTM(self.config['lstm_units'] // 4),
-            Dense(input_shape[-1])  # Output dimension matches input features
-        ])
+        # Units of each LSTM layer as a fraction of lstm_units, three tapering layers by default
+        layer_stack = self.config.get('layer_stack', [1, 0.5, 0.25])
+
+        layers = []
+        for i, fraction in enumerate(layer_stack):
+            last = i == len(layer_stack) - 1
+            units = max(1, int(self.config['lstm_units'] * fraction))
+            if i == 0:
+                layers.append(LSTM(units, return_sequences=not last, input_shape=input_shape))
+            else:
+                layers.append(LSTM(units, return_sequences=not last))
+            if not last:
+                layers.append(Dropout(self.config['dropout_rate']))
+
+        # Output dimension matches input features unless told otherwise
+        layers.append(Dense(output_dim if output_dim is not None else input_shape[-1]))
+        self.model = Sequential(layers)
         
         self.model.compile(
             optimizer=Adam(learning_rate=0.001),
@@ -54,10 +75,11 @@ class EnergyLSTM:
             metrics=['mae']
         )
         
-    def train(self, X_train, y_train, X_val, y_val):
+    @traced()
+    def train(self, X_train, y_train, X_val, y_val, verbose=1):
         """Train the LSTM model"""
         if self.model is None:
-            self.build_model(X_train.shape[1:])
+            self.build_model(X_train.shape[1:], y_train.shape[-1])
             
         # Early stopping callback
         early_stopping = tf.keras.callbacks.EarlyStopping(
@@ -72,11 +94,82 @@ class EnergyLSTM:
             batch_size=self.config['batch_size'],
             validation_data=(X_val, y_val),
             callbacks=[early_stopping],
-            verbose=1
+            verbose=verbose
         )
         
         return history
     
+    def save(self, path):
+        """Save the trained model, scaler and config to a directory"""
+        if self.model is None:
+            raise ValueError("Model needs to be trained before it can be saved")
+
+        os.makedirs(path, exist_ok=True)
+        self.model.save(os.path.join(path, 'model.keras'))
+        with open(os.path.join(path, 'scaler.pkl'), 'wb') as f:
+            pickle.dump(self.scaler, f)
+        with open(os.path.join(path, 'config.json'), 'w') as f:
+            json.dump(self.config, f)
+        if self.reference_stats is not None:
+            with open(os.path.join(path, 'reference.json'), 'w') as f:
+                json.dump(self.reference_stats, f)
+
+    @classmethod
+    def load(cls, path):
+        """Load a model saved with save()"""
+        with open(os.path.join(path, 'config.json'), 'r') as f:
+            lstm = cls(json.load(f))
+        lstm.model = tf.keras.models.load_model(os.path.join(path, 'model.keras'))
+        with open(os.path.join(path, 'scaler.pkl'), 'rb') as f:
+            lstm.scaler = pickle.load(f)
+        reference_path = os.path.join(path, 'reference.json')
+        if os.path.exists(reference_path):
+            with open(reference_path, 'r') as f:
+                lstm.reference_stats = json.load(f)
+        return lstm
+
+    @traced()
+    def fine_tune(self, data, epochs, verbose=0):
+        """Continue training an existing model on new readings with the scaler kept fixed
+
+        data must start sequence_length readings before the first new one so
+        that every new reading gets a full input window.
+        """
+        if self.model is None:
+            raise ValueError("Model needs to be trained before it can be fine-tuned")
+
+        X, y = self.create_sequences(self.scaler.transform(data))
+        history = self.model.fit(
+            X, y,
+            epochs=epochs,
+            batch_size=self.config['batch_size'],
+            verbose=verbose
+        )
+        return history, X
+
+    def detect_drift(self, data, margin=0.1, max_out_of_range=0.05, max_mean_shift=3.0):
+        """Check whether new readings still fit the scaler the model was trained with
+
+        Drift is flagged when too many scaled values fall outside the fitted
+        [0, 1] range (plus margin), or when a feature's scaled mean moves more
+        than max_mean_shift reference standard deviations.
+        """
+        scaled = self.scaler.transform(data)
+        out_of_range = float(np.mean((scaled < -margin) | (scaled > 1 + margin)))
+
+        mean_shift = 0.0
+        if self.reference_stats is not None:
+            reference_mean = np.array(self.reference_stats['mean'])
+            reference_std = np.maximum(np.array(self.reference_stats['std']), 1e-6)
+            mean_shift = float(np.max(np.abs(scaled.mean(axis=0) - reference_mean) / reference_std))
+
+        return {
+            'out_of_range': out_of_range,
+            'mean_shift': mean_shift,
+            'drifted': out_of_range > max_out_of_range or mean_shift > max_mean_shift
+        }
+
+    @traced()
     def predict(self, X):
         """Make predictions using the trained model"""
         if self.model is None:
@@ -103,6 +196,7 @@ class EnergyLSTM:
             'rmse': rmse
         }
 
+    @traced()
     def forecast_next_24h(self, last_sequence):
         """Forecast next 24 hours of consumption"""
         predictions = []
@@ -119,4 +213,75 @@ class EnergyLSTM:
             current_sequence = np.roll(current_sequence, -1, axis=0)
             current_sequence[-1] = pred
             
-        return self.scaler.inverse_transform(np.array(predictions))
\ No newline at end of file
+        return self.scaler.inverse_transform(np.array(predictions))
+
+
+class GlobalEnergyLSTM(GlobalSeriesInputs, EnergyLSTM):
+    """One LSTM trained on windows pooled from many series (sites or zones)
+
+    Each series keeps its own MinMaxScaler. Every timestep of a window carries
+    the series' scaled features, a one-hot series identifier and hour/weekday
+    calendar encodings (see GlobalSeriesInputs); the network predicts the
+    next scaled features.
+    """
+
+    def __init__(self, config):
+        super().__init__(config)
+        self.series = []
+        self.scalers = {}
+        self.n_features = None
+
+    def _require_model(self):
+        if self.model is None:
+            raise ValueError("Model needs to be trained before making predictions")
+
+    def _predict_windows(self, windows):
+        return self.model.predict(windows, verbose=0)
+
+    def preprocess_series(self, frames):
+        """Fit per-series scalers and pool training/validation windows from every series
+
+        frames maps a series name to a time-indexed frame with the same
+        feature columns for every series.
+        """
+        self.series = sorted(frames)
+        self.n_features = frames[self.series[0]].shape[1]
+
+        X_train, X_val, y_train, y_val = [], [], [], []
+        for name in self.series:
+            frame = frames[name].sort_index()
+            scaler = MinMaxScaler()
+            scaled = scaler.fit_transform(frame.to_numpy(dtype=float))
+            self.scalers[name] = scaler
+
+            X, _ = self.create_sequences(self._inputs(name, scaled, frame.index))
+            y = scaled[self.sequence_length:]
+            if len(X) == 0:
+                continue
+
+            # Split each series in time so validation windows never precede training ones
+            train_size = int(len(X) * 0.8)
+            X_train.append(X[:train_size])
+            X_val.append(X[train_size:])
+            y_train.append(y[:train_size])
+            y_val.append(y[train_size:])
+
+        return (np.concatenate(X_train), np.concatenate(X_val),
+                np.concatenate(y_train), np.concatenate(y_val))
+
+    def save(self, path):
+        """Save the shared model together with the per-series scalers"""
+        super().save(path)
+        with open(os.path.join(path, 'series.pkl'), 'wb') as f:
+            pickle.dump({'series': self.series, 'scalers': self.scalers, 'n_features': self.n_features}, f)
+
+    @classmethod
+    def load(cls, path):
+        """Load a model saved with save()"""
+        lstm = super().load(path)
+        with open(os.path.join(path, 'series.pkl'), 'rb') as f:
+            state = pickle.load(f)
+        lstm.series = state['series']
+        lstm.scalers = state['scalers']
+        lstm.n_features = state['n_features']
+        return lstm
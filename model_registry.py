@@ -0,0 +1,93 @@
+import os
+import re
+import json
+import shutil
+from datetime import datetime
+
+from config import CONTINUAL_CONFIG
+
+
+class ModelRegistry:
+    """Version history of every site's model, with snapshots of the most recent versions
+
+    Each site has a JSON list of versions recording how the model was
+    produced ('full' retrain or 'fine_tune'), the last reading it has seen
+    and its training cost. The checkpoint of each version is copied to a
+    snapshot directory so older versions can be restored.
+    """
+
+    def __init__(self, registry_dir=None, keep_versions=None):
+        self.registry_dir = registry_dir if registry_dir is not None else CONTINUAL_CONFIG['registry_dir']
+        self.keep_versions = keep_versions if keep_versions is not None else CONTINUAL_CONFIG['keep_versions']
+        os.makedirs(self.registry_dir, exist_ok=True)
+
+    @staticmethod
+    def _name(site):
+        return re.sub(r'[^A-Za-z0-9_.-]', '_', str(site))
+
+    def _path(self, site):
+        return os.path.join(self.registry_dir, f'{self._name(site)}.json')
+
+    def _snapshot_path(self, site, version):
+        return os.path.join(self.registry_dir, 'snapshots', self._name(site), f'v{version}')
+
+    def versions(self, site):
+        """Every recorded version of a site's model, oldest first"""
+        path = self._path(site)
+        if not os.path.exists(path):
+            return []
+        with open(path, 'r') as f:
+            return json.load(f)
+
+    def latest(self, site):
+        """The most recent version of a site's model, or None if none was recorded"""
+        versions = self.versions(site)
+        return versions[-1] if versions else None
+
+    def record(self, site, checkpoint, kind, trained_through, **details):
+        """Snapshot a checkpoint as the site's next version and return its entry"""
+        if kind not in ('full', 'fine_tune'):
+            raise ValueError("kind must be 'full' or 'fine_tune'")
+
+        versions = self.versions(site)
+        version = versions[-1]['version'] + 1 if versions else 1
+
+        snapshot = self._snapshot_path(site, version)
+        shutil.rmtree(snapshot, ignore_errors=True)
+        shutil.copytree(checkpoint, snapshot)
+
+        entry = dict(
+            details,
+            version=version,
+            kind=kind,
+            created_at=datetime.now().isoformat(),
+            trained_through=trained_through,
+            snapshot=snapshot
+        )
+        versions.append(entry)
+
+        # Only the newest snapshots are kept; older versions stay in the history
+        for old in versions[:-self.keep_versions]:
+            if old.get('snapshot'):
+                shutil.rmtree(old['snapshot'], ignore_errors=True)
+                old['snapshot'] = None
+
+        path = self._path(site)
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(versions, f, indent=2)
+        os.replace(tmp_path, path)
+        return entry
+
+    def restore(self, site, version, checkpoint):
+        """Copy a kept snapshot back over a site's checkpoint"""
+        entry = next((v for v in self.versions(site) if v['version'] == version), None)
+        if entry is None or not entry.get('snapshot'):
+            raise ValueError(f"No snapshot kept for version {version} of '{site}'")
+
+        tmp_path = f'{checkpoint}.tmp'
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        shutil.copytree(entry['snapshot'], tmp_path)
+        shutil.rmtree(checkpoint, ignore_errors=True)
+        os.replace(tmp_path, checkpoint)
+        return entry
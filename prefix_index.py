@@ -0,0 +1,112 @@
+import numpy as np
+import pandas as pd
+
+from calendar_features import TOU_PEAK, calendar_columns
+from config import PREFIX_INDEX_CONFIG
+
+
+def zone_matrices(df, metrics):
+    """(zones, {metric: (rows, zones) matrix}) of per-zone metrics from the nested floor_data lists"""
+    floors = df['floor_data'].tolist()
+    zones = list(dict.fromkeys(f['floor'] for row in floors for f in row))
+    matrices = {metric: np.full((len(floors), len(zones)), np.nan) for metric in metrics}
+    position = {zone: i for i, zone in enumerate(zones)}
+    for row, readings in enumerate(floors):
+        for f in readings:
+            for metric, matrix in matrices.items():
+                matrix[row, position[f['floor']]] = f.get(metric, np.nan)
+    return zones, matrices
+
+
+def zone_matrix(df, metric):
+    """(zones, (rows, zones) matrix) of one per-zone metric"""
+    zones, matrices = zone_matrices(df, [metric])
+    return zones, matrices[metric]
+
+
+def cumulate(columns, tou_band, last=None):
+    """Running totals of each column, and of its peak-band part as '<name>@peak'
+
+    NaN readings count as 0. last holds the final running totals of earlier
+    rows, so appended rows continue the same sums.
+    """
+    peak = np.asarray(tou_band) == TOU_PEAK
+    sums = {}
+    for name, values in columns.items():
+        values = np.nan_to_num(np.asarray(values, dtype=np.float64))
+        mask = peak if values.ndim == 1 else peak[:, None]
+        for key, part in ((name, values), (f'{name}@peak', np.where(mask, values, 0.0))):
+            running = np.cumsum(part, axis=0)
+            if last is not None and key in last:
+                running += last[key]
+            sums[key] = running
+    return sums
+
+
+class PrefixIndex:
+    """Running totals of metrics over time-ordered readings
+
+    sums[name][i] is the total of rows 0..i, so the total over any date
+    range is two binary searches on the timestamps and one subtraction,
+    whatever the length of the history. Every metric is also indexed for
+    the peak TOU band ('<metric>@peak'); off-peak is the difference. Zone
+    metrics ('zone.<metric>') are (rows, zones) arrays.
+    """
+
+    def __init__(self, timestamps, sums, zones=()):
+        self.timestamps = timestamps  # int64 nanoseconds, ascending
+        self.sums = sums
+        self.zones = list(zones)
+
+    @classmethod
+    def from_frame(cls, df, metrics=None, zone_metrics=None):
+        """Index of a frame of readings (sorted by timestamp)"""
+        metrics = metrics if metrics is not None else PREFIX_INDEX_CONFIG['metrics']
+        zone_metrics = zone_metrics if zone_metrics is not None else PREFIX_INDEX_CONFIG['zone_metrics']
+        timestamps = pd.to_datetime(df['timestamp']).to_numpy().astype('datetime64[ns]').astype(np.int64)
+        tou_band = df['tou_band'] if 'tou_band' in df.columns else calendar_columns(timestamps, names=('tou_band',))['tou_band']
+
+        columns = {metric: df[metric] for metric in metrics if metric in df.columns}
+        zones = []
+        if 'floor_data' in df.columns and len(df):
+            for metric in zone_metrics:
+                zones, columns[f'zone.{metric}'] = zone_matrix(df, metric)
+        return cls(timestamps, cumulate(columns, tou_band), zones)
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def rows(self, start=None, end=None):
+        """Row positions [lo, hi) of the readings with start <= timestamp <= end"""
+        lo = 0 if start is None else int(np.searchsorted(self.timestamps, pd.Timestamp(start).value, 'left'))
+        hi = len(self) if end is None else int(np.searchsorted(self.timestamps, pd.Timestamp(end).value, 'right'))
+        return lo, max(lo, hi)
+
+    def _range_sum(self, key, lo, hi):
+        sums = self.sums[key]
+        if hi <= lo:
+            return np.zeros(sums.shape[1:]) if sums.ndim > 1 else 0.0
+        before = sums[lo - 1] if lo > 0 else 0.0
+        return np.asarray(sums[hi - 1] - before, dtype=np.float64) if sums.ndim > 1 else float(sums[hi - 1] - before)
+
+    def total(self, metric, start=None, end=None):
+        """Sum of a metric between start and end"""
+        return self._range_sum(metric, *self.rows(start, end))
+
+    def split(self, metric, start=None, end=None):
+        """(peak, off-peak) sums of a metric between start and end"""
+        lo, hi = self.rows(start, end)
+        total = self._range_sum(metric, lo, hi)
+        peak = self._range_sum(f'{metric}@peak', lo, hi)
+        return peak, total - peak
+
+    def count(self, start=None, end=None):
+        lo, hi = self.rows(start, end)
+        return hi - lo
+
+    def zone_split(self, metric, start=None, end=None):
+        """{zone: (total, peak)} sums of a zone metric between start and end"""
+        lo, hi = self.rows(start, end)
+        totals = self._range_sum(f'zone.{metric}', lo, hi)
+        peaks = self._range_sum(f'zone.{metric}@peak', lo, hi)
+        return {zone: (float(totals[i]), float(peaks[i])) for i, zone in enumerate(self.zones)}
@@ -0,0 +1,285 @@
+import threading
+import numpy as np
+import pandas as pd
+
+from calendar_features import CALENDAR_COLUMNS, calendar_columns, day_names, ordinal_dates
+
+def _calendar(name):
+    return lambda column: pd.Series(calendar_columns(column('timestamp'), names=(name,))[name],
+                                    index=column('timestamp').index)
+
+# Columns the planner derives from the readings when the source does not
+# already provide them; each is computed at most once per scan. Calendar
+# columns are normally materialized at ingest and only decoded here as a fallback.
+DERIVED_COLUMNS = {
+    **{name: _calendar(name) for name in CALENDAR_COLUMNS},
+    'date': lambda column: pd.Series(ordinal_dates(column('date_ordinal')), index=column('date_ordinal').index),
+    'day_name': lambda column: pd.Series(day_names(column('dow')), index=column('dow').index),
+    'is_weekend': lambda column: column('dow') >= 5,
+    # Shared equipment columns as load_readings() names them (nested keys flattened)
+    'computer_consumption': lambda column: column('shared_equipment.computer_consumption'),
+    'projector_consumption': lambda column: column('shared_equipment.projector_consumption'),
+    # Unoccupied readings have no per-occupant value rather than an infinite one
+    'consumption_per_occupant': lambda column: column('total_consumption') / column('occupancy_level').where(column('occupancy_level') > 0),
+}
+
+FILTER_OPS = {
+    '==': lambda values, value: values == value,
+    '!=': lambda values, value: values != value,
+    '<': lambda values, value: values < value,
+    '<=': lambda values, value: values <= value,
+    '>': lambda values, value: values > value,
+    '>=': lambda values, value: values >= value,
+    'in': lambda values, value: values.isin(value),
+    'not in': lambda values, value: ~values.isin(value),
+    'between': lambda values, value: values.between(*value),
+}
+
+AGGREGATIONS = ('sum', 'mean', 'min', 'max', 'count', 'std', 'nunique')
+
+
+class Query:
+    """Immutable, lazily evaluated filter -> derive -> group -> aggregate over the readings
+
+    Queries are built by chaining, e.g.
+        Query().filter('hour', 'in', range(9, 18)).group_by('date').agg(total=('total_consumption', 'sum'))
+    and evaluated by a QueryEngine. Derived columns (see DERIVED_COLUMNS)
+    can be used anywhere a column name is expected. Equal queries compare
+    and hash equal, which is what lets the engine share their work.
+    """
+
+    __slots__ = ('filters', 'keys', 'aggs')
+
+    def __init__(self, filters=(), keys=(), aggs=()):
+        self.filters = tuple(sorted(set(filters), key=repr))
+        self.keys = tuple(keys)
+        self.aggs = tuple(aggs)
+
+    def filter(self, column, op, value):
+        if op not in FILTER_OPS:
+            raise ValueError(f"Unknown filter operator '{op}'")
+        if op in ('in', 'not in', 'between'):
+            value = tuple(value)
+        return Query(self.filters + ((column, op, value),), self.keys, self.aggs)
+
+    def between(self, start=None, end=None):
+        """Restrict to start <= timestamp <= end; pushed down to the source's storage"""
+        query = self
+        if start is not None:
+            query = query.filter('timestamp', '>=', pd.Timestamp(start))
+        if end is not None:
+            query = query.filter('timestamp', '<=', pd.Timestamp(end))
+        return query
+
+    def group_by(self, *keys):
+        return Query(self.filters, keys, self.aggs)
+
+    def agg(self, **aggs):
+        """Named aggregations, name=(column, how)"""
+        for column, how in aggs.values():
+            if how not in AGGREGATIONS:
+                raise ValueError(f"Unknown aggregation '{how}'")
+        return Query(self.filters, self.keys, tuple(aggs.items()))
+
+    def _key(self):
+        return (self.filters, self.keys, self.aggs)
+
+    def __eq__(self, other):
+        return isinstance(other, Query) and self._key() == other._key()
+
+    def __hash__(self):
+        return hash(self._key())
+
+    def __repr__(self):
+        return f'Query(filters={self.filters}, keys={self.keys}, aggs={self.aggs})'
+
+    def scan_range(self):
+        """Split the filters into the timestamp range read from storage and the rest"""
+        start = end = None
+        residual = []
+        for column, op, value in self.filters:
+            if column == 'timestamp' and op in ('>=', 'between'):
+                low = pd.Timestamp(value if op == '>=' else value[0])
+                start = low if start is None else max(start, low)
+            if column == 'timestamp' and op in ('<=', 'between'):
+                high = pd.Timestamp(value if op == '<=' else value[1])
+                end = high if end is None else min(end, high)
+            if not (column == 'timestamp' and op in ('>=', '<=', 'between')):
+                residual.append((column, op, value))
+        return (start, end), tuple(residual)
+
+
+class _Scan:
+    """One read of the source, with the derived columns and filter masks computed on it"""
+
+    def __init__(self, frame):
+        self.frame = frame
+        self._columns = {}
+        self._masks = {}
+
+    def column(self, name):
+        if name == 'timestamp':
+            if name not in self._columns:
+                self._columns[name] = pd.to_datetime(self.frame[name])
+            return self._columns[name]
+        if name in self.frame.columns:
+            return self.frame[name]
+        if name not in self._columns:
+            if name not in DERIVED_COLUMNS:
+                raise ValueError(f"Unknown column '{name}'")
+            self._columns[name] = DERIVED_COLUMNS[name](self.column)
+        return self._columns[name]
+
+    def mask(self, filters):
+        """Boolean row mask of a conjunction of filters, or None when there are none"""
+        if not filters:
+            return None
+        if filters not in self._masks:
+            if len(filters) == 1:
+                column, op, value = filters[0]
+                mask = FILTER_OPS[op](self.column(column), value).to_numpy()
+            else:
+                # Every single-filter mask is cached too, so shared predicates are evaluated once
+                mask = np.logical_and.reduce([self.mask((f,)) for f in filters])
+            self._masks[filters] = mask
+        return self._masks[filters]
+
+    def aggregate(self, filters, keys, pairs):
+        """Evaluate every (column, how) pair of one filter/grouping in a single pass"""
+        mask = self.mask(filters)
+        columns = {column for column, _ in pairs} | set(keys)
+        data = pd.DataFrame({name: self.column(name) for name in columns}, copy=False)
+        if mask is not None:
+            data = data[mask]
+
+        if not keys:
+            return {(column, how): getattr(data[column], how)() for column, how in pairs}
+
+        # A group key can also be aggregated (e.g. counting rows per key), so aggregate a copy of it
+        spec = {}
+        for column, how in pairs:
+            source = column
+            if column in keys:
+                source = f'__{column}'
+                data[source] = data[column]
+            spec[f'{column}:{how}'] = (source, how)
+        grouped = data.groupby(list(keys), sort=True).agg(**spec)
+        return {pair: grouped[f'{pair[0]}:{pair[1]}'] for pair in pairs}
+
+
+class QueryEngine:
+    """Plans and evaluates Queries over one source of readings in batches
+
+    source is a DataFrame or any object with frame(start=..., end=...)
+    (SharedDataset, TimeSeriesStore). Queries registered up front are
+    evaluated together on the first collect():
+      - timestamp filters are pushed down, so each distinct range is read
+        from the source once and every query over it shares that scan;
+      - derived columns and filter masks are computed once per scan;
+      - all aggregations with the same filters and group keys are fused
+        into one groupby;
+      - results are memoized, so a panel asking again costs a lookup.
+
+    The engine is shared by panels computed on concurrent threads. One batch
+    runs at a time; a thread whose query is in (or queued behind) the batch
+    in flight waits for it instead of scanning again.
+    """
+
+    def __init__(self, source):
+        self.source = source
+        self._pending = set()
+        self._results = {}
+        self._lock = threading.Condition()
+        self._running = False  # A batch is being evaluated, outside the lock
+        self.scans = 0
+
+    def register(self, *queries):
+        """Queue queries to be evaluated with the next batch"""
+        with self._lock:
+            self._pending.update(q for q in queries if q not in self._results)
+        return self
+
+    def collect(self, query):
+        """Result of one query: a DataFrame indexed by its group keys, or a dict of scalars"""
+        with self._lock:
+            while query not in self._results:
+                self._pending.add(query)
+                if self._running:
+                    self._lock.wait()
+                else:
+                    self._run_batch()
+            return self._results[query]
+
+    def plan(self, queries):
+        """{scan range: {(residual filters, keys): [(column, how), ...]}}"""
+        plan = {}
+        for query in queries:
+            scan_range, residual = query.scan_range()
+            pairs = plan.setdefault(scan_range, {}).setdefault((residual, query.keys), [])
+            for _, pair in query.aggs:
+                if pair not in pairs:
+                    pairs.append(pair)
+        return plan
+
+    def execute(self):
+        """Evaluate every pending query"""
+        with self._lock:
+            while self._running:
+                self._lock.wait()
+            self._run_batch()
+
+    def _run_batch(self):
+        """Evaluate the pending queries as one batch; called with the lock held, released while scanning"""
+        queries = list(self._pending)
+        self._pending.difference_update(queries)
+        self._running = True
+        results = {}
+        self._lock.release()
+        try:
+            results = self._evaluate(queries)
+        finally:
+            self._lock.acquire()
+            self._results.update(results)
+            self._running = False
+            self._lock.notify_all()
+
+    def _evaluate(self, queries):
+        results = {}
+        for scan_range, groups in self.plan(queries).items():
+            scan = _Scan(self._read(*scan_range))
+            self.scans += 1
+            aggregated = {
+                (filters, keys): scan.aggregate(filters, keys, pairs)
+                for (filters, keys), pairs in groups.items()
+            }
+            for query in queries:
+                query_range, residual = query.scan_range()
+                if query_range != scan_range:
+                    continue
+                values = aggregated[(residual, query.keys)]
+                if query.keys:
+                    result = pd.DataFrame({name: values[pair] for name, pair in query.aggs})
+                else:
+                    result = {name: values[pair] for name, pair in query.aggs}
+                results[query] = result
+        return results
+
+    def _read(self, start, end):
+        if not isinstance(self.source, pd.DataFrame):
+            return self.source.frame(start=start, end=end)
+
+        frame = self.source
+        if (start is None and end is None) or frame.empty:
+            return frame
+        timestamps = pd.to_datetime(frame['timestamp'])
+        if timestamps.is_monotonic_increasing:
+            values = timestamps.to_numpy()
+            lo = 0 if start is None else int(np.searchsorted(values, np.datetime64(pd.Timestamp(start)), 'left'))
+            hi = len(frame) if end is None else int(np.searchsorted(values, np.datetime64(pd.Timestamp(end)), 'right'))
+            return frame.iloc[lo:hi]
+        mask = np.ones(len(frame), dtype=bool)
+        if start is not None:
+            mask &= (timestamps >= pd.Timestamp(start)).to_numpy()
+        if end is not None:
+            mask &= (timestamps <= pd.Timestamp(end)).to_numpy()
+        return frame[mask]
@@ -3,13 +3,36 @@ import numpy as np
 from datetime import datetime, timedelta
 import streamlit as st
 
+from query_plan import Query, QueryEngine
+from baseline_model import BaselineModel
+from instrumentation import traced
+
+# Aggregations behind the analyses, evaluated together in one pass over the readings
+HOURLY = Query().group_by('hour').agg(mean=('total_consumption', 'mean'))
+MONTHLY = Query().group_by('month').agg(mean=('total_consumption', 'mean'))
+BY_WEEKEND = Query().group_by('is_weekend').agg(mean=('total_consumption', 'mean'))
+DAILY = Query().group_by('date').agg(
+    total=('total_consumption', 'sum'),
+    mean=('total_consumption', 'mean')
+)
+TOTALS = Query().agg(
+    total_consumption=('total_consumption', 'sum'),
+    mean_consumption=('total_consumption', 'mean')
+)
+AFTER_HOURS = Query().filter('hour', 'in', [*range(18, 24), *range(0, 7)]).agg(
+    mean=('total_consumption', 'mean')
+)
+PER_OCCUPANT = Query().agg(mean=('consumption_per_occupant', 'mean'))
+
 class RecommendationEngine:
-    def __init__(self, df):
-        self.df = df.copy()  # Create a copy to avoid modifying original
-        # Add necessary time-based columns
-        self.df['hour'] = pd.to_datetime(self.df['timestamp']).dt.hour
-        self.df['month'] = pd.to_datetime(self.df['timestamp']).dt.month
-        self.df['is_weekend'] = pd.to_datetime(self.df['timestamp']).dt.dayofweek.isin([5, 6])
+    def __init__(self, df, baseline=None):
+        self.df = df.copy(deep=False)  # Copy-on-write: the original is never modified
+        # BaselineModel of the history; fitted from df when not given
+        self.baseline = baseline
+        # Time-based columns are derived by the query engine unless the shared dataset provides them
+        self.queries = QueryEngine(self.df).register(HOURLY, MONTHLY, BY_WEEKEND, DAILY, TOTALS, AFTER_HOURS)
+        if 'occupancy_level' in self.df.columns:
+            self.queries.register(PER_OCCUPANT)
         self.recommendations = []
         
         # Add tracking for implementation status and reminders
@@ -18,6 +41,7 @@ class RecommendationEngine:
         if 'recommendation_reminders' not in st.session_state:
             st.session_state.recommendation_reminders = {}
         
+    @traced()
     def generate_recommendations(self):
         """Generate comprehensive energy savings recommendations"""
         self._analyze_peak_usage()
@@ -31,9 +55,10 @@ class RecommendationEngine:
         
         return self.recommendations
     
+    @traced()
     def _analyze_peak_usage(self):
         """Analyze and recommend based on peak usage patterns"""
-        peak_hours = self.df.groupby('hour')['total_consumption'].mean()
+        peak_hours = self.queries.collect(HOURLY)['mean']
         top_peak_hours = peak_hours.nlargest(3)
         
         recommendation = {
@@ -48,9 +73,10 @@ class RecommendationEngine:
         }
         self.recommendations.append(recommendation)
     
+    @traced()
     def _analyze_equipment_usage(self):
         """Analyze and recommend based on equipment usage patterns"""
-        avg_consumption = self.df['total_consumption'].mean()
+        avg_consumption = self.queries.collect(TOTALS)['mean_consumption']
         
         equipment_recommendations = {
             'category': 'Equipment Usage',
@@ -66,6 +92,7 @@ class RecommendationEngine:
         
         self.recommendations.append(equipment_recommendations)
     
+    @traced()
     def _analyze_occupancy_patterns(self):
         """Analyze and recommend based on occupancy patterns"""
         if 'occupancy_level' not in self.df.columns:
@@ -83,13 +110,22 @@ class RecommendationEngine:
             self.recommendations.append(recommendation)
             return
 
-        avg_consumption_per_occupant = (
-            self.df['total_consumption'] / self.df['occupancy_level']
-        ).mean()
+        avg_consumption_per_occupant = self.queries.collect(PER_OCCUPANT)['mean']
+        
+        # Compare the readings with the occupancy/temperature baseline instead of refitting it
+        model = self.baseline if self.baseline is not None else BaselineModel.from_frame(self.df)
+        features = model.design(self.df)
+        residuals = model.residuals(features, self.df['total_consumption'])[:, 0]
+        expected = model.predict(features)[:, 0]
+        observed = ~np.isnan(residuals)
+        excess = residuals[observed].sum() / expected[observed].sum() if expected[observed].sum() > 0 else 0.0
+        per_point = model.coefficients()[0, 1 + model.features.index('occupancy_level')]
         
         recommendation = {
             'category': 'Occupancy Optimization',
-            'findings': f"Average consumption per occupant: {avg_consumption_per_occupant:.2f} Watt-hours",
+            'findings': (f"Average consumption per occupant: {avg_consumption_per_occupant:.2f} Watt-hours; "
+                         f"each occupancy point adds {per_point:.1f} Watt-hours to the baseline and "
+                         f"consumption runs {excess:+.1%} against it"),
             'recommendations': [
                 "Implement zone-based lighting controls",
                 "Install occupancy sensors in less frequently used areas",
@@ -99,11 +135,10 @@ class RecommendationEngine:
         }
         self.recommendations.append(recommendation)
     
+    @traced()
     def _analyze_after_hours(self):
         """Analyze and recommend based on after-hours usage"""
-        after_hours = self.df[
-            (self.df['hour'] >= 18) | (self.df['hour'] <= 6)
-        ]['total_consumption'].mean()
+        after_hours = self.queries.collect(AFTER_HOURS)['mean']
         
         if after_hours > 100:  # Threshold can be adjusted
             recommendation = {
@@ -118,14 +153,12 @@ class RecommendationEngine:
             }
             self.recommendations.append(recommendation)
     
+    @traced()
     def _analyze_efficiency_patterns(self):
         """Analyze and recommend based on efficiency patterns"""
-        weekend_consumption = self.df[
-            self.df['is_weekend']
-        ]['total_consumption'].mean()
-        weekday_consumption = self.df[
-            ~self.df['is_weekend']
-        ]['total_consumption'].mean()
+        by_weekend = self.queries.collect(BY_WEEKEND)['mean']
+        weekend_consumption = by_weekend.get(True, np.nan)
+        weekday_consumption = by_weekend.get(False, np.nan)
         
         if weekend_consumption > (weekday_consumption * 0.3):
             recommendation = {
@@ -141,12 +174,10 @@ class RecommendationEngine:
             }
             self.recommendations.append(recommendation)
 
+    @traced()
     def _analyze_seasonal_patterns(self):
         """Analyze and recommend based on seasonal patterns"""
-        if 'month' not in self.df.columns:
-            self.df['month'] = pd.to_datetime(self.df['timestamp']).dt.month
-
-        monthly_consumption = self.df.groupby('month')['total_consumption'].mean()
+        monthly_consumption = self.queries.collect(MONTHLY)['mean']
         peak_month = monthly_consumption.idxmax()
         peak_consumption = monthly_consumption.max()
         avg_consumption = monthly_consumption.mean()
@@ -165,6 +196,7 @@ class RecommendationEngine:
             }
             self.recommendations.append(recommendation)
 
+    @traced()
     def _analyze_maintenance_needs(self):
         """Analyze and recommend based on maintenance patterns"""
         # Calculate efficiency decline over time
@@ -187,10 +219,11 @@ class RecommendationEngine:
             }
             self.recommendations.append(recommendation)
 
+    @traced()
     def _generate_cost_savings(self):
         """Generate cost-based recommendations with detailed ROI analysis"""
-        total_consumption = self.df['total_consumption'].sum()
-        avg_daily_consumption = self.df.groupby(pd.to_datetime(self.df['timestamp']).dt.date)['total_consumption'].mean().mean()
+        total_consumption = self.queries.collect(TOTALS)['total_consumption']
+        avg_daily_consumption = self.queries.collect(DAILY)['mean'].mean()
         
         # Enhanced cost calculations
         energy_rates = {
@@ -0,0 +1,221 @@
+import os
+import json
+import pickle
+import hashlib
+import shutil
+import threading
+import numpy as np
+import pandas as pd
+
+from config import BASELINE_CONFIG, SHARED_DATA_CONFIG
+from calendar_features import CALENDAR_COLUMNS, add_calendar_columns
+from data_processor import load_readings
+from prefix_index import PrefixIndex, zone_matrices
+from efficiency import ZONE_METRICS, EfficiencyScores
+from baseline_model import BaselineModel
+
+# Views handed to sessions rely on copy-on-write: a session writing to its
+# frame gets private copies of the touched columns, the shared data is never modified
+if int(pd.__version__.split('.')[0]) < 3:
+    pd.set_option('mode.copy_on_write', True)
+
+DERIVED_COLUMNS = CALENDAR_COLUMNS + ('is_weekend',)
+LAYOUT_VERSION = 4  # Bumped whenever the column layout changes, so old caches are rebuilt
+
+
+class SharedDataset:
+    """Readings loaded once per process as memory-mapped columns, shared read-only by every session
+
+    Numeric, boolean and datetime columns are stored as one .npy file each and
+    memory-mapped, so the OS page cache holds a single copy however many
+    sessions read them. Text columns are stored as categorical codes and the
+    nested floor_data lists are kept once in memory, with their numeric
+    values also stored as (readings, zones) matrices. Derived calendar
+    columns and the running totals of prefix_index() are computed when the
+    columns are built, and efficiency_scores() and baseline_model() once
+    per data version, not per session.
+    """
+
+    def __init__(self, data_folder=None, cache_dir=None):
+        self.data_folder = data_folder if data_folder is not None else SHARED_DATA_CONFIG['data_folder']
+        self.cache_dir = cache_dir if cache_dir is not None else SHARED_DATA_CONFIG['cache_dir']
+        self._lock = threading.Lock()
+        self.version = None
+        self._columns = {}
+        self._order = []
+        self._prefix = None
+        self._zone_values = None
+        self._efficiency = None
+        self._baseline = None
+
+    def source_version(self):
+        """Fingerprint of the data files (names, sizes and modification times)"""
+        digest = hashlib.sha1(f'layout:{LAYOUT_VERSION};'.encode())
+        for name in sorted(os.listdir(self.data_folder)):
+            if name.startswith('data_') and name.endswith('.json'):
+                stat = os.stat(os.path.join(self.data_folder, name))
+                digest.update(f'{name}:{stat.st_size}:{stat.st_mtime_ns};'.encode())
+        return digest.hexdigest()[:16]
+
+    def refresh(self):
+        """Map the columns of the current data files, building them first if they changed"""
+        version = self.source_version()
+        with self._lock:
+            if version == self.version:
+                return False
+            path = os.path.join(self.cache_dir, version)
+            if not os.path.exists(os.path.join(path, 'meta.json')):
+                self._build(path)
+            self._map(path)
+            self.version = version
+            self._prune(version)
+        return True
+
+    def _prune(self, version):
+        """Delete the cached columns of every data version but the given one"""
+        for name in os.listdir(self.cache_dir):
+            if name == version or name.endswith('.tmp'):
+                continue  # Current version, or a build in progress in another process
+            path = os.path.join(self.cache_dir, name)
+            if os.path.isdir(path):
+                # Files still mapped by a reader stay readable until it unmaps them
+                shutil.rmtree(path, ignore_errors=True)
+
+    def _build(self, path):
+        df = load_readings(self.data_folder)
+        if not df.empty:
+            add_calendar_columns(df)
+
+        tmp_path = f'{path}.tmp'
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+
+        meta = {'columns': [], 'categories': {}, 'objects': []}
+        objects = {}
+        for i, column in enumerate(df.columns):
+            values = df[column]
+            if pd.api.types.is_datetime64_any_dtype(values):
+                array = values.to_numpy().astype('datetime64[ns]')
+            elif pd.api.types.is_numeric_dtype(values) or pd.api.types.is_bool_dtype(values):
+                array = values.to_numpy()
+            elif values.map(lambda v: isinstance(v, str)).all():
+                categorical = values.astype('category')
+                meta['categories'][column] = categorical.cat.categories.tolist()
+                array = categorical.cat.codes.to_numpy()
+            else:
+                objects[column] = values.to_numpy(dtype=object)
+                meta['objects'].append(column)
+                meta['columns'].append(column)
+                continue
+            np.save(os.path.join(tmp_path, f'{i}.npy'), array)
+            meta['columns'].append(column)
+            meta.setdefault('files', {})[column] = f'{i}.npy'
+
+        # Running totals for range queries, mapped like the columns
+        prefix = PrefixIndex.from_frame(df) if not df.empty else PrefixIndex(np.empty(0, dtype=np.int64), {})
+        meta['prefix'] = {'zones': prefix.zones, 'files': {}}
+        for j, (name, sums) in enumerate(prefix.sums.items()):
+            np.save(os.path.join(tmp_path, f'prefix{j}.npy'), sums)
+            meta['prefix']['files'][name] = f'prefix{j}.npy'
+
+        # Per-zone matrices of the floor_data values
+        zones, matrices = zone_matrices(df, ZONE_METRICS) if 'floor_data' in df.columns else ([], {})
+        meta['zone_values'] = {'zones': zones, 'files': {}}
+        for k, (metric, matrix) in enumerate(matrices.items()):
+            np.save(os.path.join(tmp_path, f'zone{k}.npy'), matrix)
+            meta['zone_values']['files'][metric] = f'zone{k}.npy'
+
+        with open(os.path.join(tmp_path, 'objects.pkl'), 'wb') as f:
+            pickle.dump(objects, f)
+        with open(os.path.join(tmp_path, 'meta.json'), 'w') as f:
+            json.dump(meta, f)
+
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(tmp_path, path)
+
+    def _map(self, path):
+        with open(os.path.join(path, 'meta.json'), 'r') as f:
+            meta = json.load(f)
+        with open(os.path.join(path, 'objects.pkl'), 'rb') as f:
+            objects = pickle.load(f)
+
+        columns = {}
+        for column in meta['columns']:
+            if column in objects:
+                columns[column] = objects[column]
+                continue
+            array = np.load(os.path.join(path, meta['files'][column]), mmap_mode='r')
+            if column in meta['categories']:
+                array = (array, meta['categories'][column])
+            columns[column] = array
+        self._columns = columns
+        self._order = meta['columns']
+
+        timestamps = columns['timestamp'].view(np.int64) if 'timestamp' in columns else np.empty(0, dtype=np.int64)
+        sums = {name: np.load(os.path.join(path, file), mmap_mode='r')
+                for name, file in meta['prefix']['files'].items()}
+        self._prefix = PrefixIndex(timestamps, sums, meta['prefix']['zones'])
+
+        matrices = {metric: np.load(os.path.join(path, file), mmap_mode='r')
+                    for metric, file in meta['zone_values']['files'].items()}
+        self._zone_values = (meta['zone_values']['zones'], matrices or None)
+        self._efficiency = None
+        self._baseline = None
+
+    def prefix_index(self):
+        """Running totals of the readings (see PrefixIndex), shared like the columns"""
+        if self.version is None:
+            self.refresh()
+        return self._prefix
+
+    def efficiency_scores(self):
+        """EfficiencyScores of every reading and zone, computed once per data version"""
+        if self.version is None:
+            self.refresh()
+        # Computed under the lock, so a concurrent refresh() cannot swap the
+        # columns mid-way and sessions asking at once compute it only once
+        with self._lock:
+            if self._efficiency is None:
+                zones, zone_values = self._zone_values
+                self._efficiency = EfficiencyScores.from_frame(self.frame(), zones=zones, zone_values=zone_values)
+            return self._efficiency
+
+    def baseline_model(self):
+        """BaselineModel of every reading and zone, fitted once per data version"""
+        if self.version is None:
+            self.refresh()
+        with self._lock:
+            if self._baseline is None:
+                zones, zone_values = self._zone_values
+                zone_consumption = None if zone_values is None else zone_values[BASELINE_CONFIG['zone_target']]
+                self._baseline = BaselineModel.from_frame(self.frame(), zones=zones, zone_consumption=zone_consumption)
+            return self._baseline
+
+    def __len__(self):
+        timestamps = self._columns.get('timestamp')
+        return 0 if timestamps is None else len(timestamps)
+
+    def frame(self, start=None, end=None):
+        """Read-only view of the readings with start <= timestamp <= end
+
+        Rows are sliced, not copied; columns written by a caller are copied
+        for that caller only.
+        """
+        if self.version is None:
+            self.refresh()
+        if len(self) == 0:
+            return pd.DataFrame()
+
+        timestamps = self._columns['timestamp']
+        lo = 0 if start is None else int(np.searchsorted(timestamps, np.datetime64(pd.Timestamp(start)), 'left'))
+        hi = len(self) if end is None else int(np.searchsorted(timestamps, np.datetime64(pd.Timestamp(end)), 'right'))
+
+        data = {}
+        for column in self._order:
+            values = self._columns[column]
+            if isinstance(values, tuple):
+                codes, categories = values
+                data[column] = pd.Categorical.from_codes(codes[lo:hi], categories=categories)
+            else:
+                data[column] = values[lo:hi]
+        return pd.DataFrame(data, copy=False)
@@ -0,0 +1,312 @@
+import numpy as np
+import pandas as pd
+
+from config import STAT_MODEL_CONFIG
+
+DAY = pd.Timedelta(days=1)
+WEEK = pd.Timedelta(days=7)
+
+
+class StatisticalForecaster:
+    """Shared plumbing for the NumPy-only forecasters
+
+    Every forecaster works on a time-indexed frame holding the target column
+    (and optionally covariates):
+        fit(df)                  learn parameters from the most recent fit_window readings
+        predict(df)              one-step-ahead predictions for every reading in df
+        forecast_next_24h(df)    the 24 steps following the last reading in df
+
+    fit_batch() fits many series at once, vectorized across series.
+    """
+
+    def __init__(self, config=None):
+        self.config = config if config is not None else STAT_MODEL_CONFIG
+        self.target = self.config['target']
+        self.step = None
+        self.periods = []
+        self.fitted = False
+
+    @classmethod
+    def fit_batch(cls, frames, config=None):
+        """Fit one forecaster per frame, grouping series of the same shape into one vectorized fit"""
+        models = [cls(config) for _ in frames]
+        windows = [model._window(frame) for model, frame in zip(models, frames)]
+
+        groups = {}
+        for i, window in enumerate(windows):
+            models[i]._set_calendar(window.index)
+            groups.setdefault(models[i]._group_key(window), []).append(i)
+
+        for idx in groups.values():
+            cls._fit_group([models[i] for i in idx], [windows[i] for i in idx])
+            for i in idx:
+                models[i].fitted = True
+        return models
+
+    def fit(self, df):
+        """Fit the forecaster on a single series"""
+        window = self._window(df)
+        self._set_calendar(window.index)
+        type(self)._fit_group([self], [window])
+        self.fitted = True
+        return self
+
+    def predict(self, df):
+        """One-step-ahead predictions aligned with the readings in df"""
+        self._check_fitted()
+        return self._predict(df)
+
+    def forecast(self, df, horizon):
+        """Forecast the given number of steps after the last reading in df"""
+        self._check_fitted()
+        return self._forecast(self._window(df), horizon)
+
+    def forecast_next_24h(self, df):
+        """Forecast the next 24 steps after the last reading in df"""
+        return self.forecast(df, 24)
+
+    def future_index(self, index, horizon):
+        """Timestamps of the steps following index"""
+        return pd.DatetimeIndex([index[-1] + self.step * (i + 1) for i in range(horizon)])
+
+    def _check_fitted(self):
+        if not self.fitted:
+            raise ValueError("Model needs to be fitted before making predictions")
+
+    def _window(self, df):
+        return df.sort_index().iloc[-self.config['fit_window']:]
+
+    def _group_key(self, window):
+        """Series with equal keys are fitted together: same length and seasonal periods"""
+        return len(window), tuple(self.periods)
+
+    def _set_calendar(self, index):
+        """Infer the reading interval and the daily/weekly periods it supports"""
+        step = pd.Series(index).diff().median()
+        self.step = step if not pd.isna(step) and step > pd.Timedelta(0) else pd.Timedelta(hours=1)
+
+        self.periods = []
+        for season in (DAY, WEEK):
+            period = season / self.step
+            # A period must be a whole number of steps and fit twice in the history
+            if period >= 2 and period == int(period) and 2 * period <= len(index):
+                self.periods.append(int(period))
+
+    @classmethod
+    def _fit_group(cls, models, windows):
+        raise NotImplementedError
+
+    def _predict(self, df):
+        raise NotImplementedError
+
+    def _forecast(self, df, horizon):
+        raise NotImplementedError
+
+
+class SeasonalNaiveForecaster(StatisticalForecaster):
+    """Repeat the value observed one season (a week if available, else a day) earlier"""
+
+    @classmethod
+    def _fit_group(cls, models, windows):
+        for model in models:
+            model.season = max(model.periods) if model.periods else 1
+
+    def _predict(self, df):
+        y = df[self.target].to_numpy(dtype=float)
+        predictions = np.full(len(y), np.nan)
+        predictions[self.season:] = y[:-self.season]
+        return predictions
+
+    def _forecast(self, df, horizon):
+        y = df[self.target].to_numpy(dtype=float)
+        steps = np.arange(horizon) % self.season
+        return y[len(y) - self.season + steps]
+
+
+class HoltWintersForecaster(StatisticalForecaster):
+    """Additive Holt-Winters with up to two (daily and weekly) seasonal components
+
+    Smoothing parameters are chosen per series from the configured grid by
+    in-sample one-step squared error. The recursion loops over time only and
+    is vectorized across series and grid candidates. With two seasonal
+    components each absorbs an equal share of the seasonal correction.
+    """
+
+    @classmethod
+    def _fit_group(cls, models, windows):
+        config = models[0].config
+        periods = models[0].periods
+        y = np.stack([w[models[0].target].to_numpy(dtype=float) for w in windows])
+
+        grid = np.array([
+            (alpha, gamma)
+            for alpha in config['alpha_grid']
+            for gamma in config['gamma_grid']
+        ])
+        alpha = grid[:, 0][None, :]  # (1, G)
+        gamma = grid[:, 1][None, :]
+
+        sse = _holt_winters_filter(y, periods, alpha, config['beta'], gamma)[0]
+        best = np.argmin(sse, axis=1)
+
+        for i, model in enumerate(models):
+            model.alpha = float(grid[best[i], 0])
+            model.gamma = float(grid[best[i], 1])
+
+    def _run(self, df):
+        y = df[self.target].to_numpy(dtype=float)[None, :]
+        return _holt_winters_filter(
+            y, self.periods, np.array([[self.alpha]]), self.config['beta'], np.array([[self.gamma]])
+        )
+
+    def _predict(self, df):
+        return self._run(df)[1][0, 0]
+
+    def _forecast(self, df, horizon):
+        _, _, level, trend, seasons = self._run(df)
+        n = len(df)
+        steps = np.arange(1, horizon + 1)
+
+        forecast = level[0, 0] + steps * trend[0, 0]
+        for period, season in zip(self.periods, seasons):
+            forecast = forecast + season[0, 0, (n - 1 + steps) % period]
+        return forecast
+
+
+def _holt_winters_filter(y, periods, alpha, beta, gamma):
+    """Error-correction additive Holt-Winters over y (S, T) for parameters of shape (1, G)
+
+    Returns the per-candidate SSE (S, G), the one-step fitted values
+    (S, G, T) and the final level, trend and seasonal states.
+    """
+    n_series, n_steps = y.shape
+    n_candidates = alpha.shape[1]
+    init = max(periods) if periods else 1
+
+    # Initial level from the first cycle, seasonal profiles peeled off one period at a time
+    level = np.repeat(y[:, :init].mean(axis=1, keepdims=True), n_candidates, axis=1)
+    trend = np.zeros((n_series, n_candidates))
+    remainder = y[:, :2 * init] - y[:, :init].mean(axis=1, keepdims=True)
+    seasons = []
+    for period in periods:
+        positions = np.arange(remainder.shape[1]) % period
+        profile = np.stack([remainder[:, positions == p].mean(axis=1) for p in range(period)], axis=1)
+        profile -= profile.mean(axis=1, keepdims=True)
+        remainder = remainder - profile[:, positions]
+        seasons.append(np.repeat(profile[:, None, :], n_candidates, axis=1))
+
+    sse = np.zeros((n_series, n_candidates))
+    fitted = np.empty((n_series, n_candidates, n_steps))
+    for t in range(n_steps):
+        prediction = level + trend
+        for period, season in zip(periods, seasons):
+            prediction = prediction + season[:, :, t % period]
+        fitted[:, :, t] = prediction
+
+        error = y[:, t:t + 1] - prediction
+        sse += error ** 2
+
+        level = level + trend + alpha * error
+        trend = trend + alpha * beta * error
+        for period, season in zip(periods, seasons):
+            season[:, :, t % period] += gamma * (1 - alpha) * error / len(periods)
+
+    return sse, fitted, level, trend, seasons
+
+
+class RidgeForecaster(StatisticalForecaster):
+    """Ridge regression on hour-of-day, weekday and covariate features
+
+    Future covariates are unknown at forecast time, so they are filled in
+    from their hour-of-week averages over the fit window.
+    """
+
+    def _group_key(self, window):
+        # Series only share a feature matrix if they carry the same covariates
+        covariates = tuple(c for c in self.config['covariates'] if c in window.columns)
+        return super()._group_key(window) + (covariates,)
+
+    @classmethod
+    def _fit_group(cls, models, windows):
+        features = np.stack([m._features(w, fit=True) for m, w in zip(models, windows)])
+        y = np.stack([w[m.target].to_numpy(dtype=float) for m, w in zip(models, windows)])
+
+        # Closed-form solve per series; the intercept column is not penalised
+        penalty = models[0].config['ridge_alpha'] * np.eye(features.shape[2])
+        penalty[0, 0] = 0
+        transposed = features.transpose(0, 2, 1)
+        gram = transposed @ features + penalty
+        moment = transposed @ y[:, :, None]
+        coef = np.linalg.solve(gram, moment)[:, :, 0]
+
+        for i, model in enumerate(models):
+            model.coef = coef[i]
+
+    def _features(self, df, covariates=None, fit=False):
+        index = pd.DatetimeIndex(df.index)
+        hour = index.hour.to_numpy()
+        dayofweek = index.dayofweek.to_numpy()
+
+        if fit:
+            self.covariates = [c for c in self.config['covariates'] if c in df.columns]
+            values = df[self.covariates].to_numpy(dtype=float)
+            self._covariate_mean = values.mean(axis=0)
+            std = values.std(axis=0)
+            self._covariate_std = np.where(std == 0, 1, std)
+
+            # Hour-of-week averages used as the covariate forecast
+            how = dayofweek * 24 + hour
+            counts = np.bincount(how, minlength=168)[:, None]
+            sums = np.zeros((168, values.shape[1]))
+            for c in range(values.shape[1]):
+                sums[:, c] = np.bincount(how, weights=values[:, c], minlength=168)
+            with np.errstate(invalid='ignore'):
+                profile = sums / counts
+            self._covariate_profile = np.where(counts > 0, profile, self._covariate_mean)
+
+        if covariates is None:
+            covariates = df[self.covariates].to_numpy(dtype=float)
+        covariates = (covariates - self._covariate_mean) / self._covariate_std
+
+        return np.hstack([
+            np.ones((len(index), 1)),
+            np.eye(24)[hour],
+            np.eye(7)[dayofweek],
+            covariates
+        ])
+
+    def _predict(self, df):
+        return self._features(df) @ self.coef
+
+    def _forecast(self, df, horizon):
+        future = self.future_index(df.index, horizon)
+        how = future.dayofweek.to_numpy() * 24 + future.hour.to_numpy()
+        covariates = self._covariate_profile[how]
+        return self._features(pd.DataFrame(index=future), covariates=covariates) @ self.coef
+
+
+FORECASTERS = {
+    'seasonal_naive': SeasonalNaiveForecaster,
+    'holt_winters': HoltWintersForecaster,
+    'ridge': RidgeForecaster
+}
+
+
+def create_forecaster(kind, config=None):
+    """Instantiate a statistical forecaster by name"""
+    if kind not in FORECASTERS:
+        raise ValueError(f"Unknown forecaster '{kind}'. Choose from {', '.join(FORECASTERS)}")
+    return FORECASTERS[kind](config)
+
+
+def fit_many(frames, kind, config=None):
+    """Fit one forecaster of the given kind per series
+
+    frames maps a site (or zone) name to its time-indexed frame; the fitted
+    forecasters are returned under the same keys.
+    """
+    if kind not in FORECASTERS:
+        raise ValueError(f"Unknown forecaster '{kind}'. Choose from {', '.join(FORECASTERS)}")
+    names = list(frames)
+    models = FORECASTERS[kind].fit_batch([frames[name] for name in names], config)
+    return dict(zip(names, models))
@@ -0,0 +1,28 @@
+import numpy as np
+import pandas as pd
+
+from timeseries_store import TimeSeriesStore
+
+
+def _readings(timestamps, values):
+    return pd.DataFrame({
+        'timestamp': pd.to_datetime(timestamps),
+        'total_consumption': values,
+        'occupancy_level': [10.0] * len(values),
+        'temperature': [21.0] * len(values),
+        'floor_data': [[{'floor': 'A', 'fan_consumption': 1.0, 'light_consumption': 2.0,
+                         'total_floor_consumption': v}] for v in values],
+    })
+
+
+def test_append_batch_with_duplicated_timestamp(tmp_path):
+    timestamps = list(pd.date_range('2024-01-01', periods=5, freq='D'))
+    readings = _readings(timestamps + [timestamps[2]], [1.0, 2.0, 3.0, 4.0, 5.0, 30.0])
+
+    store = TimeSeriesStore(str(tmp_path))
+    store.append(readings)
+
+    assert len(store) == 5
+    assert pd.Index(store.timestamps()).is_unique
+    np.testing.assert_array_equal(store.column('total_consumption'), [1.0, 2.0, 30.0, 4.0, 5.0])
+    np.testing.assert_array_equal(store.zone_column('total_floor_consumption', 'A'), [1.0, 2.0, 30.0, 4.0, 5.0])
@@ -0,0 +1,406 @@
+import os
+import json
+import argparse
+import numpy as np
+import pandas as pd
+
+from calendar_features import calendar_columns
+from config import BASELINE_CONFIG, PREFIX_INDEX_CONFIG, TIMESERIES_STORE_CONFIG
+from data_processor import load_readings, extract_zone_readings
+from heatmap_cube import HeatmapCube
+from baseline_model import BaselineModel
+from prefix_index import PrefixIndex, cumulate
+
+DAY_NS = 24 * 3600 * 10 ** 9
+HOUR_NS = 3600 * 10 ** 9
+
+
+class TimeSeriesStore:
+    """Append-only on-disk meter history, one fixed-width binary file per metric
+
+    Layout of the store directory:
+        meta.json                      committed row count, metric names and zones
+        heatmap.npz                    hour-of-week cube of the heatmap metric (see HeatmapCube)
+        baseline.npz                   occupancy/temperature consumption model (see BaselineModel)
+        timestamp.bin                  int64 nanoseconds, ascending
+        <metric>.bin                   float32, one value per row
+        zone.<metric>.g<n>.bin         float32, one row of len(zones) values per reading
+        prefix.<key>.bin               float64 running totals (see PrefixIndex), extended on append;
+                                       zone keys are per-zone rows like zone files (prefix.zone.<metric>.g<n>.bin)
+
+    Files are read through np.memmap with no parse step. Rows only become
+    visible once meta.json is updated, so readers never see a partial append.
+    Per-zone files carry the zone generation <n> recorded in meta.json: adding
+    zones writes wider copies under the next generation and switches to them
+    in the same meta.json update that records the new zones.
+    """
+
+    def __init__(self, path=None, config=None):
+        self.config = config if config is not None else TIMESERIES_STORE_CONFIG
+        self.path = path if path is not None else self.config['path']
+        self._meta_path = os.path.join(self.path, 'meta.json')
+        self._cube_path = os.path.join(self.path, 'heatmap.npz')
+        self._baseline_path = os.path.join(self.path, 'baseline.npz')
+        self.meta = self._load_meta()
+        self._cube = None
+        self._baseline = None
+
+    def _load_meta(self):
+        if os.path.exists(self._meta_path):
+            with open(self._meta_path, 'r') as f:
+                return json.load(f)
+        return {
+            'length': 0,
+            'metrics': list(self.config['metrics']),
+            'zone_metrics': list(self.config['zone_metrics']),
+            'prefix_metrics': list(PREFIX_INDEX_CONFIG['metrics']),
+            'prefix_zone_metrics': list(PREFIX_INDEX_CONFIG['zone_metrics']),
+            'zones': [],
+            'zone_generation': 0
+        }
+
+    def refresh(self):
+        """Pick up rows appended by another process"""
+        self.meta = self._load_meta()
+
+    def _save_meta(self):
+        tmp_path = f'{self._meta_path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.meta, f)
+        os.replace(tmp_path, self._meta_path)
+
+    def __len__(self):
+        return self.meta['length']
+
+    @property
+    def zones(self):
+        return list(self.meta['zones'])
+
+    @property
+    def version(self):
+        """Changes whenever rows are appended"""
+        return f"{self.meta['length']}-{self.meta.get('last_timestamp')}"
+
+    def _file(self, name, generation=None):
+        """Path of a column file; per-zone files are suffixed with their zone generation"""
+        if name.startswith(('zone.', 'prefix.zone.')):
+            generation = generation if generation is not None else self.meta.get('zone_generation')
+            if generation is not None:  # Stores written before generations use the bare name
+                return os.path.join(self.path, f'{name}.g{generation}.bin')
+        return os.path.join(self.path, f'{name}.bin')
+
+    def _map(self, name, dtype, width=None):
+        shape = (len(self),) if width is None else (len(self), width)
+        if len(self) == 0 or (width is not None and width == 0):
+            return np.empty(shape, dtype=dtype)
+        return np.memmap(self._file(name), dtype=dtype, mode='r', shape=shape)
+
+    def timestamps(self):
+        """Memory-mapped int64 nanosecond timestamps of every committed row"""
+        return self._map('timestamp', np.int64)
+
+    def column(self, metric):
+        """Memory-mapped values of a building-level metric"""
+        if metric not in self.meta['metrics']:
+            raise ValueError(f"Unknown metric '{metric}'")
+        return self._map(metric, np.float32)
+
+    def zone_column(self, metric, zone=None):
+        """Memory-mapped (rows, zones) matrix of a per-zone metric, or one zone's column"""
+        if metric not in self.meta['zone_metrics']:
+            raise ValueError(f"Unknown zone metric '{metric}'")
+        matrix = self._map(f'zone.{metric}', np.float32, len(self.meta['zones']))
+        return matrix if zone is None else matrix[:, self.meta['zones'].index(zone)]
+
+    def row_range(self, start=None, end=None):
+        """Row positions [lo, hi) of the readings with start <= timestamp <= end"""
+        timestamps = self.timestamps()
+        lo = 0 if start is None else int(np.searchsorted(timestamps, pd.Timestamp(start).value, 'left'))
+        hi = len(self) if end is None else int(np.searchsorted(timestamps, pd.Timestamp(end).value, 'right'))
+        return lo, hi
+
+    def frame(self, metrics=None, start=None, end=None):
+        """DataFrame view over the memory-mapped rows between start and end"""
+        metrics = metrics if metrics is not None else self.meta['metrics']
+        lo, hi = self.row_range(start, end)
+        data = {'timestamp': self.timestamps()[lo:hi].view('datetime64[ns]')}
+        for metric in metrics:
+            data[metric] = self.column(metric)[lo:hi]
+        return pd.DataFrame(data, copy=False)
+
+    def scan(self, metrics=(), zone_metrics=(), start=None, end=None, chunk_rows=None):
+        """Yield (timestamps, {name: values}) chunks so a pass never holds more than chunk_rows rows"""
+        chunk_rows = chunk_rows if chunk_rows is not None else self.config['chunk_rows']
+        lo, hi = self.row_range(start, end)
+        timestamps = self.timestamps()
+        columns = {metric: self.column(metric) for metric in metrics}
+        columns.update({f'zone.{metric}': self.zone_column(metric) for metric in zone_metrics})
+
+        for begin in range(lo, hi, chunk_rows):
+            stop = min(begin + chunk_rows, hi)
+            yield timestamps[begin:stop], {name: values[begin:stop] for name, values in columns.items()}
+
+    def resample(self, metric, freq='D', how='sum', start=None, end=None):
+        """Aggregate a metric per hour, day, week, month or year without loading it whole
+
+        Rows are reduced to hourly or daily buckets chunk by chunk; coarser
+        periods are then resampled from that small series.
+        """
+        if how not in ('sum', 'max', 'min', 'mean'):
+            raise ValueError("how must be 'sum', 'max', 'min' or 'mean'")
+        bucket_ns = HOUR_NS if freq.lower() in ('h', 'hourly') else DAY_NS
+        reduce = {'sum': np.add, 'mean': np.add, 'max': np.maximum, 'min': np.minimum}[how]
+
+        buckets, values, counts = [], [], []
+        for timestamps, columns in self.scan([metric], start=start, end=end):
+            data = columns[metric].astype(np.float64)
+            bucket = timestamps // bucket_ns
+            starts = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1]])
+            chunk_values = reduce.reduceat(data, starts)
+            chunk_counts = np.diff(np.r_[starts, len(data)])
+
+            # A bucket split across two chunks is merged into one
+            if buckets and buckets[-1][-1] == bucket[0]:
+                values[-1][-1] = reduce(values[-1][-1], chunk_values[0])
+                counts[-1][-1] += chunk_counts[0]
+                bucket, chunk_values, chunk_counts = bucket[starts[1:]], chunk_values[1:], chunk_counts[1:]
+            else:
+                bucket = bucket[starts]
+            if len(bucket):
+                buckets.append(bucket)
+                values.append(chunk_values)
+                counts.append(chunk_counts)
+
+        if not buckets:
+            return pd.Series(dtype=float, name=metric)
+
+        index = pd.to_datetime(np.concatenate(buckets) * bucket_ns)
+        series = pd.Series(np.concatenate(values), index=index, name=metric)
+        count = pd.Series(np.concatenate(counts), index=index)
+
+        if freq.lower() not in ('h', 'hourly', 'd', 'daily'):
+            resampled = series.resample(freq)
+            series = resampled.sum() if how in ('sum', 'mean') else getattr(resampled, how)()
+            count = count.resample(freq).sum()
+        if how == 'mean':
+            series = series / count
+        return series
+
+    def heatmap_cube(self):
+        """Hour-of-week cube of the committed rows, rebuilt from the columns if it is out of step"""
+        if self._cube is not None and self._cube.rows == len(self):
+            return self._cube
+        cube = HeatmapCube.load(self._cube_path)
+        if cube is None or cube.rows != len(self):
+            cube = HeatmapCube(len(self.meta['zones']))
+            metric = self.config['heatmap_metric']
+            zone_metric = self.config['heatmap_zone_metric']
+            for timestamps, columns in self.scan([metric], [zone_metric]):
+                cube.add(timestamps, columns[metric], columns[f'zone.{zone_metric}'])
+            if len(self):
+                cube.save(self._cube_path)
+        self._cube = cube
+        return cube
+
+    def baseline_model(self):
+        """Consumption baseline of the committed rows, refitted from the columns if it is out of step"""
+        if self._baseline is not None and self._baseline.rows == len(self):
+            return self._baseline
+        model = BaselineModel.load(self._baseline_path)
+        if model is None or model.rows != len(self):
+            model = BaselineModel(zones=self.meta['zones'])
+            zone_metric = f"zone.{BASELINE_CONFIG['zone_target']}"
+            for timestamps, columns in self.scan(BASELINE_CONFIG['features'] + [BASELINE_CONFIG['target']],
+                                                 [BASELINE_CONFIG['zone_target']]):
+                model.add(model.design(columns), columns[BASELINE_CONFIG['target']], columns[zone_metric], self.meta['zones'])
+            if len(self):
+                model.save(self._baseline_path)
+        self._baseline = model
+        return model
+
+    def _prefix_keys(self):
+        keys = []
+        for metric in self.meta.get('prefix_metrics', []):
+            keys += [metric, f'{metric}@peak']
+        for metric in self.meta.get('prefix_zone_metrics', []):
+            keys += [f'zone.{metric}', f'zone.{metric}@peak']
+        return keys
+
+    def _map_prefix(self, key):
+        return self._map(f'prefix.{key}', np.float64, len(self.meta['zones']) if key.startswith('zone.') else None)
+
+    def _prefix_sums(self, timestamps, columns, last=None):
+        """Running totals of new rows, continuing from the committed totals in last"""
+        sources = {metric: columns[metric] for metric in self.meta['prefix_metrics']}
+        sources.update({f'zone.{metric}': columns[f'zone.{metric}'] for metric in self.meta['prefix_zone_metrics']})
+        tou_band = calendar_columns(timestamps, names=('tou_band',))['tou_band']
+        return cumulate(sources, tou_band, last)
+
+    def _build_prefix(self):
+        """Write the running totals of a store created before they were kept"""
+        self.meta['prefix_metrics'] = list(PREFIX_INDEX_CONFIG['metrics'])
+        self.meta['prefix_zone_metrics'] = list(PREFIX_INDEX_CONFIG['zone_metrics'])
+        files = {key: open(f'{self._file(f"prefix.{key}")}.tmp', 'wb') for key in self._prefix_keys()}
+        last = None
+        try:
+            for timestamps, columns in self.scan(self.meta['prefix_metrics'], self.meta['prefix_zone_metrics']):
+                sums = self._prefix_sums(timestamps, columns, last)
+                for key, values in sums.items():
+                    files[key].write(np.ascontiguousarray(values).tobytes())
+                last = {key: values[-1] for key, values in sums.items()}
+        finally:
+            for f in files.values():
+                f.close()
+        for key in files:
+            os.replace(f'{self._file(f"prefix.{key}")}.tmp', self._file(f'prefix.{key}'))
+        self._save_meta()
+
+    def prefix_index(self):
+        """Running totals of the committed rows, for range totals in two lookups"""
+        if 'prefix_metrics' not in self.meta:
+            self._build_prefix()
+        sums = {key: self._map_prefix(key) for key in self._prefix_keys()}
+        return PrefixIndex(self.timestamps(), sums, self.zones)
+
+    def append(self, readings):
+        """Append readings newer than the last committed row
+
+        readings is the frame returned by load_readings(); per-zone values are
+        taken from its floor_data lists. Of readings sharing a timestamp (e.g.
+        from overlapping data files) the last one is kept.
+        """
+        if readings.empty:
+            return 0
+        readings = readings.sort_values('timestamp', kind='stable')
+        readings = readings[~pd.to_datetime(readings['timestamp']).duplicated(keep='last').to_numpy()]
+        timestamps = pd.to_datetime(readings['timestamp']).to_numpy().astype('datetime64[ns]').astype(np.int64)
+        last = self.meta.get('last_timestamp')
+        if last is not None:
+            keep = timestamps > last
+            readings, timestamps = readings[keep], timestamps[keep]
+        if len(timestamps) == 0:
+            return 0
+
+        os.makedirs(self.path, exist_ok=True)
+        if len(self) and 'prefix_metrics' not in self.meta:
+            self._build_prefix()
+        self.meta.setdefault('prefix_metrics', list(PREFIX_INDEX_CONFIG['metrics']))
+        self.meta.setdefault('prefix_zone_metrics', list(PREFIX_INDEX_CONFIG['zone_metrics']))
+        cube = self.heatmap_cube()
+        baseline = self.baseline_model()
+        zones = self._zone_matrices(readings)
+        new_zones = [zone for zone in zones['zones'] if zone not in self.meta['zones']]
+        if new_zones:
+            self._add_zones(new_zones)
+        order = [zones['zones'].index(zone) if zone in zones['zones'] else -1 for zone in self.meta['zones']]
+
+        columns = {'timestamp': timestamps}
+        for metric in self.meta['metrics']:
+            source = self._source_column(readings, metric)
+            columns[metric] = (source.to_numpy(dtype=np.float32) if source is not None
+                               else np.full(len(readings), np.nan, dtype=np.float32))
+        for metric in self.meta['zone_metrics']:
+            matrix = np.full((len(readings), len(order)), np.nan, dtype=np.float32)
+            for position, source in enumerate(order):
+                if source >= 0:
+                    matrix[:, position] = zones[metric][:, source]
+            columns[f'zone.{metric}'] = matrix
+
+        last = {key: self._map_prefix(key)[-1] for key in self._prefix_keys()} if len(self) else None
+        for key, values in self._prefix_sums(timestamps, columns, last).items():
+            columns[f'prefix.{key}'] = values
+
+        for name, values in columns.items():
+            self._write(name, np.ascontiguousarray(values))
+
+        # The cube and baseline are saved before the rows are committed; ones ahead of meta.json are rebuilt on load
+        cube.add(timestamps, columns[self.config['heatmap_metric']],
+                 columns[f"zone.{self.config['heatmap_zone_metric']}"])
+        cube.save(self._cube_path)
+        baseline.add(baseline.design(columns), columns[BASELINE_CONFIG['target']],
+                     columns[f"zone.{BASELINE_CONFIG['zone_target']}"], self.meta['zones'])
+        baseline.save(self._baseline_path)
+
+        self.meta['length'] += len(timestamps)
+        self.meta['last_timestamp'] = int(timestamps[-1])
+        self._save_meta()
+        return len(timestamps)
+
+    @staticmethod
+    def _source_column(readings, metric):
+        for name in (metric, f'shared_equipment.{metric}'):
+            if name in readings.columns:
+                return readings[name]
+        return None
+
+    def _write(self, name, values):
+        """Append rows to a file, first discarding any bytes of an uncommitted append"""
+        path = self._file(name)
+        committed = len(self) * values[:1].nbytes if len(values) else 0
+        mode = 'r+b' if os.path.exists(path) else 'wb'
+        with open(path, mode) as f:
+            f.truncate(committed)
+            f.seek(committed)
+            f.write(values.tobytes())
+
+    def _zone_matrices(self, readings):
+        """(rows, zones) arrays of every zone metric, in order of first appearance"""
+        long = extract_zone_readings(readings.assign(row=np.arange(len(readings))), keys=('row',))
+        zones = list(dict.fromkeys(long['zone']))
+        rows = long['row'].to_numpy()
+        cols = pd.Index(zones).get_indexer(long['zone'])
+
+        matrices = {'zones': zones}
+        for metric in self.meta['zone_metrics']:
+            matrix = np.full((len(readings), len(zones)), np.nan, dtype=np.float32)
+            if metric in long.columns:
+                matrix[rows, cols] = long[metric].to_numpy(dtype=np.float32)
+            matrices[metric] = matrix
+        return matrices
+
+    def _zone_files(self):
+        files = [(f'zone.{metric}', np.float32, np.nan) for metric in self.meta['zone_metrics']]
+        files += [(f'prefix.{key}', np.float64, 0.0) for key in self._prefix_keys() if key.startswith('zone.')]
+        return files
+
+    def _add_zones(self, new_zones):
+        """Widen the zone matrices, padding existing rows with NaN (running totals with 0)
+
+        The wider copies are written under the next zone generation while
+        readers keep using the current files; meta.json then switches zones
+        and generation together. The previous generation is kept for readers
+        still holding the old meta.json, the one before it is removed.
+        """
+        old_width = len(self.meta['zones'])
+        new_width = old_width + len(new_zones)
+        old_generation = self.meta.get('zone_generation')
+        generation = (old_generation if old_generation is not None else -1) + 1
+        for name, dtype, fill in self._zone_files():
+            source = self._map(name, dtype, old_width)
+            with open(self._file(name, generation), 'wb') as f:
+                for begin in range(0, len(self), self.config['chunk_rows']):
+                    rows = source[begin:begin + self.config['chunk_rows']]
+                    widened = np.full((len(rows), new_width), fill, dtype=dtype)
+                    widened[:, :old_width] = rows
+                    f.write(widened.tobytes())
+            del source
+        self.meta['zones'] = self.meta['zones'] + new_zones
+        self.meta['zone_generation'] = generation
+        self._save_meta()
+
+        if old_generation is not None:
+            stale = old_generation - 1
+            for name, _, _ in self._zone_files():
+                path = self._file(name, stale) if stale >= 0 else os.path.join(self.path, f'{name}.bin')
+                if os.path.exists(path):
+                    os.remove(path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Append new readings to the on-disk time-series store")
+    parser.add_argument('--data-folder', default=TIMESERIES_STORE_CONFIG['data_folder'])
+    args = parser.parse_args()
+
+    store = TimeSeriesStore()
+    appended = store.append(load_readings(args.data_folder))
+    print(f"Appended {appended} reading(s); store holds {len(store)} rows for {len(store.zones)} zones")
@@ -0,0 +1,339 @@
+import os
+import re
+import json
+import time
+import shutil
+import argparse
+import multiprocessing
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import pandas as pd
+
+from config import FORECAST_CONFIG, MODEL_CONFIG, TRAINING_CONFIG
+from data_processor import load_readings, extract_zone_readings
+from covariates import default_pipeline
+from model_registry import ModelRegistry
+
+GLOBAL_MODEL_NAME = 'global'
+CHECKPOINT_INFO_FILE = 'checkpoint.json'
+
+
+def checkpoint_path(checkpoint_dir, site):
+    """Directory holding the latest trained model of a site"""
+    return os.path.join(checkpoint_dir, re.sub(r'[^A-Za-z0-9_.-]', '_', str(site)))
+
+
+def series_frames(df, by='site'):
+    """Build one time-ordered feature frame per site or per zone from raw readings
+
+    With a site column, zones are named '<site>.<zone>' and take the
+    occupancy and temperature of their own site's readings.
+    """
+    # External feeds configured in COVARIATE_CONFIG['model_features'] are appended after the features
+    external = default_pipeline()
+    site_column = FORECAST_CONFIG['site_column']
+    if by == 'zone':
+        keys = ['timestamp', site_column] if site_column in df.columns else ['timestamp']
+        zones = extract_zone_readings(df, keys)
+        covariates = df[keys + ['occupancy_level', 'temperature']].drop_duplicates(keys, keep='last')
+        zones = zones.merge(covariates, on=keys, how='left')
+        if site_column in df.columns:
+            zones['zone'] = zones[site_column].astype(str) + '.' + zones['zone'].astype(str)
+        return {
+            zone: external.join(zone_df.sort_values('timestamp').set_index('timestamp')[TRAINING_CONFIG['zone_features']])
+            for zone, zone_df in zones.groupby('zone')
+        }
+
+    groups = df.groupby(site_column) if site_column in df.columns else [(FORECAST_CONFIG['default_site'], df)]
+    return {
+        str(site): external.join(site_df.sort_values('timestamp').set_index('timestamp')[FORECAST_CONFIG['features']])
+        for site, site_df in groups
+    }
+
+
+def _init_worker(threads):
+    """Bound the thread pools of each worker before TensorFlow is imported"""
+    os.environ['OMP_NUM_THREADS'] = str(threads)
+    os.environ['TF_NUM_INTRAOP_THREADS'] = str(threads)
+    os.environ['TF_NUM_INTEROP_THREADS'] = '1'
+    os.environ.setdefault('TF_CPP_MIN_LOG_LEVEL', '2')
+
+    import tensorflow as tf
+    tf.config.threading.set_intra_op_parallelism_threads(threads)
+    tf.config.threading.set_inter_op_parallelism_threads(1)
+
+
+def export_checkpoint(model, path, X_val, config):
+    """Export a checkpoint for NumPy serving, keeping it only if it matches the Keras model"""
+    from lstm_export import EXPORT_FILE, NumpyGlobalLSTMRunner, NumpyLSTMRunner, check_parity, export_model
+
+    export_path = os.path.join(path, EXPORT_FILE)
+    export_model(model, export_path, quantize=config['export_quantization'])
+    runner = NumpyGlobalLSTMRunner(export_path) if hasattr(model, 'scalers') else NumpyLSTMRunner(export_path)
+    parity = check_parity(model, runner, X_val, config['parity_tolerance'])
+    if not parity['passed']:
+        os.remove(export_path)
+    return parity
+
+
+def read_trained_through(path):
+    """Timestamp of the last reading a checkpoint was trained on, or None if it was not recorded"""
+    info_path = os.path.join(path, CHECKPOINT_INFO_FILE)
+    if not os.path.exists(info_path):
+        return None
+    with open(info_path, 'r') as f:
+        return pd.Timestamp(json.load(f)['trained_through'])
+
+
+def save_checkpoint(model, path, config=None, X_check=None, trained_through=None):
+    """Save a model next to its previous checkpoint and swap it in only once complete
+
+    With a training config that has 'export' on, the NumPy export is written
+    (and parity-checked on X_check) as part of the same checkpoint. trained_through, the last
+    reading the model has seen, is kept with it so that evaluations can stay
+    out of sample.
+    """
+    tmp_path, old_path = f'{path}.tmp', f'{path}.old'
+    if os.path.exists(old_path) and not os.path.exists(path):
+        os.replace(old_path, path)  # An earlier save stopped between its two renames
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    model.save(tmp_path)
+    if trained_through is not None:
+        with open(os.path.join(tmp_path, CHECKPOINT_INFO_FILE), 'w') as f:
+            json.dump({'trained_through': trained_through}, f)
+
+    parity = None
+    if config is not None and config['export']:
+        parity = export_checkpoint(model, tmp_path, X_check, config)
+
+    # Renames only, so readers find the old or the new checkpoint; the old one is deleted afterwards
+    shutil.rmtree(old_path, ignore_errors=True)
+    if os.path.exists(path):
+        os.replace(path, old_path)
+    os.replace(tmp_path, path)
+    shutil.rmtree(old_path, ignore_errors=True)
+    return parity
+
+
+def _train_site(site, values, last_observed, model_config, checkpoint_dir, config):
+    """Train and checkpoint one site's model (runs inside a worker process)"""
+    from lstm_model import EnergyLSTM
+
+    started = time.perf_counter()
+    model = EnergyLSTM(model_config)
+    X_train, X_val, y_train, y_val = model.preprocess_data(values)
+    history = model.train(X_train, y_train, X_val, y_val, verbose=0)
+
+    path = checkpoint_path(checkpoint_dir, site)
+    parity = save_checkpoint(model, path, config, X_val, trained_through=last_observed)
+
+    return {
+        'site': site,
+        'path': path,
+        'seconds': time.perf_counter() - started,
+        'epochs': len(history.history['loss']),
+        'val_loss': float(min(history.history['val_loss'])),
+        'parity': parity,
+        'last_observed': last_observed,
+        'finished_at': datetime.now().isoformat()
+    }
+
+
+def _train_global(frames, model_config, checkpoint_dir, config):
+    """Train and checkpoint one GlobalEnergyLSTM on windows pooled from every series"""
+    from lstm_model import GlobalEnergyLSTM
+
+    started = time.perf_counter()
+    model = GlobalEnergyLSTM(model_config)
+    X_train, X_val, y_train, y_val = model.preprocess_series(frames)
+    history = model.train(X_train, y_train, X_val, y_val, verbose=0)
+
+    last_observed = max(frame.index[-1] for frame in frames.values()).isoformat()
+    path = checkpoint_path(checkpoint_dir, GLOBAL_MODEL_NAME)
+    parity = save_checkpoint(model, path, config, X_val, trained_through=last_observed)
+
+    return {
+        'site': GLOBAL_MODEL_NAME,
+        'path': path,
+        'series': len(model.series),
+        'windows': len(X_train) + len(X_val),
+        'seconds': time.perf_counter() - started,
+        'epochs': len(history.history['loss']),
+        'val_loss': float(min(history.history['val_loss'])),
+        'parity': parity,
+        'last_observed': last_observed,
+        'finished_at': datetime.now().isoformat()
+    }
+
+
+class TrainingOrchestrator:
+    """Train one EnergyLSTM per site in a process pool, checkpointing as sites finish
+
+    Progress is recorded in a per-run manifest, so re-running an interrupted
+    run only trains the sites that have not finished yet.
+    """
+
+    def __init__(self, config=None, model_config=None, run_id=None):
+        self.config = config if config is not None else TRAINING_CONFIG
+        self.model_config = model_config if model_config is not None else MODEL_CONFIG
+        self.checkpoint_dir = self.config['checkpoint_dir']
+        self.run_id = run_id if run_id is not None else datetime.now().strftime('%Y-%m-%d')
+        self.manifest_path = os.path.join(self.checkpoint_dir, f'manifest_{self.run_id}.json')
+        os.makedirs(self.checkpoint_dir, exist_ok=True)
+        self.manifest = self._load_manifest()
+        self.registry = ModelRegistry()
+
+    def _load_manifest(self):
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, 'r') as f:
+                return json.load(f)
+        return {'run_id': self.run_id, 'sites': {}}
+
+    def _save_manifest(self):
+        tmp_path = f'{self.manifest_path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.manifest, f, indent=2)
+        os.replace(tmp_path, self.manifest_path)
+
+    def pending(self, frames):
+        """Sites in frames that this run has not finished training yet"""
+        done = self.manifest['sites']
+        return [site for site in frames if done.get(site, {}).get('status') != 'done']
+
+    def _workers(self):
+        threads = self.config['threads_per_worker']
+        max_workers = self.config['max_workers']
+        if max_workers is None:
+            max_workers = max(1, (os.cpu_count() or 1) // threads)
+        return max_workers, threads
+
+    def run(self, frames, progress=None):
+        """Train every pending site in frames and return a timing report
+
+        frames maps a site or zone name to its time-indexed feature frame.
+        progress, if given, is called with (finished, total, result) as each
+        site completes; by default a line is printed per site.
+        """
+        progress = progress if progress is not None else self._print_progress
+        min_length = self.model_config['sequence_length'] + 2
+        sites = [site for site in self.pending(frames) if len(frames[site]) >= min_length]
+        # Longest series first so the slowest fits do not end up in the tail
+        sites.sort(key=lambda site: len(frames[site]), reverse=True)
+
+        max_workers, threads = self._workers()
+        started = time.perf_counter()
+        results, failures = [], {}
+
+        executor = ProcessPoolExecutor(
+            max_workers=min(max_workers, len(sites)) or 1,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker,
+            initargs=(threads,)
+        )
+        try:
+            futures = {
+                executor.submit(
+                    _train_site,
+                    site,
+                    frames[site].to_numpy(dtype=float),
+                    frames[site].index[-1].isoformat(),
+                    self.model_config,
+                    self.checkpoint_dir,
+                    self.config
+                ): site
+                for site in sites
+            }
+            for future in as_completed(futures):
+                site = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    failures[site] = str(e)
+                    self.manifest['sites'][site] = {'status': 'failed', 'site': site, 'error': str(e)}
+                else:
+                    results.append(result)
+                    self.manifest['sites'][site] = dict(result, status='done')
+                    self.registry.record(
+                        site, result['path'], 'full', result['last_observed'],
+                        seconds=result['seconds'], val_loss=result['val_loss']
+                    )
+                self._save_manifest()
+                progress(len(results) + len(failures), len(sites), self.manifest['sites'][site])
+        except KeyboardInterrupt:
+            # Finished sites are already in the manifest; the next run resumes from there
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
+        else:
+            executor.shutdown()
+
+        seconds = [r['seconds'] for r in results]
+        return {
+            'run_id': self.run_id,
+            'trained': len(results),
+            'skipped': len(frames) - len(sites),
+            'failed': failures,
+            'wall_seconds': time.perf_counter() - started,
+            'train_seconds': sum(seconds),
+            'slowest': max(results, key=lambda r: r['seconds'])['site'] if results else None,
+            'workers': max_workers,
+            'threads_per_worker': threads
+        }
+
+    def run_global(self, frames, progress=None):
+        """Train a single GlobalEnergyLSTM over all series instead of one model each
+
+        The fit runs in-process with every core available to TensorFlow.
+        """
+        progress = progress if progress is not None else self._print_progress
+        if self.manifest['sites'].get(GLOBAL_MODEL_NAME, {}).get('status') == 'done':
+            return {'run_id': self.run_id, 'trained': 0, 'skipped': 1, 'failed': {}}
+
+        min_length = self.model_config['sequence_length'] + 2
+        frames = {site: frame for site, frame in frames.items() if len(frame) >= min_length}
+        result = _train_global(frames, self.model_config, self.checkpoint_dir, self.config)
+        self.manifest['sites'][GLOBAL_MODEL_NAME] = dict(result, status='done')
+        self.registry.record(
+            GLOBAL_MODEL_NAME, result['path'], 'full', result['last_observed'],
+            seconds=result['seconds'], val_loss=result['val_loss']
+        )
+        self._save_manifest()
+        progress(1, 1, self.manifest['sites'][GLOBAL_MODEL_NAME])
+
+        return {
+            'run_id': self.run_id,
+            'trained': 1,
+            'skipped': 0,
+            'failed': {},
+            'series': result['series'],
+            'wall_seconds': result['seconds'],
+            'train_seconds': result['seconds']
+        }
+
+    @staticmethod
+    def _print_progress(finished, total, entry):
+        if entry['status'] == 'done':
+            print(f"[{finished}/{total}] {entry['site']} trained in {entry['seconds']:.1f}s "
+                  f"({entry['epochs']} epochs, val_loss={entry['val_loss']:.4f})")
+        else:
+            print(f"[{finished}/{total}] {entry['site']} failed: {entry['error']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train one EnergyLSTM per site or zone")
+    parser.add_argument('--by', choices=['site', 'zone'], default='site')
+    parser.add_argument('--run-id', help="Resume this run instead of starting today's")
+    parser.add_argument('--global-model', action='store_true',
+                        help="Train one GlobalEnergyLSTM over all series instead of one per series")
+    args = parser.parse_args()
+
+    orchestrator = TrainingOrchestrator(run_id=args.run_id)
+    readings = load_readings(FORECAST_CONFIG['data_folder'])
+    frames = series_frames(readings, by=args.by)
+    if args.global_model:
+        report = orchestrator.run_global(frames)
+        print(f"Global model: trained {report['trained']}, skipped {report['skipped']}")
+    else:
+        report = orchestrator.run(frames)
+        print(f"Trained {report['trained']} model(s), skipped {report['skipped']}, "
+              f"failed {len(report['failed'])} in {report['wall_seconds']:.1f}s wall "
+              f"({report['train_seconds']:.1f}s of training across {report['workers']} workers)")
@@ -1,7 +1,8 @@
 import plotly.graph_objects as go
 import plotly.express as px
-import pandas as pd
-import numpy as np
+
+from calendar_features import DAY_NAMES
+from heatmap_cube import HeatmapCube
 
 class VisualizationHelper:
     def __init__(self, theme_colors):
@@ -31,18 +32,13 @@ class VisualizationHelper:
     
     def create_heatmap(self, df):
         """Create hourly consumption heatmap"""
-        # Pivot data for heatmap
-        heatmap_data = df.pivot_table(
-            values='total_consumption',
-            index=df['timestamp'].dt.day_name(),
-            columns=df['timestamp'].dt.hour,
-            aggfunc='mean'
-        )
+        # Hour-of-week means from a cube of the readings
+        heatmap_data = HeatmapCube.from_frame(df).means()
         
         fig = go.Figure(data=go.Heatmap(
-            z=heatmap_data.values,
-            x=heatmap_data.columns,
-            y=heatmap_data.index,
+            z=heatmap_data,
+            x=list(range(24)),
+            y=list(DAY_NAMES),
             colorscale='Blues',
             hoverongaps=False
         ))